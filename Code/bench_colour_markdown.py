@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Benchmarks the colour_markdown extension against the original regex pipeline used by EmailText.convert_to_html,
+checking the two produce identical HTML on large generated templates."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import re
+import random
+import argparse
+import timeit
+import markdown
+from colour_markdown import ColourExtension
+
+## Variables ##
+colours = ['red', 'blue', 'green', 'purple', 'orange']
+words = ['casting', 'actor', 'agency', 'brief', 'role', 'shoot', 'self', 'tape', 'London', 'schedule', 'fee', 'usage']
+
+
+## Functions ##
+def regex_convert_to_html(text):
+    """Original EmailText.convert_to_html pipeline (pre-substitution, markdown, then three regex passes).
+    """
+    col_head_pattern = r'\[(\w+)\]\{([\#+|\*][^*]+?)\}'
+    _raw_txt = re.sub(col_head_pattern, r'\2$\1$', text)
+
+    html_txt = markdown.markdown(_raw_txt)
+
+    rm = {r'(\<\w+)(\>.+)\$(.+)\$(.+\>)': r'\1 style="color:\3;"\2\4',
+          r'\[(\w+)\]\{([\s\S]+?)\}': r'<span style="color: \1">\2</span>',
+          r'(\<span[\S\s]+?)\<\/p\>\n\<p\>(.+?\<\/span\>)': r'\1<br><br>\2'
+          }
+
+    for frm, to in rm.items():
+        html_txt = re.sub(frm, to, html_txt, flags=re.MULTILINE)
+
+    return html_txt
+
+
+def extension_convert_to_html(text):
+    """Current EmailText.convert_to_html pipeline (single markdown pass with ColourExtension).
+    """
+    return markdown.markdown(text, extensions=[ColourExtension()])
+
+
+def sentence(rng, n=12):
+    """Random sentence of n words.
+    """
+    return ' '.join(rng.choice(words) for _ in range(n)).capitalize()
+
+
+def generate_template(sections, shape='mixed', seed=0):
+    """Generates a template of the given number of sections. 'mixed' sections use every piece of the coloured text
+    syntax; 'spans' sections are a heading followed by a paragraph of coloured body text.
+    """
+    rng = random.Random(seed)
+    out = []
+
+    for _ in range(sections):
+        if shape == 'spans':
+            out.append(f"# {sentence(rng, 4)}")
+            out.append(f"{sentence(rng)} [{rng.choice(colours)}]{{{sentence(rng)}}} {sentence(rng)}.")
+            continue
+
+        out.append(f"[{rng.choice(colours)}]{{{'#' * rng.randint(1, 3)} {sentence(rng, 5)}}}")
+        out.append(f"Dear $N, {sentence(rng)} [{rng.choice(colours)}]{{**{sentence(rng, 2)}** {sentence(rng)}}} "
+                   f"{sentence(rng)}.")
+        out.append('\n'.join([f"* [{rng.choice(colours)}]{{* {sentence(rng, 6)}}}", f"* {sentence(rng, 6)}"]))
+        out.append(f"[{rng.choice(colours)}]{{{sentence(rng)}\n\n{sentence(rng)}}} {sentence(rng, 4)}.")
+        out.append(f"# {sentence(rng, 4)}")
+
+    return '\n\n'.join(out) + '\n'
+
+
+def main(sizes, shape, repeat):
+    """Times both pipelines on templates of each size and reports whether their output matches.
+    """
+    print(f"{'SECTIONS':>10}{'CHARS':>10}{'REGEX (s)':>12}{'EXTENSION (s)':>15}{'IDENTICAL':>11}")
+
+    for size in sizes:
+        text = generate_template(size, shape)
+        identical = regex_convert_to_html(text) == extension_convert_to_html(text)
+        t_regex = min(timeit.repeat(lambda: regex_convert_to_html(text), number=1, repeat=repeat))
+        t_ext = min(timeit.repeat(lambda: extension_convert_to_html(text), number=1, repeat=repeat))
+        print(f"{size:>10}{len(text):>10}{t_regex:>12.4f}{t_ext:>15.4f}{str(identical):>11}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks coloured markdown rendering of email templates.")
+    parser.add_argument('-s', dest='sizes', type=int, nargs='+', default=[10, 100, 500],
+                        help='Template sizes (number of generated sections) to benchmark.')
+    parser.add_argument('-t', dest='shape', default='mixed', choices=['mixed', 'spans'],
+                        help="Shape of generated template sections.")
+    parser.add_argument('-r', dest='repeat', type=int, default=5, help='Repeats per size (best time is reported).')
+    args = parser.parse_args()
+
+    main(args.sizes, args.shape, args.repeat)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""Benchmarks contact_extract.ContactExtractor on a generated corpus of inbox replies (plain text and HTML-only,
+with varying sets of fields), against running one pattern per field over each body, and checks what it extracts
+against the details each reply was generated with."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import re
+import time
+import random
+import argparse
+from contact_extract import ContactExtractor, default_fields, html_to_text
+
+## Variables ##
+first_names = ['Amy', 'Ben', 'Chloe', 'Dev', 'Ella', 'Femi', 'Grace', 'Harry', 'Isla', "Jack", 'Kiran', 'Zoe']
+last_names = ['Smith', "O'Neil", 'Jones', 'Patel', 'Okafor', 'Brown-Lee', 'Taylor', 'Nguyen', 'Evans']
+agencies = ['Spotlight Talent', 'Bright & Co', 'Northern Actors', 'The Casting Room']
+filler = ['Thanks so much for getting in touch.', 'I would love to audition for the role.',
+          'Please find my self tape attached.', 'I am available for the shoot dates in London.',
+          'Let me know if you need anything else.', 'Best wishes,']
+separators = [': ', ':', ' ', ':\n', ': \r\n']  # label and value on one line, or the value on the next
+signatures = ['--\nThe Casting Room\nTEL: 020 7946 0000', 'Sent from my phone\nMOBILE: 07700 900 000']
+
+
+## Functions ##
+def generate_reply(rng):
+    """Generates one reply body, returning (body, is_html, {field: value}).
+    """
+    details = {'Name': f'{rng.choice(first_names)} {rng.choice(last_names)}',
+               'Phone Number': f'07{rng.randrange(10 ** 9):09d}'}
+    if rng.random() < 0.5:
+        details['Email'] = f"{details['Name'].split()[0].lower()}{rng.randrange(100)}@example.com"
+    if rng.random() < 0.4:
+        details['Age'] = str(rng.randint(16, 70))
+    if rng.random() < 0.3:
+        details['Agent'] = rng.choice(agencies)
+
+    labels = {'Name': 'NAME', 'Phone Number': 'PHONE', 'Email': 'EMAIL', 'Age': 'AGE', 'Agent': 'AGENT'}
+    sep = rng.choice(separators)
+    lines = [f"{labels[field]}{sep}{value[:5] + ' ' + value[5:] if field == 'Phone Number' else value}"
+             for field, value in details.items()]
+    text = [rng.choice(filler) for _ in range(rng.randint(2, 6))]
+    text[1:1] = lines
+    if rng.random() < 0.2:
+        text.append(rng.choice(signatures))  # a phone number that isn't the applicant's
+
+    if rng.random() < 0.2:
+        body = '<html><body>' + ''.join(f'<p>{line.replace("&", "&amp;")}</p>' for line in text) + '</body></html>'
+        return body, True, details
+
+    return 'Hi,\n\n' + '\n'.join(text) + '\n', False, details
+
+
+def generate_corpus(n, seed=0):
+    """List of n generated replies.
+    """
+    rng = random.Random(seed)
+    return [generate_reply(rng) for _ in range(n)]
+
+
+def multi_pass(corpus):
+    """One regex per field, each run over the whole of every body.
+    """
+    labels = sorted((label for label, _ in default_fields.values()), key=len, reverse=True)
+    stop = r'(?!\s+(?:%s)\b)' % '|'.join(labels)
+    not_label = r'(?!(?:%s)\b)' % '|'.join(labels)
+    patterns = {field: re.compile(rf'\b{label}\b:?\s*{not_label}({value % {"stop": stop}})')
+                for field, (label, value) in default_fields.items()}
+
+    out = []
+    for body, is_html, _ in corpus:
+        text = html_to_text(body) if is_html else body
+        out.append({field: m.group(1).strip() for field, pattern in patterns.items() if (m := pattern.search(text))})
+
+    return out
+
+
+def single_pass(corpus, extractor):
+    """One ContactExtractor scan over every body.
+    """
+    out = []
+    for body, is_html, _ in corpus:
+        text = html_to_text(body) if is_html else body
+        out.append({field: value for record in extractor.records(text) for field, value in record.items()})
+
+    return out
+
+
+def main(n, seed):
+    """Times both approaches on a corpus of n replies and reports throughput, accuracy and per-field hit rates.
+    """
+    corpus = generate_corpus(n, seed)
+    size = sum(len(body) for body, _, _ in corpus) / 1e6
+    print(f"{n} replies ({sum(is_html for _, is_html, _ in corpus)} HTML-only), {size:.1f} MB\n")
+
+    start = time.perf_counter()
+    multi = multi_pass(corpus)
+    t_multi = time.perf_counter() - start
+
+    extractor = ContactExtractor()
+    start = time.perf_counter()
+    single = single_pass(corpus, extractor)
+    t_single = time.perf_counter() - start
+
+    def correct(results):
+        return sum(r.get(field, '').replace(' ', '') == value.replace(' ', '')
+                   for r, (_, _, details) in zip(results, corpus) for field, value in details.items())
+
+    fields = sum(len(details) for _, _, details in corpus)
+    print(f"{'':<14}{'TIME (s)':>10}{'REPLIES/s':>12}{'MB/s':>8}{'FIELDS CORRECT':>17}")
+    for name, t, results in [('Per field', t_multi, multi), ('Single pass', t_single, single)]:
+        print(f"{name:<14}{t:>10.3f}{n / t:>12.0f}{size / t:>8.1f}{correct(results):>10}/{fields}")
+
+    print("\nHit rates: " + ', '.join(f"{field} {rate:.1%}" for field, rate in extractor.hit_rates().items()))
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks contact extraction from inbox replies.")
+    parser.add_argument('-n', dest='n', type=int, default=100000, help='Number of replies to generate.')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='Random seed for the corpus.')
+    args = parser.parse_args()
+
+    main(args.n, args.seed)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""Python-Markdown extension for the coloured text syntax used in email templates.
+
+    [colour]{# Heading}      ->  <h1 style="color:colour;">Heading</h1>
+    [colour]{* Bullet}       ->  <li style="color:colour;">Bullet</li>
+    [colour]{Body text}      ->  <span style="color: colour">Body text</span>
+
+Coloured body text may run over several paragraphs, in which case the paragraphs are joined with '<br><br>'.
+"""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import re
+import xml.etree.ElementTree as etree
+from markdown.extensions import Extension
+from markdown.blockprocessors import BlockProcessor
+from markdown.inlinepatterns import InlineProcessor
+from markdown.treeprocessors import Treeprocessor
+
+## Variables ##
+COLOUR_BLOCK_RE = re.compile(r'\[(\w+)\]\{([\#+|\*][^*]+?)\}')  # coloured headings/bullets
+COLOUR_OPEN_RE = re.compile(r'\[\w+\]\{[^}]*\Z')  # coloured body text left open at the end of a block
+COLOUR_SPAN_PATTERN = r'\[(\w+)\]\{(.+?)\}'  # coloured body text
+MARKER_RE = re.compile('\ue000(\\w+)\ue001')  # colour marker left on a block by ColourBlockProcessor
+
+
+## Classes ##
+class ColourBlockProcessor(BlockProcessor):
+    """Unwraps coloured headings/bullets so the standard block processors can parse them, leaving a colour marker at
+    the end of the content for ColourTreeprocessor to turn into a style attribute.
+    """
+
+    def test(self, parent, block):
+        return bool(COLOUR_BLOCK_RE.search(block))
+
+    def run(self, parent, blocks):
+        blocks[0] = COLOUR_BLOCK_RE.sub('\\2\ue000\\1\ue001', blocks[0])
+
+
+class ColourSpanBlockProcessor(BlockProcessor):
+    """Joins paragraphs covered by a single piece of coloured body text into one block, separated by a stashed
+    '<br><br>'.
+    """
+
+    def test(self, parent, block):
+        return bool(COLOUR_OPEN_RE.search(block))
+
+    def run(self, parent, blocks):
+        end = next((i for i, block in enumerate(blocks[1:], 1) if '}' in block), None)
+
+        if end is None:
+            return False  # never closed, so leave to the other processors
+
+        br = self.parser.md.htmlStash.store('<br><br>')
+        blocks[:end + 1] = [br.join(blocks[:end + 1])]
+
+
+class ColourInlineProcessor(InlineProcessor):
+    """Translates coloured body text to an HTML span.
+    """
+
+    def handleMatch(self, m, data):
+        el = etree.Element('span')
+        el.set('style', f'color: {m.group(1)}')
+        el.text = m.group(2)
+
+        return el, m.start(0), m.end(0)
+
+
+class ColourTreeprocessor(Treeprocessor):
+    """Moves colour markers left by ColourBlockProcessor onto the enclosing element as a style attribute.
+    """
+
+    def run(self, root):
+        for el in root.iter():
+            if el.text and '\ue000' in el.text:
+                colour = MARKER_RE.findall(el.text)[-1]
+                el.text = MARKER_RE.sub('', el.text)
+                el.set('style', f'color:{colour};')
+
+
+class ColourExtension(Extension):
+    """Adds the coloured text syntax to Markdown.
+    """
+
+    def extendMarkdown(self, md):
+        # After indented code (80) so code blocks are left alone, before headers/lists/paragraphs
+        md.parser.blockprocessors.register(ColourBlockProcessor(md.parser), 'colour_block', 76)
+        md.parser.blockprocessors.register(ColourSpanBlockProcessor(md.parser), 'colour_span_block', 75)
+        # After code spans and escapes, before links, so nested markdown is still rendered inside the span
+        md.inlinePatterns.register(ColourInlineProcessor(COLOUR_SPAN_PATTERN, md), 'colour_span', 175)
+        # Before inline parsing, while the markers are still in the block text
+        md.treeprocessors.register(ColourTreeprocessor(md), 'colour', 25)
+
+
+def makeExtension(**kwargs):
+    return ColourExtension(**kwargs)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""Single-pass extraction of applicant details (name, phone number, email, age, agent...) from the text of inbox
+replies, with a cheap tag-stripping conversion for HTML-only replies."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import re
+import html
+from collections import Counter
+
+## Variables ##
+# Field name -> (label, value) patterns. Replies are asked to give their details under these (upper case) labels,
+# e.g. 'NAME: Jo Bloggs'. In a value pattern, %(stop)s marks where a run of words must end if the next word is another
+# field's label, so 'NAME: Jo Bloggs PHONE: 07...' on one line still gives the name 'Jo Bloggs'. A value may also be on
+# the line after its label ('NAME:\nJo Bloggs').
+default_fields = {
+    'Name': (r'NAME', r"[A-Za-z](?:%(stop)s[A-Za-z ,.'-])*"),
+    'Phone Number': (r'(?:PHONE|MOBILE|TEL)', r'\+?\d(?:[ ()-]*\d)*'),
+    'Email': (r'E-?MAIL', r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'),
+    'Age': (r'AGE', r'\d{1,3}(?!\d)'),
+    'Agent': (r'AGEN(?:T|CY)', r"[\w&](?:%(stop)s[\w &,.'-])*"),
+}
+
+# HTML to text: script/style elements are dropped, line breaks and block ends become newlines, other tags are removed
+html_drop_re = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+html_break_re = re.compile(r'<br\b[^>]*>|</(?:p|div|li|tr|h[1-6]|table|blockquote)\s*>', re.IGNORECASE)
+html_tag_re = re.compile(r'<[^>]*>')
+space_re = re.compile(r'[ \t\xa0]+')
+
+# A record is only kept if it has a name and at least one way of contacting them (so a 'TEL: ...' in an email
+# signature on its own is not taken for an applicant)
+required_fields = ['Name']
+contact_fields = ['Phone Number', 'Email']
+
+
+## Classes ##
+class ContactExtractor:
+    """Compiles the patterns of all fields into one scanner, so each body is read in a single left-to-right pass
+    however many fields there are (rather than one pass per pattern). Fields are pluggable: pass a dict like
+    default_fields, or add to one with register(). Keeps count of how many bodies each field was found in.
+    """
+
+    def __init__(self, fields: dict = None):
+        self.fields = dict(default_fields if fields is None else fields)
+        self.scanned = 0
+        self.hits = Counter()
+        self._compile()
+
+    def register(self, field: str, label: str, value: str):
+        """Adds (or replaces) a field: 'label' and 'value' are regex patterns as in default_fields.
+        """
+        self.fields[field] = (label, value)
+        self._compile()
+
+    def _compile(self):
+        # Longest labels first, so e.g. AGENT is not taken for AGE
+        labels = sorted((label for label, _ in self.fields.values()), key=len, reverse=True)
+        stop = r'(?!\s+(?:%s)\b)' % '|'.join(labels)
+        not_label = r'(?!(?:%s)\b)' % '|'.join(labels)  # an empty value is not followed by the next field's label
+
+        self._groups = {}  # regex group name -> field name
+        branches = []
+        for i, (field, (label, value)) in enumerate(self.fields.items()):
+            self._groups[f'f{i}'] = field
+            branches.append(rf'{label}\b:?\s*{not_label}(?P<f{i}>{value % {"stop": stop}})')
+
+        self._scanner = re.compile('|'.join(branches))
+
+    def scan(self, text: str):
+        """Yields (field, value) for each field found in the text, in the order they appear.
+        """
+        found = set()
+        for m in self._scanner.finditer(text):
+            if m.start() and text[m.start() - 1].isalnum():
+                continue  # label is the end of a longer word, e.g. FILENAME
+
+            field = self._groups[m.lastgroup]
+            found.add(field)
+            yield field, m.group(m.lastgroup).strip()
+
+        self.scanned += 1
+        self.hits.update(found)
+
+    def records(self, text: str):
+        """Yields a dict of {field: value} for each set of details in the text. A field appearing a second time starts
+        a new record, so a reply listing several people gives one record per person. Only complete records are yielded
+        (see complete()).
+        """
+        record = {}
+        for field, value in self.scan(text):
+            if field in record:
+                if self.complete(record):
+                    yield record
+                record = {}
+            record[field] = value
+
+        if self.complete(record):
+            yield record
+
+    def complete(self, record: dict) -> bool:
+        """Whether a record has every one of required_fields and at least one of contact_fields (of those fields this
+        extractor has).
+        """
+        contacts = [field for field in contact_fields if field in self.fields]
+        return (all(record.get(field) for field in required_fields if field in self.fields)
+                and (not contacts or any(record.get(field) for field in contacts)))
+
+    def hit_rates(self) -> dict:
+        """Fraction of the bodies scanned so far in which each field was found.
+        """
+        return {field: self.hits[field] / self.scanned if self.scanned else 0.0 for field in self.fields}
+
+
+## Functions ##
+def html_to_text(markup: str) -> str:
+    """Converts an HTML body to plain text with a few regex passes (no DOM is built): drops scripts, styles and
+    comments, turns line breaks and the ends of block elements into newlines, strips the remaining tags and unescapes
+    entities.
+    """
+    text = html_drop_re.sub('', markup)
+    text = html_break_re.sub('\n', text)
+    text = html.unescape(html_tag_re.sub('', text))
+
+    return space_re.sub(' ', text)
+
+
+def normalise_phone(number: str) -> str:
+    """Strips spaces, brackets and dashes from a phone number.
+    """
+    return re.sub(r'[ ()-]', '', number)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""Merges the contacts scraped from Spotlight, Starnow and inbox replies into one table: names, phone numbers and
+email addresses are normalised across sources, and records of the same person are linked (entity resolution), with
+each merged contact keeping links back to the rows it came from."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import sys
+import argparse
+import difflib
+import numpy as np
+import pandas as pd
+from table_io import open_sink, ExcelSink, read_table
+
+## Variables ##
+# Column name in each scraper's output -> column in the merged table
+column_names = {'NAME': 'name', 'Name': 'name',
+                'AGENT': 'agent', 'Agent': 'agent',
+                'CONTACT NUMBER': 'phone', 'Phone Number': 'phone',
+                'EMAIL': 'email', 'Email': 'email',
+                'AGE': 'age', 'Age': 'age',
+                'NATIONAL TEAM': 'team',
+                'SHORTLIST': 'list'}
+fields = ['name', 'agent', 'phone', 'email', 'age', 'team']
+
+# Soundex digit for each letter (vowels, y: '0', which separates repeated digits; h, w: dropped), and for the first
+# letter, which is kept as it is, so only needs a digit to stand in for it (h, w: '0' rather than dropped)
+soundex_table = str.maketrans({**{c: '0' for c in 'aeiouy'}, **{c: None for c in 'hw'},
+                               **{c: d for d, cs in enumerate(['bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'], 1)
+                                  for c in cs for d in [str(d)]}})
+soundex_first_table = {**soundex_table, ord('h'): '0', ord('w'): '0'}
+
+
+## Functions ##
+def source_of(df: pd.DataFrame) -> str:
+    """Which scraper a table came from, going by its columns.
+    """
+    if 'Phone Number' in df.columns:
+        return 'email'
+    if 'NATIONAL TEAM' in df.columns or ('EMAIL' in df and (df['EMAIL'] == 'STARNOW').any()):
+        return 'starnow'
+    return 'spotlight'
+
+
+def read_source(path: str) -> pd.DataFrame:
+    """Reads a scraper's output (CSV, Parquet or Excel, every sheet) into the merged table's columns, plus 'source'
+    (which scraper) and 'ref' (file, sheet and row the record is on, as a link back to it).
+    """
+    name = os.path.basename(path)
+    if path.endswith('.csv'):
+        sheets = {None: read_table(path, dtype=str, keep_default_na=False)}
+    elif path.endswith('.parquet'):
+        sheets = {None: read_table(path)}
+    else:
+        sheets = read_table(path, sheet_name=None, dtype=str, keep_default_na=False)
+
+    frames = []
+    for sheet, df in sheets.items():
+        header_row = 2 if path.endswith(('.xlsx', '.xls', '.csv')) else 0  # row numbers as seen in a spreadsheet
+        out = df.rename(columns=column_names).reindex(columns=fields + ['list'])
+        out['list'] = out['list'].fillna(sheet or name)
+        out['source'] = source_of(df)
+        out['ref'] = (f'{name}!{sheet}:' if sheet else f'{name}:') + pd.Series(np.arange(len(df)) + header_row,
+                                                                               index=df.index).astype(str)
+        frames.append(out)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_store(path: str) -> pd.DataFrame:
+    """Reads the contact store (see contact_store) into the merged table's columns, with 'ref' linking to its rows.
+    """
+    import sqlite3
+
+    with sqlite3.connect(path) as conn:
+        df = pd.read_sql_query("SELECT id, source, list, name, agent, phone, email, age FROM contacts", conn)
+
+    df['team'] = None
+    df['ref'] = 'contacts:' + df.pop('id').astype(str)
+    return df
+
+
+def normalise(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds the keys records are matched on, computed column-wise (no per-row Python):
+    'name_key' - lower case ASCII letters and single spaces ('Chloë O'Neil-Smith' -> 'chloe oneil smith');
+    'phone_key' - digits only, with UK numbers in national format (as contact_store.phone_key);
+    'email_key' - lower case address, or '' if the value isn't one ('STARNOW');
+    'sound_key' - first initial and Soundex code of the surname ('Jon Smyth' and 'John Smith' -> 'j S530').
+    """
+    df = df.copy()
+
+    name = df['name'].fillna('').astype(str)
+    name = name.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.lower()
+    name = name.str.replace(r"['.]", '', regex=True).str.replace(r'[^a-z]+', ' ', regex=True).str.strip()
+    df['name_key'] = name
+
+    digits = df['phone'].fillna('').astype(str).str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True)
+    digits = digits.where(~digits.str.startswith('00'), digits.str[2:])
+    df['phone_key'] = np.select([digits.str.startswith('440'),
+                                 digits.str.startswith('44') & (digits.str.len() == 12),
+                                 digits.str.startswith('7') & (digits.str.len() == 10)],  # leading 0 lost in Excel
+                                [digits.str[2:], '0' + digits.str[2:], '0' + digits],
+                                digits)
+
+    email = df['email'].fillna('').astype(str).str.strip().str.lower().str.replace(r'^mailto:', '', regex=True)
+    df['email_key'] = email.where(email.str.contains('@', regex=False), '')
+
+    surname = name.str.rsplit(' ', n=1).str[-1].fillna('')
+    code = surname.str[:1].str.translate(soundex_first_table) + surname.str[1:].str.translate(soundex_table)
+    code = code.str.replace(r'(\d)\1+', r'\1', regex=True)
+    code = code.str[1:].str.replace('0', '', regex=False).str.pad(3, side='right', fillchar='0').str[:3]
+    df['sound_key'] = (name.str[:1] + ' ' + surname.str[:1].str.upper() + code).where(surname != '', '')
+
+    return df
+
+
+def candidate_pairs(df: pd.DataFrame, key: str, window: int = 20) -> pd.DataFrame:
+    """Pairs of records (columns 'a' and 'b', positions in df) sharing a value of 'key' (blocking). A block of up to
+    window + 1 records gives every pair in it; in bigger blocks (e.g. the hundreds of actors behind one agency's phone
+    number) records are sorted by name and each is paired only with the next 'window' (sorted neighbourhood), so the
+    number of pairs grows linearly with the number of records, not with its square.
+    """
+    block = df[key].to_numpy()
+    order = np.lexsort((df['name_key'].to_numpy(), block))
+    order = order[block[order] != '']
+    sorted_block = block[order]
+
+    pairs = []
+    for k in range(1, window + 1):
+        same = sorted_block[k:] == sorted_block[:-k]
+        if not same.any():
+            break
+        pairs.append(np.column_stack([order[:-k][same], order[k:][same]]))
+
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=int)
+    return pd.DataFrame(np.sort(pairs, axis=1), columns=['a', 'b'])
+
+
+def name_similarity(names: pd.Series, a: np.ndarray, b: np.ndarray, threshold: np.ndarray) -> np.ndarray:
+    """Similarity (difflib ratio, 0 to 1) of the normalised names at positions 'a' and 'b' of 'names', for each pair
+    that could reach its 'threshold' (0 for the rest). Upper bounds on the ratio are worked out for every pair at
+    once from the names' lengths and letter counts (as SequenceMatcher.real_quick_ratio and quick_ratio), so the
+    costly comparison is only made for the few pairs that might match.
+    """
+    lengths = names.str.len().to_numpy()
+    letters = np.column_stack([names.str.count(c).to_numpy() for c in 'abcdefghijklmnopqrstuvwxyz '])
+    names = names.to_numpy()
+
+    total = lengths[a] + lengths[b]
+    bound = 2 * np.minimum(lengths[a], lengths[b]) / np.maximum(total, 1)
+    check = bound >= threshold
+    bound[check] = 2 * np.minimum(letters[a[check]], letters[b[check]]).sum(axis=1) / np.maximum(total[check], 1)
+    check &= bound >= threshold
+
+    scores = np.zeros(len(a))
+    equal = names[a] == names[b]
+    scores[equal] = 1
+    check &= ~equal
+    scores[check] = [difflib.SequenceMatcher(None, x, y).ratio() for x, y in zip(names[a[check]], names[b[check]])]
+
+    return scores
+
+
+def resolve(df: pd.DataFrame, contact_threshold: float = 0.8, name_threshold: float = 0.92,
+            window: int = 20) -> np.ndarray:
+    """Entity resolution over normalised records (see normalise): returns a contact ID for each record, equal for
+    records judged to be the same person. Only records sharing a phone number, email address or sound key are compared
+    (see candidate_pairs). Records sharing a phone number or email address match if their names are at least
+    'contact_threshold' similar (numbers and addresses are often an agency's, shared by many actors). Records only
+    sharing a sound key need 'name_threshold', and aren't joined if the records already linked to each have only
+    different phone numbers or email addresses of the same kind (Spotlight's are the agency's, the others' the actor's
+    own), so two same-named people aren't chained together through a third record.
+    """
+    pairs = pd.concat([candidate_pairs(df, key, window).assign(contact=key != 'sound_key')
+                       for key in ['phone_key', 'email_key', 'sound_key']], ignore_index=True)
+    pairs = pairs.sort_values('contact').drop_duplicates(['a', 'b'], keep='last')
+    a, b, contact = pairs['a'].to_numpy(), pairs['b'].to_numpy(), pairs['contact'].to_numpy()
+
+    similarity = name_similarity(df['name_key'], a, b, np.where(contact, contact_threshold, name_threshold))
+    matched = similarity >= np.where(contact, contact_threshold, name_threshold)
+
+    # Contact details of each kind ('agency'/'own' phone/email) of each record, as its cluster's to start with
+    agency = (df['source'] == 'spotlight').to_numpy()
+    details = [{} for _ in range(len(df))]
+    for key in ['phone_key', 'email_key']:
+        for i, value in enumerate(df[key].tolist()):
+            if value:
+                details[i][(key, agency[i])] = {value}
+
+    def conflict(ri, rj):
+        # Both clusters have numbers/addresses of the same kind, but none in common
+        return any(kind in details[rj] and not values & details[rj][kind] for kind, values in details[ri].items())
+
+    # Clusters of matched records (union-find with path halving): pairs sharing a number or address are joined
+    # first, then pairs with only similar names, most similar first, unless their clusters' details conflict
+    parent = list(range(len(df)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    order = np.lexsort((-similarity, ~contact))
+    order = order[matched[order]]
+    for i, j, by_contact in zip(a[order].tolist(), b[order].tolist(), contact[order].tolist()):
+        ri, rj = find(i), find(j)
+        if ri == rj or (not by_contact and conflict(ri, rj)):
+            continue
+        ri, rj = min(ri, rj), max(ri, rj)
+        parent[rj] = ri
+        for kind, values in details[rj].items():
+            details[ri].setdefault(kind, set()).update(values)
+
+    return pd.factorize(np.array([find(i) for i in range(len(df))]))[0] + 1
+
+
+def merge(records: pd.DataFrame, **kwargs) -> (pd.DataFrame, pd.DataFrame):
+    """Resolves records from any mix of sources (see read_source) into one row per person. Returns (contacts, links):
+    'contacts' has each person's most complete details, the sources they were found in and the rows they came from
+    ('REFS'); 'links' has every record's row reference with the contact ID it was merged into. Keyword arguments are
+    passed to resolve.
+    """
+    df = records.reset_index(drop=True)
+    df = normalise(df.assign(**{c: None for c in fields + ['source', 'list', 'ref'] if c not in df.columns}))
+    df['id'] = resolve(df, **kwargs)
+
+    # Most common non-empty value of each field per contact (first seen on ties), with normalised numbers and addresses,
+    # and the actor's own number and address over their agency's (Spotlight's)
+    df['own'] = df['source'] != 'spotlight'
+    details = {}
+    for column, key in zip(fields, ['name', 'agent', 'phone_key', 'email_key', 'age', 'team']):
+        values = df[['id', 'own', key]].replace('', np.nan).dropna()
+        values = values.assign(n=values.groupby(['id', key])[key].transform('size'))
+        order = ['own', 'n'] if column in ('phone', 'email') else ['n']
+        details[column] = values.sort_values(order, ascending=False, kind='stable').groupby('id')[key].first()
+
+    groups = df.groupby('id')
+    contacts = pd.DataFrame(details).reindex(groups.size().index)
+    sources = df.drop_duplicates(['id', 'source'])
+    contacts['sources'] = (sources['source'] + ', ').groupby(sources['id']).sum().str[:-2]
+    contacts['records'] = groups.size()
+    contacts['refs'] = (df['ref'] + '; ').groupby(df['id']).sum().str[:-2]
+
+    contacts = contacts.reset_index().rename(columns=str.upper).rename(columns={'PHONE': 'CONTACT NUMBER'})
+    links = df[['id', 'source', 'list', 'ref', 'name', 'phone', 'email']].rename(columns=str.upper)
+
+    return contacts, links
+
+
+def main(inputs: list, output: str, store: str = None, contact_threshold: float = 0.8, name_threshold: float = 0.92,
+         window: int = 20):
+    """Merges the scraper outputs 'inputs' (and the contact store at 'store', if given) into one contact table, saved
+    to 'output': an Excel file with a Links sheet mapping every source row to its contact, or a CSV or Parquet file.
+    """
+    frames = [read_source(path) for path in inputs]
+    if store:
+        frames.append(read_store(store))
+    if not frames:
+        sys.exit("Nothing to merge.")
+
+    records = pd.concat(frames, ignore_index=True)
+    contacts, links = merge(records, contact_threshold=contact_threshold, name_threshold=name_threshold,
+                            window=window)
+    print(f"{len(records)} records from {len(frames)} source(s) merged into {len(contacts)} contacts.")
+
+    if output.endswith(('.csv', '.parquet')):
+        with open_sink(output, list(contacts.columns)) as out:
+            out.extend(contacts.itertuples(index=False))
+    else:
+        with ExcelSink(output) as book:
+            for name, table in [('Contacts', contacts), ('Links', links)]:
+                book.sheet(name, list(table.columns)).extend(table.itertuples(index=False))
+
+    print(f"Saved to {output}.")
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merges contacts scraped from Spotlight, Starnow and inbox replies, "
+                                                 "linking records of the same person.")
+    parser.add_argument('inputs', nargs='*',
+                        help='Scraper outputs to merge (.xlsx from spotlight_scrape/starnow_scrape, .csv/.parquet '
+                             'from email_scrape).')
+    parser.add_argument('-o', dest='output', required=True,
+                        help='Output path (.xlsx, or .csv/.parquet without the links).')
+    parser.add_argument('--store', dest='store', default=None,
+                        help='Also merge in the contacts in this contact store (the scrapers\' is '
+                             '~/.local/share/casting-webscrape/contacts.sqlite).')
+    parser.add_argument('--contact-threshold', dest='contact_threshold', type=float, default=0.8,
+                        help='Name similarity needed to merge records sharing a phone number or email address.')
+    parser.add_argument('--name-threshold', dest='name_threshold', type=float, default=0.92,
+                        help='Name similarity needed to merge records sharing only a similar-sounding name.')
+    parser.add_argument('--window', dest='window', type=int, default=20,
+                        help='Number of neighbours each record is compared with in large blocks.')
+    args = parser.parse_args()
+
+    sys.exit(main(args.inputs, args.output, args.store, args.contact_threshold, args.name_threshold, args.window))
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""Contact store shared by the scrapers and send_email: every actor/agent contact scraped, kept in an SQLite database
+indexed on normalised email address and phone number."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import user_dirs
+
+## Variables ##
+store_path = os.path.join(user_dirs.data_dir, 'contacts.sqlite')  # personal details, so not in the repository
+
+schema = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,       -- 'spotlight', 'starnow' or 'email'
+    list TEXT NOT NULL,         -- shortlist, casting or email subject it was scraped from
+    name TEXT NOT NULL,
+    email TEXT,
+    email_key TEXT NOT NULL,    -- normalised email ('' if none)
+    phone TEXT,
+    phone_key TEXT NOT NULL,    -- normalised phone number ('' if none)
+    agent TEXT,
+    age INTEGER,
+    extra TEXT,                 -- any other fields, as JSON
+    first_seen REAL NOT NULL,   -- seconds since epoch
+    last_seen REAL NOT NULL,
+    last_contacted REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS contacts_identity ON contacts (source, list, name, email_key, phone_key);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email_key);
+CREATE INDEX IF NOT EXISTS contacts_phone ON contacts (phone_key);
+CREATE INDEX IF NOT EXISTS contacts_list ON contacts (list, source);
+"""
+
+upsert = """
+INSERT INTO contacts (source, list, name, email, email_key, phone, phone_key, agent, age, extra, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, list, name, email_key, phone_key) DO UPDATE SET
+    email = coalesce(excluded.email, email),
+    phone = coalesce(excluded.phone, phone),
+    agent = coalesce(excluded.agent, agent),
+    age = coalesce(excluded.age, age),
+    extra = coalesce(excluded.extra, extra),
+    last_seen = excluded.last_seen
+"""
+
+
+## Classes ##
+class ContactStore:
+    """Contacts from every scrape, one row per person per list they were scraped from. Added contacts are buffered and
+    upserted in batches (one transaction per batch): a contact scraped again is updated rather than duplicated. Email
+    addresses and phone numbers are stored normalised as well (see email_key and phone_key), and indexed, so contacts
+    can be looked up and matched across lists and scrapers without reading every spreadsheet. Safe to share between
+    scraper threads.
+    """
+
+    def __init__(self, path: str = store_path, batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+
+        self._conn = sqlite3.connect(user_dirs.private_path(path), check_same_thread=False)
+        self._conn.executescript(schema)
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def add(self, source: str, list_name: str, name: str, email: str = None, phone: str = None, agent: str = None,
+            age: int = None, **extra):
+        """Adds a scraped contact (written out once the batch is full). Any other fields are kept as JSON.
+        """
+        now = time.time()
+        row = (source, list_name or '', (name or '').strip(), email or None, email_key(email), phone or None,
+               phone_key(phone), agent or None, age, json.dumps(extra) if extra else None, now, now)
+
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """Writes out any buffered contacts.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            with self._conn:
+                self._conn.executemany(upsert, self._buffer)
+            self._buffer = []
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            self._flush()
+            cursor = self._conn.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def find(self, email: str = None, phone: str = None) -> list:
+        """Contacts (as dicts) with this email address and/or phone number, in any format.
+        """
+        clauses, params = [], []
+        if email:
+            clauses.append("email_key = ?")
+            params.append(email_key(email))
+        if phone:
+            clauses.append("phone_key = ?")
+            params.append(phone_key(phone))
+        if not clauses:
+            return []
+
+        return self._query(f"SELECT * FROM contacts WHERE {' OR '.join(clauses)} ORDER BY id", params)
+
+    def lists(self) -> list:
+        """(source, list, number of contacts) for each list scraped.
+        """
+        with self._lock:
+            self._flush()
+            return self._conn.execute("SELECT source, list, COUNT(*) FROM contacts GROUP BY source, list "
+                                      "ORDER BY MAX(last_seen) DESC").fetchall()
+
+    def recipients(self, list_name: str = None, source: str = None, not_contacted_days: float = None) -> list:
+        """Email recipients for a campaign: (email address, [names]) for each address, optionally only from one list
+        and/or source, and leaving out addresses emailed in the last 'not_contacted_days' days (see mark_contacted).
+        Contacts without an email address are left out.
+        """
+        clauses, params = ["email_key != ''"], []
+        if list_name is not None:
+            clauses.append("list = ?")
+            params.append(list_name)
+        if source is not None:
+            clauses.append("source = ?")
+            params.append(source)
+        if not_contacted_days is not None:
+            clauses.append("email_key NOT IN (SELECT email_key FROM contacts WHERE last_contacted >= ?)")
+            params.append(time.time() - not_contacted_days * 24 * 60 * 60)
+
+        rows = self._query(f"SELECT email, email_key, name FROM contacts WHERE {' AND '.join(clauses)} "
+                           f"ORDER BY email_key, id", params)
+
+        groups = {}
+        for row in rows:
+            address, names = groups.setdefault(row['email_key'], (row['email'].strip(), []))
+            if row['name'] not in names:
+                names.append(row['name'])
+
+        return list(groups.values())
+
+    def mark_contacted(self, emails: list, when: float = None):
+        """Records that these addresses have just been emailed (on every contact with them, in every list).
+        """
+        when = when or time.time()
+
+        with self._lock:
+            self._flush()
+            with self._conn:
+                self._conn.executemany("UPDATE contacts SET last_contacted = ? WHERE email_key = ?",
+                                       [(when, key) for key in map(email_key, emails) if key])
+
+    def duplicates(self, by: str = 'phone') -> list:
+        """Groups of contacts (as lists of dicts) that share a normalised phone number (or email address, with
+        by='email') across lists and scrapers.
+        """
+        key = {'phone': 'phone_key', 'email': 'email_key'}[by]
+        rows = self._query(f"SELECT * FROM contacts WHERE {key} IN (SELECT {key} FROM contacts WHERE {key} != '' "
+                           f"GROUP BY {key} HAVING COUNT(*) > 1) ORDER BY {key}, id")
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[key], []).append(row)
+
+        return list(groups.values())
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+## Functions ##
+def email_key(email: str) -> str:
+    """Normalised email address for matching: stripped and lower-cased, or '' if it isn't an address (e.g. 'STARNOW').
+    """
+    email = (email or '').strip().lower()
+    if email.startswith('mailto:'):
+        email = email[len('mailto:'):]
+
+    return email if '@' in email else ''
+
+
+def phone_key(phone: str) -> str:
+    """Normalised phone number for matching: digits only, with UK numbers in national format (+44 7700 900123,
+    0044 (0)7700 900123 and 07700 900123 all give '07700900123').
+    """
+    digits = re.sub(r'\D', '', str(phone or ''))
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if digits.startswith('440'):
+        digits = digits[2:]  # +44 (0)...
+    elif digits.startswith('44') and len(digits) == 12:
+        digits = '0' + digits[2:]
+
+    return digits
@@ -8,13 +8,23 @@ __version__ = '0.0.1'
 ## Imports ##
 import re
 import os
+import html
+import mmap
+import base64
+import mimetypes
+import functools
+import threading
+import collections
 import markdown
+from colour_markdown import ColourExtension
 import keyring
 from pwinput import pwinput
 import smtplib
+import socket
+import time
 from email.message import EmailMessage
-import logging
-from datetime import datetime
+from email.parser import BytesHeaderParser
+from email.utils import make_msgid
 
 ## Variables ##
 providers = {"gmail": "smtp.gmail.com",
@@ -22,6 +32,20 @@ providers = {"gmail": "smtp.gmail.com",
              "ionos": "smtp.ionos.de",
              "icloud": "smtp.mail.me.com"}
 
+# Conservative outbound limits per provider (messages per minute, messages per day, concurrent connections). Providers
+# do not all publish these and they vary with account type, so adjust to suit the account being used.
+provider_limits = {"gmail": {"per_minute": 20, "per_day": 500, "connections": 3},
+                   "hotmail": {"per_minute": 30, "per_day": 300, "connections": 2},
+                   "ionos": {"per_minute": 10, "per_day": 5000, "connections": 4},
+                   "icloud": {"per_minute": 20, "per_day": 1000, "connections": 2}}
+
+name_slot = '$N'  # placeholder for recipient names in email templates
+
+# Encoded attachments kept for re-use across a run's messages, up to a total size in bytes (see attachment_part)
+attachment_cache_size = 64 * 1024 * 1024
+attachment_cache = collections.OrderedDict()  # (path, modification time, size) -> part, least recently used first
+attachment_cache_lock = threading.Lock()
+
 
 ## Functions ##
 def yes_no(prompt):
@@ -67,6 +91,100 @@ def password_to_keychain(service, un, pw):
     return
 
 
+@functools.lru_cache(maxsize=None)
+def read_signature(path='signature.txt'):
+    """Reads HTML signature from disk, caching the contents so it is only read once per run.
+    """
+    with open(path) as sig:
+        signature = sig.read()
+
+    return signature
+
+
+def encode_attachment(path, size):
+    """Builds a base64-encoded MIME attachment part for a document of 'size' bytes. The file is memory-mapped and
+    encoded in chunks of whole base64 lines, so it is never held in memory unencoded.
+    """
+    chunk = 57 * 1024  # bytes per chunk (57 bytes -> one 76-character base64 line)
+
+    encoded = ''
+    if size:
+        with open(path, "rb") as attachment, \
+                mmap.mmap(attachment.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            encoded = ''.join(base64.encodebytes(mm[i:i + chunk]).decode('ascii') for i in range(0, size, chunk))
+
+    mime_type, _ = mimetypes.guess_type(path)
+    maintype, subtype = (mime_type or 'application/octet-stream').split('/')
+
+    part = EmailMessage()
+    part.set_content(b'', maintype, subtype, disposition='attachment', filename=os.path.basename(path))
+    part.set_payload(encoded)  # swap in pre-encoded body
+
+    return part
+
+
+def attachment_part(path):
+    """Fetches the MIME attachment part for a document (see encode_attachment), from the attachment cache if it is
+    there. The cache is keyed on path, modification time and size, so each document is read and encoded once per run
+    and the part re-used for every message. It holds up to 'attachment_cache_size' bytes of encoded attachments,
+    dropping the least recently used to make room. Parts bigger than that on their own are not kept.
+    """
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+
+    with attachment_cache_lock:
+        if key in attachment_cache:
+            attachment_cache.move_to_end(key)
+            return attachment_cache[key]
+
+    part = encode_attachment(path, st.st_size)
+    if len(part.get_payload()) > attachment_cache_size:
+        return part
+
+    with attachment_cache_lock:
+        attachment_cache[key] = part
+        total = sum(len(p.get_payload()) for p in attachment_cache.values())
+        while total > attachment_cache_size:
+            _, dropped = attachment_cache.popitem(last=False)
+            total -= len(dropped.get_payload())
+
+    return part
+
+
+@functools.lru_cache(maxsize=None)
+def message_id_domain(from_address: str) -> str:
+    """Domain for the Message-IDs of emails from this address: its own domain, or (if it has none) this machine's
+    name. Worked out once per sender, as make_msgid() would otherwise look up the machine's name for every message.
+    """
+    _, at, domain = from_address.rpartition('@')
+
+    return domain if at and domain else socket.getfqdn()
+
+
+def build_email(msg_template, subject: str, from_address: str, to_address: str, names: str,
+                docs_to_add: list = None, sign: bool = False, domain: str = None):
+    """Builds a signed Multipart email with any attachments, inserting names into the template. 'msg_template' may be
+    raw template text or a pre-compiled EmailTemplate (in which case its own 'sign' setting is used). The Message-ID
+    is made on 'domain' (default: see message_id_domain).
+    """
+    if not isinstance(msg_template, EmailTemplate):
+        msg_template = EmailTemplate(msg_template, sign)
+
+    msg = CustomEmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = from_address
+    msg['To'] = to_address
+    msg['Message-ID'] = make_msgid(domain=domain or message_id_domain(from_address))
+
+    msg.set_content(msg_template.render_plain(names))  # Insert name into email message
+    msg.add_alternative(msg_template.render_html(names), subtype='html')
+
+    if docs_to_add:
+        msg.add_attachments(docs_to_add)  # attach documents if any
+
+    return msg
+
+
 class EmailText:
     """Class that enables conversion of customised input text to either HTML or plain text.
     """
@@ -77,28 +195,10 @@ class EmailText:
     def convert_to_html(self, sign=False):
         """Converts customised markdown text to html, including an HTML signature if desired.
         """
-        _raw_txt = self.text
-        # _raw_txt = msg_template
-
-        col_head_pattern = r'\[(\w+)\]\{([\#+|\*][^*]+?)\}'
-        _raw_txt = re.sub(col_head_pattern, r'\2$\1$', _raw_txt)  # Mark coloured headings/bullets in HTML-compatible format
-
-        html_txt = markdown.markdown(_raw_txt)  # Convert to HTML
-
-        rm = {r'(\<\w+)(\>.+)\$(.+)\$(.+\>)': r'\1 style="color:\3;"\2\4',  # Push colour styling strings inside HTML tags for headers
-              r'\[(\w+)\]\{([\s\S]+?)\}': r'<span style="color: \1">\2</span>',  # translate coloured body text to HTML
-              r'(\<span[\S\s]+?)\<\/p\>\n\<p\>(.+?\<\/span\>)': r'\1<br><br>\2'   # account for body text over multiple paragraphs
-              }
-
-        for frm, to in rm.items():
-            html_txt = re.sub(frm, to, html_txt, flags=re.MULTILINE)
-
-        # print(html_txt)
+        html_txt = markdown.markdown(self.text, extensions=[ColourExtension()])  # Convert to HTML, colouring text
 
         if sign:
-            with open('signature.txt') as sig:
-                signature = sig.read()
-            html_txt += ('<br>' * 2 + signature)  # Add signature
+            html_txt += ('<br>' * 2 + read_signature())  # Add signature
 
         return html_txt
 
@@ -117,6 +217,31 @@ class EmailText:
         return text
 
 
+class EmailTemplate:
+    """Email template compiled once per campaign. The markdown is rendered to HTML and plain text a single time with a
+    marker in place of each name slot ('$N'), and each recipient's bodies are then produced by filling those slots.
+    """
+    _marker = 'NAMESLOTa7c3e91f'  # alphanumeric so it passes through markdown and the colour regexes untouched
+
+    def __init__(self, text: str, sign: bool = False):
+        self.text = text
+        self.sign = sign
+
+        content = EmailText(text.replace(name_slot, self._marker))
+        self._plain_parts = content.convert_to_plain().split(self._marker)
+        self._html_parts = content.convert_to_html(sign).split(self._marker)
+
+    def render_plain(self, names: str) -> str:
+        """Fills name slots in the compiled plain text body.
+        """
+        return names.join(self._plain_parts)
+
+    def render_html(self, names: str) -> str:
+        """Fills name slots in the compiled HTML body, escaping names for HTML.
+        """
+        return html.escape(names).join(self._html_parts)
+
+
 class CustomEmailMessage(EmailMessage):
     """Modified EmailMessage() that allows attachments of multiple docs specified in a list of path strings
     """
@@ -125,13 +250,9 @@ class CustomEmailMessage(EmailMessage):
         """Function to add multiple attachments to an email.
         """
         for doc in doc_list:
-            # Open file in binary mode
-            with open(doc, "rb") as attachment:
-                # Add file as application
-                content = attachment.read()
-                self.add_attachment(content, maintype='application',
-                                    subtype=os.path.splitext(doc)[1],
-                                    filename=os.path.basename(doc))
+            if self.get_content_type() != 'multipart/mixed':
+                self.make_mixed()
+            self.attach(attachment_part(doc))  # pre-encoded part shared across all messages in the run
 
         return
 
@@ -175,42 +296,59 @@ class CustomizedSMPTSession(smtplib.SMTP):
 
         return
 
-    def send_email(self, msg_template: str, subject: str,
+    def data(self, msg):
+        """SMTP 'DATA' command, keeping the server's reply to the message (for the send journal).
+        """
+        self.last_response = super().data(msg)
+
+        return self.last_response
+
+    def send_email(self, msg_template, subject: str,
                    from_address: str, to_address: str, names: str,
-                   docs_to_add: list = None, sign: bool = False, ghost: bool = False):
-        """Send email (without logging)
+                   docs_to_add: list = None, sign: bool = False, ghost: bool = False, journal=None):
+        """Send email, recording it in the send journal (see send_journal.SendJournal) if given one and not a ghost
+        email. 'msg_template' may be raw template text or a pre-compiled EmailTemplate (in which case its own 'sign'
+        setting is used).
         """
-        content = msg_template.replace('$N', names)  # Insert name into email message
-        content = EmailText(content)
+        msg = build_email(msg_template, subject, from_address, to_address, names, docs_to_add, sign)
 
-        msg = CustomEmailMessage()
-        msg['Subject'] = subject
-        msg['From'] = from_address
-        msg['To'] = to_address
+        start = time.perf_counter()
+        self.send_message(msg)
 
-        msg.set_content(content.convert_to_plain())
-        msg.add_alternative(content.convert_to_html(sign), subtype='html')
+        if journal and not ghost:
+            journal.record(msg['Message-ID'], from_address, to_address, names, subject,
+                           time.perf_counter() - start, self.response_text())
 
-        if docs_to_add:
-            msg.add_attachments(docs_to_add)  # attach documents if any
+        return
 
-        self.send_message(msg)
+    def send_raw(self, from_address: str, to_address: str, data: bytes, subject: str, names: str = None,
+                 ghost: bool = False, journal=None):
+        """Send an already serialized (RFC 5322, CRLF line endings) email, e.g. one rendered into an outbox spool,
+        recording it in the send journal if given one and not a ghost email.
+        """
+        start = time.perf_counter()
+        self.sendmail(from_address, [to_address], data)
 
-        # Logging
-        if not ghost:
-            logging.basicConfig(filename="../email.log", level=logging.INFO)
-            now = datetime.now()
-            dt_string = now.strftime("%d/%m/%Y %H:%M")  # fetch date and time
-            logging.info(f"{dt_string}: Email sent from {from_address} to {to_address} (Subject: '{subject}').")
+        if journal and not ghost:
+            message_id = BytesHeaderParser().parsebytes(data)['Message-ID']
+            journal.record(message_id, from_address, to_address, names, subject,
+                           time.perf_counter() - start, self.response_text())
 
         return
 
+    def response_text(self):
+        """Server's reply to the last message sent, as text.
+        """
+        code, text = getattr(self, 'last_response', (None, b''))
+
+        return f"{code} {text.decode(errors='replace')}"
+
     def preview_email(self, template_path: str, from_address: str, password: str, subject: str,
                       docs_to_add: list = None, sign: bool = False):
         """Sends email to self, allowing corrections until user satisfied
         """
         with open(template_path) as email:
-            msg_template = email.read()  # Read in template
+            msg_template = EmailTemplate(email.read(), sign)  # Read in and compile template
 
         while True:
             # Handle any timeout errors
@@ -233,4 +371,4 @@ class CustomizedSMPTSession(smtplib.SMTP):
                 input(f">> Please edit template at path '{template_path}'. "
                       f"Hit ENTER to re-preview when you have saved new contents.")
                 with open(template_path) as email:
-                    msg_template = email.read()
+                    msg_template = EmailTemplate(email.read(), sign)
@@ -11,108 +11,609 @@ from imaplib import IMAP4_SSL
 import re, getpass, sys, subprocess, argparse
 import email
 import email.header
+import email.utils
+import email.policy
+from email.parser import BytesParser
+import quopri
+import itertools
+import base64
 import datetime
-import pandas as pd
+import time
+import select
+import ssl
+import queue
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from mailbox_sync import MailboxCheckpoint, checkpoint_path
+from contact_extract import ContactExtractor, html_to_text, normalise_phone
+from contact_store import ContactStore, store_path
+from table_io import open_sink
+from records import InboxContact, to_frame
 
 emailadd = "lukeswabypetts@gmail.com"
 mailbox = 'INBOX'
 
+# IMAP response tokens: parentheses, quoted strings, literal markers ({size}), and atoms (including BODY[...]<...>)
+token_re = re.compile(rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:\\.|[^"\\])*)"|\{(?P<literal>\d+)\}$'
+                      rb'|(?P<atom>[^\s()"\[\]]+(?:\[[^\]]*\](?:<[\d.]+>)?)?))')
+exists_re = re.compile(rb'\* \d+ EXISTS')
+header_parser = BytesParser(policy=email.policy.default)
+columns = InboxContact.columns
+
 ## Functions ##
 
-def process_mailbox(M, subject=None):
+
+def uid_set(uids):
+    """Compresses a list of UIDs (bytes) into an IMAP sequence set string, e.g. [1, 2, 3, 7] -> '1:3,7'.
     """
-    Do something with emails messages in the folder.
-    For the sake of this example, print some headers.
+    nums = sorted(int(uid) for uid in uids)
+    ranges = []
+
+    for n in nums:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+
+    return ','.join(f'{a}:{b}' if a != b else str(a) for a, b in ranges)
+
+
+def imap_tokens(data):
+    """Tokenises the data returned by an imaplib command (a mix of byte strings and (prefix, literal) tuples) into
+    '(', ')', atoms (str), quoted strings (str), literals (bytes) and NIL (None).
     """
+    for item in data:
+        if isinstance(item, tuple):
+            chunk, literal = item
+        else:
+            chunk, literal = item, None
+
+        pos = 0
+        while pos < len(chunk):
+            m = token_re.match(chunk, pos)
+            if not m or m.end() == pos:
+                break
+            pos = m.end()
+
+            if m.group('open'):
+                yield '('
+            elif m.group('close'):
+                yield ')'
+            elif m.group('quoted') is not None:
+                yield re.sub(rb'\\(.)', rb'\1', m.group('quoted')).decode(errors='replace')
+            elif m.group('literal'):
+                yield literal
+            else:
+                atom = m.group('atom').decode(errors='replace')
+                yield None if atom.upper() == 'NIL' else atom
 
-    #TODO:
-    # 1. make this only return correct emails
-    # 2. make this scan for names, numbers, and emails
-    # 3. Return in dataframe
 
-    if subject:
-        rv, data = M.uid('search', None, f'(HEADER Subject "{subject}")')
-    else:
-        rv, data = M.uid('search', None, 'ALL')
+def parse_fetch(data):
+    """Parses an imaplib FETCH response into a dict of {UID: {item name: value}}, with parenthesised lists as nested
+    Python lists, e.g. {b'12': {'BODYSTRUCTURE': [...], 'BODY[1]': b'...'}}.
+    """
+    messages = {}
+    stack = [[]]
+
+    for token in imap_tokens(data):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            closed = stack.pop()
+            stack[-1].append(closed)
+
+            if len(stack) == 1:
+                # End of one message's data: (name value name value ...)
+                items = {str(k).upper(): v for k, v in zip(closed[::2], closed[1::2])}
+                if 'UID' in items:
+                    messages[items['UID'].encode()] = items
+                stack = [[]]
+        else:
+            stack[-1].append(token)
 
-    #rv, data = M.search(None, "ALL")
-    if rv != 'OK':
-        return "No messages found!"
+    return messages
 
-    diclist = []
 
-    for num in data[0].split():
-        #rv, data = M.fetch(num, '(RFC822)')
-        rv, data = M.uid('fetch', num, '(RFC822)')
-        # TODO: WHY IS THERE NO DATA?
+def text_sections(structure, content_type='text/plain', section=''):
+    """Walks a parsed BODYSTRUCTURE, returning (section, encoding, charset) for each part of the given content type,
+    e.g. ('1.1', 'QUOTED-PRINTABLE', 'utf-8').
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
 
+    if isinstance(structure[0], list):
+        # Multipart: child parts followed by the subtype (and extension data)
+        parts = []
+        for i, child in enumerate(itertools.takewhile(lambda c: isinstance(c, list), structure), 1):
+            parts += text_sections(child, content_type, f'{section}.{i}' if section else str(i))
+        return parts
+
+    maintype, subtype = str(structure[0]).lower(), str(structure[1]).lower()
+    section = section or '1'
+
+    if f'{maintype}/{subtype}' == 'message/rfc822' and len(structure) > 8:
+        # Encapsulated message: its body parts are numbered from this section
+        inner = structure[8]
+        if isinstance(inner, list) and inner and isinstance(inner[0], list):
+            return text_sections(inner, content_type, section)
+        return text_sections(inner, content_type, f'{section}.1')
+
+    if f'{maintype}/{subtype}' != content_type:
+        return []
+
+    params = structure[2] if isinstance(structure[2], list) else []
+    params = {str(k).lower(): v for k, v in zip(params[::2], params[1::2])}
+
+    return [(section, str(structure[5] or '7BIT').upper(), params.get('charset') or 'us-ascii')]
+
+
+def decode_section(payload, encoding, charset):
+    """Decodes a fetched body section according to its transfer encoding and charset.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if not payload:
+        return ''
+
+    if encoding == 'QUOTED-PRINTABLE':
+        payload = quopri.decodestring(payload)
+    elif encoding == 'BASE64':
+        payload = base64.b64decode(payload)
+
+    try:
+        return payload.decode(charset, errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')  # unknown charset
+
+
+def fetch_raw_batch(M, uids):
+    """Network half of fetch_batch: fetches the Subject/Date headers and BODYSTRUCTURE of a batch of messages in one
+    UID FETCH, then the text sections of each group of messages that share the same layout in one more (attachments
+    are never downloaded). The text/plain parts of a message are fetched if it has any, otherwise its text/html parts.
+    Returns ({UID: raw header}, [(html?, sections, raw FETCH response)]), for decoding by parse_batch.
+    """
+    rv, data = M.uid('fetch', uid_set(uids), '(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT DATE)])')
+    if rv != 'OK':
+        raise imaplib.IMAP4.error(f"FETCH failed: {data}")
+
+    messages = parse_fetch(data)
+
+    # Group messages by the sections to fetch, so each group is one command
+    groups = {}
+    for uid, items in messages.items():
+        structure = items.get('BODYSTRUCTURE')
+        html = False
+        sections = tuple(text_sections(structure))
+        if not sections:
+            html, sections = True, tuple(text_sections(structure, 'text/html'))  # HTML-only reply
+        if sections:
+            groups.setdefault((html, sections), []).append(uid)
+
+    bodies = []
+    for (html, sections), group in groups.items():
+        items = ' '.join(f'BODY.PEEK[{section}]' for section, _, _ in sections)
+        rv, data = M.uid('fetch', uid_set(group), f'(UID {items})')
         if rv != 'OK':
-            print("ERROR getting message", num)
-            #return
+            raise imaplib.IMAP4.error(f"FETCH failed: {data}")
+        bodies.append((html, sections, data))
+
+    headers = {uid: next((v for k, v in items.items() if k.startswith('BODY[HEADER')), b'') or b''
+               for uid, items in messages.items()}
+
+    return headers, bodies
 
-        msg = email.message_from_string(data[0][1].decode()) # .decode() added
-        decode = email.header.decode_header(msg['Subject'])[0]
-        subject = str(decode[0])
-        print('Message %s: %s' % (num.decode(), subject))  # added .decode()
+
+def parse_batch(raw):
+    """Parsing half of fetch_batch: decodes the output of fetch_raw_batch into a list of (UID, header message, [text])
+    in UID order, with HTML parts converted to text.
+    """
+    headers, bodies = raw
+
+    texts = {}
+    for html, sections, data in bodies:
+        for uid, fetched in parse_fetch(data).items():
+            texts[uid] = [decode_section(fetched.get(f'BODY[{section}]'), encoding, charset)
+                          for section, encoding, charset in sections]
+            if html:
+                texts[uid] = [html_to_text(text) for text in texts[uid]]
+
+    out = []
+    for uid in sorted(headers, key=int):
+        header = headers[uid]
+        if isinstance(header, str):
+            header = header.encode()
+        out.append((uid, header_parser.parsebytes(header), texts.get(uid, [])))  # headers decoded by the policy
+
+    return out
+
+
+def fetch_batch(M, uids):
+    """Fetches and decodes the Subject/Date headers and text sections of a batch of messages (see fetch_raw_batch).
+    Returns a list of (UID, header message, [text]) in UID order.
+    """
+    return parse_batch(fetch_raw_batch(M, uids))
+
+
+def search_uids(M, subject=None, after_uid=0):
+    """UIDs of messages in the selected folder (optionally only those with a given subject) newer than 'after_uid'.
+    """
+    criteria = f'HEADER Subject "{subject}"' if subject else 'ALL'
+    if after_uid:
+        criteria = f'UID {after_uid + 1}:* {criteria}'
+    rv, data = M.uid('search', None, f'({criteria})')
+
+    if rv != 'OK':
+        print("No messages found!")
+        return []
+
+    return [uid for uid in data[0].split() if int(uid) > after_uid]  # 'n:*' always matches the newest message
+
+
+def extract_contacts(uid, msg, texts, extractor, verbose=True):
+    """Yields a record for each set of applicant details (see contact_extract.ContactExtractor) found in a message's
+    text parts.
+    """
+    if verbose:
+        print('Message %s: %s' % (uid.decode(), msg['Subject']))
         print('Raw Date:', msg['Date'])
 
         # Now convert to local date-time
-        date_tuple = email.utils.parsedate_tz(msg['Date'])
+        date_tuple = email.utils.parsedate_tz(msg['Date'] or '')
         if date_tuple:
             local_date = datetime.datetime.fromtimestamp(
                 email.utils.mktime_tz(date_tuple))
             print("Local Date:", local_date.strftime("%a, %d %b %Y %H:%M:%S"))
 
-        ## see https://stackoverflow.com/questions/48985722/finding-links-in-an-emails-body-with-python
-        for part in msg.walk():
-            # each part is a either non-multipart, or another multipart message
-            # that contains further parts... Message is organized like a tree
-            if part.get_content_type() == 'text/plain':
-                plain_text = part.get_payload()
-                #print('*'*50)
-                #print('MESSAGE:')
-                #print('*'*50)
-                #print(plain_text)
+    for text in texts:
+        for details in extractor.records(text):
+            if 'Phone Number' in details:
+                details['Phone Number'] = normalise_phone(details['Phone Number'])
+            if verbose:
+                print('\n'.join(f"{field}: {value}" for field, value in details.items()))
+
+            yield InboxContact.from_details(int(uid), details)
+
+    if verbose:
+        print('-'*100)
 
-                #string = 'asdghmjsa  NAME: Luke Swaby-Petts  kjdkjsdsa' \
-                #         'n PHONE: 07966283252 sjhdjhasKs asjhgdbkal' \
-                #         'NAME: Tiana Milanovich  PHONE: 07595 946 214'
 
-                #string = 'dkjagdkasjdgsahfjdjghadhkgDALJDKGJF\r\n\r\nMDAUDJAGHFDFH\r\n\r\nNAME: Tiana Milanovich\r\nPHONE: 07985 768 657\r\n\r\ntn  NAME: Luke Swabo\nPHONE:07595946214 xx\r\n\r\ntdot\r\n'
-                match = r"NAME:?\s*([A-Za-z ,.'-]+)\s+PHONE:?\s*([\d ]+)"
-                regex = re.compile(match)
+def extract_batch(raw, fields=None):
+    """Process pool worker for iter_contacts_sharded: parses the output of fetch_raw_batch and extracts its records.
+    Returns (number of messages, records, number of bodies scanned, field hit counts).
+    """
+    extractor = ContactExtractor(fields)
+    fetched = parse_batch(raw)
+    rows = [row for uid, msg, texts in fetched for row in extract_contacts(uid, msg, texts, extractor, verbose=False)]
 
-                #re.findall(r"NAME:?\s*([A-Za-z ,.'-]+)\s+PHONE:?\s*([\d ]+)", string)
+    return len(fetched), rows, extractor.scanned, extractor.hits
 
-                # TODO: Why doesn't this^ match \r\n\r\n? (\r\n)
 
-                for match in regex.finditer(plain_text):
-                    diccy = {}
+def iter_contacts(M, subject=None, batch_size=200, checkpoint=None, extractor=None):
+    """
+    Generator pipeline over the selected folder: search -> batched fetch -> header parsing -> extraction. Yields a
+    record (records.InboxContact, with None for fields not found) for each contact found, fetching the next batch of
+    'batch_size' messages only once the last has been consumed, so memory use does not grow with the size of the
+    mailbox. If given a checkpoint (see mailbox_sync.MailboxCheckpoint), only messages newer than the last run are
+    fetched, and each batch's records are cached as the batch completes. Per-field hit rates are reported at the end.
+    """
+    extractor = extractor or ContactExtractor()
+    uids = search_uids(M, subject, checkpoint.last_uid if checkpoint else 0)
+    batches = [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+    print(f"{len(uids)} new messages.\n" if checkpoint else f"{len(uids)} messages.\n")
 
-                    name = match.group(1).strip()
-                    no = match.group(2).replace(' ', '')
-                    print(f"Name: {name}\nNumber: {no}")
+    stalled = False
 
-                    diccy['Name'] = name
-                    diccy['Phone Number'] = no
+    for b, batch in enumerate(batches, 1):
+        try:
+            fetched = fetch_batch(M, batch)
+        except imaplib.IMAP4.error as e:
+            print(f"ERROR getting batch {b}/{len(batches)} (UIDs {uid_set(batch)}): {e}")
+            stalled = True  # don't checkpoint past this batch, so it is retried next run
+            continue
 
-                    diclist.append(diccy)
+        rows = []
+        for uid, msg, texts in fetched:
+            for row in extract_contacts(uid, msg, texts, extractor):
+                rows.append(row)
+                yield row
 
-        print('-'*100)
+        if checkpoint and not stalled:
+            checkpoint.update(int(batch[-1]), rows)
 
-    deets = pd.DataFrame(diclist)
+        print(f"Batch {b}/{len(batches)}: {len(fetched)} messages, {len(rows)} contacts found.\n")
 
-    return deets
+    if extractor.scanned:
+        print("Fields found in %d bodies: " % extractor.scanned
+              + ', '.join(f"{field} {rate:.0%}" for field, rate in extractor.hit_rates().items()))
 
-def main(email, subject, output):
+
+def iter_contacts_sharded(M, connect, subject=None, connections=4, processes=None, batch_size=200, checkpoint=None,
+                          extractor=None):
+    """
+    Parallel version of iter_contacts for large mailboxes. The UIDs found by searching on 'M' (a connection with the
+    mailbox already selected) are split into batches, which are dealt out to up to 'connections' concurrent
+    connections ('M', plus more opened with 'connect', a function returning a logged-in connection) as they free up.
+    The raw bytes each one fetches are parsed and scanned in a pool of 'processes' processes (default: one per CPU),
+    and the records are yielded in UID order. Keep 'connections' within the provider's limit on simultaneous IMAP
+    connections (e.g. 15 for Gmail). Checkpointing is as for iter_contacts.
+    """
+    extractor = extractor or ContactExtractor()
+    uidvalidity = checkpoint.uidvalidity if checkpoint else None
+    uids = search_uids(M, subject, checkpoint.last_uid if checkpoint else 0)
+    batches = [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+    print(f"{len(uids)} new messages.\n" if checkpoint else f"{len(uids)} messages.\n")
+
+    idle_connections = queue.LifoQueue()
+    idle_connections.put(M)
+    opened = []
+
+    def open_connection():
+        C = connect()
+        opened.append(C)
+        rv, data = C.select(mailbox, readonly=True)
+        if rv != 'OK':
+            raise imaplib.IMAP4.error(f"Unable to open mailbox {mailbox}: {data}")
+        if uidvalidity is not None and int(C.response('UIDVALIDITY')[1][0]) != uidvalidity:
+            raise imaplib.IMAP4.error(f"UIDVALIDITY of {mailbox} changed during the run")
+        return C
+
+    def fetch(batch):
+        # Runs in a fetcher thread; hands the raw bytes straight on to the parse pool
+        try:
+            C = idle_connections.get_nowait()
+        except queue.Empty:
+            C = open_connection()  # never more than 'connections' at once: one per fetcher thread
+        try:
+            raw = fetch_raw_batch(C, batch)
+        except imaplib.IMAP4.abort:
+            C = open_connection()  # dropped: replace it for the next batch
+            raise
+        finally:
+            idle_connections.put(C)
+        return parsers.submit(extract_batch, raw, extractor.fields)
+
+    stalled = False
+
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as fetchers, \
+            ProcessPoolExecutor(max_workers=processes) as parsers:
+        # Keep a bounded window of batches in flight, so memory use does not grow with the size of the mailbox
+        window = 2 * max(1, connections)
+        pending = collections.deque(fetchers.submit(fetch, batch) for batch in batches[:window])
+
+        for b, batch in enumerate(batches, 1):
+            future = pending.popleft()
+            if b + window <= len(batches):
+                pending.append(fetchers.submit(fetch, batches[b + window - 1]))
+
+            try:
+                n, rows, scanned, hits = future.result().result()
+            except (imaplib.IMAP4.error, OSError) as e:
+                print(f"ERROR getting batch {b}/{len(batches)} (UIDs {uid_set(batch)}): {e}")
+                stalled = True  # don't checkpoint past this batch, so it is retried next run
+                continue
+
+            extractor.scanned += scanned
+            extractor.hits.update(hits)
+            yield from rows
+
+            if checkpoint and not stalled:
+                checkpoint.update(int(batch[-1]), rows)
+
+            print(f"Batch {b}/{len(batches)}: {n} messages, {len(rows)} contacts found.")
+
+    for C in opened:
+        try:
+            C.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+    if extractor.scanned:
+        print("\nFields found in %d bodies: " % extractor.scanned
+              + ', '.join(f"{field} {rate:.0%}" for field, rate in extractor.hit_rates().items()))
+
+
+def process_mailbox(M, subject=None, batch_size=200, checkpoint=None):
+    """
+    Scans the text parts of messages in the selected folder (optionally only those with a given subject) for
+    applicant details ('NAME: ... PHONE: ...' etc.), returning them in a dataframe (see iter_contacts).
+    """
+    records = list(iter_contacts(M, subject, batch_size, checkpoint))
+    df = to_frame(records, InboxContact)
+    df.insert(0, 'UID', [r.uid for r in records])
+
+    return df
+
+
+def write_records(records, output, append=False):
+    """
+    Streams records (InboxContacts) to 'output' as they arrive: a CSV, or a Parquet (requires pyarrow)
+    or Excel file by its extension (see table_io.open_sink). With 'append', rows are added to the end of an existing
+    CSV. Returns the number of rows written.
+    """
+    with open_sink(output, columns, append) as out:
+        return out.extend(records)
+
+
+def store_records(records, contacts, subject):
+    """Passes records through unchanged, adding each one to the contact store 'contacts' (under the subject it was a
+    reply to) on the way.
+    """
+    for record in records:
+        age = record.age
+        contacts.add('email', subject, record.name, record.email, record.phone, record.agent,
+                     int(age) if age and age.isdigit() else None)
+        yield record
+
+
+def received(M) -> bool:
+    """Whether data from the server has already been read off the socket (into imaplib's buffered file, or decrypted
+    and held by the SSL layer), where select() on the socket can't see it. Doesn't block.
+    """
+    if isinstance(M.sock, ssl.SSLSocket) and M.sock.pending():
+        return True
+
+    timeout = M.sock.gettimeout()
+    M.sock.settimeout(0)  # so that peeking at an empty buffer doesn't wait for the socket
+    try:
+        return bool(M.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        M.sock.settimeout(timeout)
+
+
+def skip_written(records, written: set):
+    """Passes on the records from messages whose UIDs aren't in 'written' (those already in the output), adding their
+    UIDs to it, so a batch fetched again after the connection drops isn't added to the output twice.
+    """
+    done = set(written)
+    for record in records:
+        if record.uid not in done:
+            written.add(record.uid)
+            yield record
+
+
+def idle(M, timeout):
+    """Waits in IMAP IDLE (RFC 2177) for up to 'timeout' seconds, returning True as soon as the server announces new
+    messages, or False on timeout. IDLE is always ended (DONE) before returning, so the connection is ready for other
+    commands. Raises imaplib.IMAP4.abort if the connection drops. Lines that arrived along with the server's reply to
+    IDLE (and so are already buffered, see received) are read before waiting on the socket.
+    """
+    tag = b'IDLE%d' % int(time.monotonic() * 1000)
+    M.send(tag + b' IDLE\r\n')
+
+    line = M.readline()
+    if not line.startswith(b'+'):
+        raise imaplib.IMAP4.abort(f"IDLE refused: {line!r}")
+
+    new = False
+    deadline = time.monotonic() + timeout
+
+    while not new:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not (received(M) or select.select([M.sock], [], [], remaining)[0]):
+            break  # timed out
+
+        line = M.readline()
+        if not line or line.startswith(b'* BYE'):
+            raise imaplib.IMAP4.abort("Connection closed by server")
+        new = bool(exists_re.match(line))
+
+    M.send(b'DONE\r\n')
+
+    while True:
+        line = M.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed by server")
+        if line.startswith(tag):
+            if not line[len(tag):].strip().startswith(b'OK'):
+                raise imaplib.IMAP4.abort(f"IDLE failed: {line!r}")
+            return new
+        new = new or bool(exists_re.match(line))
+
+
+def watch_mailbox(connect, account, subject, output, idle_timeout=25 * 60, max_backoff=300,
+                  store=checkpoint_path):
+    """
+    Long-running watch mode: 'connect' is a function returning a logged-in IMAP connection. Catches up on messages
+    that arrived since the last run (see MailboxCheckpoint), writes all records to the output CSV, then waits in IDLE
+    and appends the details from each new message to the output as soon as the server announces it. IDLE is renewed
+    before the server's inactivity timeout (29 minutes at the most per RFC 2177), and the connection is re-opened with
+    exponential back-off if it drops. Runs until interrupted (Ctrl-C). 'store' is the checkpoint database path.
+    Messages already in the output are not added again after a reconnect; if the mailbox's UIDVALIDITY has changed
+    since the last connection, its UIDs have all been reassigned, so the output is written again from scratch.
+    """
+    backoff = 1
+    written = set()  # UIDs of the messages in the output
+    output_uidvalidity = None  # the UIDVALIDITY they are UIDs under
+
+    while True:
+        M = None
+        try:
+            M = connect()
+            rv, data = M.select(mailbox, readonly=True)
+            if rv != 'OK':
+                raise imaplib.IMAP4.error(f"Unable to open mailbox {mailbox}: {data}")
+            uidvalidity = int(M.response('UIDVALIDITY')[1][0])
+
+            with MailboxCheckpoint(account, mailbox, subject, uidvalidity, store) as checkpoint:
+                if uidvalidity != output_uidvalidity:
+                    # First connection, or the UIDs have been reset: cached records followed by anything new since
+                    written.clear()
+                    write_records(skip_written(itertools.chain(checkpoint.iter_records(),
+                                                               iter_contacts(M, subject, checkpoint=checkpoint)),
+                                               written), output)
+                    output_uidvalidity = uidvalidity
+                else:
+                    write_records(skip_written(iter_contacts(M, subject, checkpoint=checkpoint), written), output,
+                                  append=True)
+                backoff = 1
+
+                print(f"Watching {mailbox} for new messages (Ctrl-C to stop)...")
+                while True:
+                    if idle(M, idle_timeout):
+                        n = write_records(skip_written(iter_contacts(M, subject, checkpoint=checkpoint), written),
+                                          output, append=True)
+                        print(f"{n} new contacts added to {output}.")
+
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+            break
+
+        except (imaplib.IMAP4.error, OSError) as e:
+            print(f"Connection lost ({e}). Reconnecting in {backoff}s...")
+            time.sleep(backoff)
+            backoff = min(max_backoff, backoff * 2)
+
+        finally:
+            if M is not None:
+                try:
+                    M.logout()
+                except (imaplib.IMAP4.error, OSError):
+                    pass
+
+    return 0
+
+def main(email, subject, output, sync=True, watch=False, connections=1, processes=None, store=store_path):
+    """
+    Scrapes the inbox for applicant details and streams them to a CSV (or Parquet or Excel) file. If 'sync' is True,
+    only messages that have arrived since the last run are fetched, and merged with the records cached from earlier
+    runs. If 'watch' is True,
+    keeps running and adds new replies to the CSV as they arrive (see watch_mailbox). With more than one connection,
+    messages are fetched over that many connections at once and parsed in a pool of 'processes' processes (see
+    iter_contacts_sharded). Records are also added to the contact store at 'store' (unless it is None).
+    """
     # create connection
     #M = IMAP4_SSL('imap.gmail.com')
 
+    password = getpass.getpass()
+
+    def connect():
+        M = IMAP4_SSL('imap.gmail.com')
+        M.login(email, password)
+        return M
+
+    if watch:
+        if not output.endswith('.csv'):
+            sys.exit("Watch mode adds to the output as replies arrive, so needs a .csv output.")
+        return watch_mailbox(connect, email, subject, output)
+
+    def contacts(M, checkpoint=None):
+        if connections > 1:
+            return iter_contacts_sharded(M, connect, subject, connections, processes, checkpoint=checkpoint)
+        return iter_contacts(M, subject, checkpoint=checkpoint)
+
+    def save(records):
+        if not store:
+            return write_records(records, output)
+        with ContactStore(store) as book:
+            return write_records(store_records(records, book, subject), output)
+
     with IMAP4_SSL('imap.gmail.com') as M:
 
         # login
         try:
-            rv, data = M.login(email, getpass.getpass())
+            rv, data = M.login(email, password)
         except imaplib.IMAP4.error:
             sys.exit("LOGIN FAILED!!!")
 
@@ -127,8 +628,13 @@ def main(email, subject, output):
         rv, data = M.select(mailbox, readonly=True)  # readonly = True added
         if rv == 'OK':
             print("Processing mailbox...\n")
-            deets = process_mailbox(M, subject)
-            deets.to_csv(output, index=False)
+            if sync:
+                uidvalidity = int(M.response('UIDVALIDITY')[1][0])
+                with MailboxCheckpoint(email, mailbox, subject, uidvalidity) as checkpoint:
+                    # Cached records followed by anything new since the last run, streamed to the output
+                    save(itertools.chain(checkpoint.iter_records(), contacts(M, checkpoint)))
+            else:
+                save(contacts(M))
 
             # Open results
             p = subprocess.Popen(['open', 'TREEPETTS.csv'], stdout=subprocess.PIPE,
@@ -156,8 +662,21 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Scrapes emails for casting personal info")
     parser.add_argument('-e', dest='email', required=True, help='Email address')
     parser.add_argument('-s', dest='subject', required=True, help='Email subject')
-    parser.add_argument('-o', dest='output', required=True, help='Csv output path.')
+    parser.add_argument('-o', dest='output', required=True,
+                        help='Csv output path (or .xlsx, or .parquet if pyarrow is installed).')
+    parser.add_argument('--full', dest='full', action='store_true',
+                        help='Reprocess every message rather than only those that arrived since the last run.')
+    parser.add_argument('--watch', dest='watch', action='store_true',
+                        help='Keep running, adding new replies to the output as soon as they arrive.')
+    parser.add_argument('-c', dest='connections', type=int, default=1,
+                        help='Number of IMAP connections to fetch over at once (keep within your provider\'s limit).')
+    parser.add_argument('-p', dest='processes', type=int, default=None,
+                        help='Number of processes to parse messages with when fetching over several connections '
+                             '(default: one per CPU).')
+    parser.add_argument('--no-store', dest='no_store', action='store_true',
+                        help="Don't add the records scraped to the contact store.")
     args = parser.parse_args()
 
-    out = main(args.email, args.subject, args.output)
+    out = main(args.email, args.subject, args.output, sync=not args.full, watch=args.watch,
+               connections=args.connections, processes=args.processes, store=None if args.no_store else store_path)
     sys.exit(out)
\ No newline at end of file
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""Local checkpoint store for incremental mailbox scraping: the UIDVALIDITY and highest processed UID for each
+mailbox and subject filter, plus the records already extracted from it, kept in an SQLite database."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import sqlite3
+import user_dirs
+from records import InboxContact
+
+## Variables ##
+checkpoint_path = os.path.join(user_dirs.data_dir, 'mailbox_sync.sqlite')  # contacts, so not in the repository
+
+schema = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    subject TEXT NOT NULL,      -- '' if no subject filter
+    uidvalidity INTEGER NOT NULL,
+    last_uid INTEGER NOT NULL,
+    PRIMARY KEY (account, mailbox, subject)
+);
+CREATE TABLE IF NOT EXISTS records (
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    name TEXT,
+    phone TEXT,
+    email TEXT,
+    age TEXT,
+    agent TEXT
+);
+CREATE INDEX IF NOT EXISTS records_key ON records (account, mailbox, subject, uid);
+"""
+
+# Record field -> column in the records table (named after the InboxContact attribute)
+record_columns = InboxContact.labels
+
+
+## Classes ##
+class MailboxCheckpoint:
+    """Checkpoint and cached records for one mailbox/subject filter of one account. 'last_uid' is the highest UID
+    already processed, or 0 if the mailbox has never been synced or its UIDVALIDITY has changed (in which case the old
+    UIDs mean nothing, so the cached records are dropped and a full resync is needed).
+    """
+
+    def __init__(self, account: str, mailbox: str, subject: str, uidvalidity: int, path: str = checkpoint_path):
+        self.key = (account, mailbox, subject or '')
+        self.uidvalidity = uidvalidity
+
+        self._conn = sqlite3.connect(user_dirs.private_path(path))
+        self._conn.executescript(schema)
+
+        # Databases made before email/age/agent were extracted lack their columns
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(records)")}
+        with self._conn:
+            for column in record_columns.values():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE records ADD COLUMN {column} TEXT")
+
+        row = self._conn.execute("SELECT uidvalidity, last_uid FROM checkpoints "
+                                 "WHERE account = ? AND mailbox = ? AND subject = ?", self.key).fetchone()
+
+        if row and row[0] == uidvalidity:
+            self.last_uid = row[1]
+        else:
+            if row:
+                print(f"UIDVALIDITY of {mailbox} has changed. Resyncing from scratch...")
+            self.reset()
+
+    def reset(self):
+        """Forgets the checkpoint and cached records.
+        """
+        with self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE account = ? AND mailbox = ? AND subject = ?", self.key)
+            self._conn.execute("DELETE FROM records WHERE account = ? AND mailbox = ? AND subject = ?", self.key)
+
+        self.last_uid = 0
+
+    def update(self, last_uid: int, records: list):
+        """Adds newly extracted records (InboxContacts) to the cache and moves the checkpoint on to 'last_uid', in one
+        transaction.
+        """
+        rows = [(*self.key, r.uid, *(getattr(r, column) for column in record_columns.values())) for r in records]
+        columns = ', '.join(record_columns.values())
+
+        with self._conn:
+            self._conn.executemany(f"INSERT INTO records (account, mailbox, subject, uid, {columns}) "
+                                   f"VALUES (?, ?, ?, ?, {', '.join('?' * len(record_columns))})", rows)
+            self._conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+                               (*self.key, self.uidvalidity, last_uid))
+
+        self.last_uid = last_uid
+
+    def iter_records(self):
+        """Streams the records cached up to the current checkpoint (as InboxContacts), in UID order.
+        """
+        cursor = self._conn.execute(f"SELECT uid, {', '.join(record_columns.values())} FROM records "
+                                    "WHERE account = ? AND mailbox = ? AND subject = ? AND uid <= ? "
+                                    "ORDER BY uid, rowid", (*self.key, self.last_uid))
+
+        for uid, *values in cursor:
+            yield InboxContact(uid, **dict(zip(record_columns.values(), values)))
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""On-disk outbox spool for sending a campaign: recipients' emails are rendered to RFC 5322 bytes by a process pool
+while pooled SMTP sessions send those already rendered, so rendering overlaps with network I/O. A run that is
+interrupted can be resumed from the spool without re-rendering or re-sending."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import hashlib
+import smtplib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from core import build_email
+from rate_limit import DailyLimitReached
+
+
+## Classes ##
+class Outbox:
+    """Spool directory holding one rendered email per file: 'pending/' for those still to send, 'sent/' for those
+    sent. Files are named by a hash of everything that goes into the email, so a re-run of the same campaign finds
+    its earlier work and a changed template or recipient list is rendered afresh.
+    """
+
+    def __init__(self, spool_dir: str):
+        self.pending_dir = os.path.join(spool_dir, 'pending')
+        self.sent_dir = os.path.join(spool_dir, 'sent')
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.sent_dir, exist_ok=True)
+
+    @staticmethod
+    def key(msg_template, subject: str, from_address: str, to_address: str, names: str,
+            docs_to_add: list = None) -> str:
+        """Spool file name for one recipient's email.
+        """
+        parts = [msg_template.text, str(msg_template.sign), subject, from_address, to_address, names,
+                 *(docs_to_add or [])]
+
+        return hashlib.sha1('\0'.join(parts).encode()).hexdigest() + '.eml'
+
+    def pending_path(self, key: str) -> str:
+        return os.path.join(self.pending_dir, key)
+
+    def status(self, key: str):
+        """Returns 'sent', 'pending' (rendered but not sent) or None (not rendered).
+        """
+        if os.path.exists(os.path.join(self.sent_dir, key)):
+            return 'sent'
+        if os.path.exists(self.pending_path(key)):
+            return 'pending'
+
+        return None
+
+    def read(self, key: str) -> bytes:
+        with open(self.pending_path(key), 'rb') as f:
+            return f.read()
+
+    def mark_sent(self, key: str):
+        os.replace(self.pending_path(key), os.path.join(self.sent_dir, key))
+
+
+## Functions ##
+def render_to_spool(path: str, msg_template, subject: str, from_address: str, to_address: str, names: str,
+                    docs_to_add: list = None):
+    """Renders one email to RFC 5322 bytes (CRLF line endings, ready for SMTP DATA) and writes it to the spool.
+    Written to a temporary file first so a crash never leaves a partial email in the spool.
+    """
+    msg = build_email(msg_template, subject, from_address, to_address, names, docs_to_add)
+    data = msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+    return
+
+
+def spool_campaign(pool, outbox: Outbox, msg_template, subject: str, recipients: list,
+                   docs_to_add: list = None, ghost: bool = False, processes: int = None, journal=None):
+    """Renders each (to_address, names) pair in 'recipients' into the outbox with a process pool, and sends each one
+    over the pooled SMTP sessions as soon as it is rendered, recording it in the send journal if given one. Emails
+    already sent (according to the outbox) are skipped and emails already rendered are not rendered again. Progress
+    is reported in recipient order. Returns a list of (to_address, names, error) tuples for any emails that could not
+    be rendered or sent.
+    """
+    from_address = pool.from_address
+
+    def send(key, to_address, names):
+        pool.send_raw(from_address, to_address, outbox.read(key), subject, names, ghost, journal=journal)
+        outbox.mark_sent(key)
+
+    keys = [outbox.key(msg_template, subject, from_address, to_address, names, docs_to_add)
+            for to_address, names in recipients]
+    results = {}  # recipient index -> future, or None if sent on a previous run
+
+    with ProcessPoolExecutor(max_workers=processes) as renderers, \
+            ThreadPoolExecutor(max_workers=pool.size) as senders:
+        renders = {}
+
+        for i, (key, (to_address, names)) in enumerate(zip(keys, recipients)):
+            status = outbox.status(key)
+            if status == 'sent':
+                results[i] = None
+            elif status == 'pending':
+                results[i] = senders.submit(send, key, to_address, names)
+            else:
+                renders[renderers.submit(render_to_spool, outbox.pending_path(key), msg_template, subject,
+                                         from_address, to_address, names, docs_to_add)] = i
+
+        # Send each email as soon as it has been rendered
+        for render in as_completed(renders):
+            i = renders[render]
+            if render.exception():
+                results[i] = render
+            else:
+                results[i] = senders.submit(send, keys[i], *recipients[i])
+
+        failed = []
+        for i, (to_address, names) in enumerate(recipients):
+            progress = f'[{i + 1}/{len(recipients)}]'
+            if results[i] is None:
+                print(f'{progress} Already mailed {to_address} regarding {names}. Skipping...')
+                continue
+
+            try:
+                results[i].result()
+                print(f'{progress} Mailed {to_address} regarding {names}.')
+            except (smtplib.SMTPException, OSError, DailyLimitReached) as e:
+                print(f'{progress} FAILED to mail {to_address} regarding {names}: {e}')
+                failed.append((to_address, names, e))
+
+    return failed
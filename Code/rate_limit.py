@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""Adaptive token-bucket rate limiting for outbound mail, keyed on email provider (see core.provider_limits)."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import time
+import threading
+import core
+
+
+## Classes ##
+class DailyLimitReached(Exception):
+    """Raised when the provider's daily sending limit has been used up.
+    """
+
+
+class ProviderRateLimiter:
+    """Token bucket shared by all sender threads. The send rate starts at the provider's per-minute limit, is halved
+    (and all sending paused for an increasing back-off) whenever the server replies with a temporary 4xx error, and
+    creeps back up towards the limit while sends succeed.
+    """
+
+    def __init__(self, per_minute: float, per_day: int, connections: int = 1, sent_today: int = 0,
+                 min_per_minute: float = 1, backoff: float = 5, max_backoff: float = 300):
+        self.max_rate = per_minute / 60  # messages per second
+        self.min_rate = min(min_per_minute, per_minute) / 60
+        self.rate = self.max_rate
+        self.per_day = per_day
+        self.connections = connections
+        self.sent_today = sent_today
+        self.backoff_delay = backoff
+        self.max_backoff = max_backoff
+
+        self.capacity = max(1, connections)  # allow one message per connection in a burst
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_provider(cls, provider: str, **kwargs):
+        """Limiter using the default limits for one of core.providers.
+        """
+        return cls(**{**core.provider_limits[provider], **kwargs})
+
+    def acquire(self):
+        """Blocks until a message may be sent.
+        """
+        while True:
+            with self._lock:
+                if self.sent_today >= self.per_day:
+                    raise DailyLimitReached(f"Daily limit of {self.per_day} emails reached.")
+
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.sent_today += 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def success(self):
+        """Records a successful send, raising the rate back towards the limit.
+        """
+        with self._lock:
+            self._failures = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def refund(self):
+        """Returns the allowance for a message that was not sent for some reason other than throttling (e.g. the
+        session had timed out), without slowing down.
+        """
+        with self._lock:
+            self.sent_today -= 1
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def throttled(self):
+        """Records a temporary (4xx) rejection: the message is refunded, the rate halved, and sending paused.
+        """
+        with self._lock:
+            self.sent_today -= 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+            self._paused_until = time.monotonic() + min(self.max_backoff, self.backoff_delay * 2 ** self._failures)
+            self._failures += 1
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""Typed records for the contacts each scraper produces (Spotlight performers, Starnow applicants and inbox replies),
+shared by the scrapers and the output sinks (see table_io)."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+from dataclasses import dataclass, field, fields
+from typing import ClassVar
+
+
+## Functions ##
+def slotted(cls):
+    """Class decorator making a dataclass with __slots__ rather than a per-instance __dict__ (as dataclass(slots=True)
+    does on Python 3.10+), so each record holds just its values: several times smaller than a dict per row.
+    """
+    cls = dataclass(cls)
+    names = tuple(f.name for f in fields(cls))
+
+    # Rebuilt without the defaults as class attributes (they would clash with the slots; __init__ has them)
+    namespace = {k: v for k, v in cls.__dict__.items() if k not in names + ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    new = type(cls)(cls.__name__, cls.__bases__, namespace)
+    new.__qualname__ = cls.__qualname__
+
+    return new
+
+
+def to_frame(records, cls=None):
+    """The single conversion of records (all of one class) to a pandas DataFrame, with the class's output columns.
+    'cls' gives the columns if there may be no records.
+    """
+    import pandas as pd
+
+    records = list(records)
+    columns = (cls or type(records[0])).columns if records or cls else []
+    return pd.DataFrame([r.row() for r in records], columns=columns)
+
+
+## Classes ##
+class Record:
+    """Base of the record classes. 'columns' are the headers of the table the records are written to, and row() gives
+    a record's values in that order; a sink checks they are the columns it was opened with, so a record and an output
+    that have drifted apart fail on the first row rather than leaving a misaligned file.
+    """
+    __slots__ = ()
+    columns: ClassVar[list] = []
+
+    def row(self) -> list:
+        return [getattr(self, f.name) for f in fields(self)]
+
+
+@slotted
+class SpotlightContact(Record):
+    """One performer card from a Spotlight shortlist page. The phone number and email address are their agent's.
+    """
+    columns: ClassVar[list] = ['NAME', 'AGENT', 'CONTACT NUMBER', 'EMAIL', 'CONTACT?']
+
+    name: str
+    agent: str = ''
+    phone: str = ''
+    email: str = ''
+    contact: str = None  # filled in by hand in the spreadsheet, for send_email
+
+
+@slotted
+class StarnowApplicant(Record):
+    """One applicant from a Starnow applicants page, with their answers to the casting's questions as
+    {question: answer}.
+    """
+    columns: ClassVar[list] = ['NAME', 'EMAIL', 'CONTACT NUMBER', 'AGE', 'NATIONAL TEAM', 'Asked to self tape?',
+                               'Received self tape?']
+
+    name: str
+    phone: str = ''
+    age: int = None
+    answers: dict = field(default_factory=dict)
+
+    def row(self, team_question: str = None, questions: list = ()) -> list:
+        """Values for 'columns' (the answer to 'team_question' going in NATIONAL TEAM), followed by the answers to
+        'questions'.
+        """
+        return ([self.name, 'STARNOW', self.phone, self.age, self.answers.get(team_question), None, None]
+                + [self.answers.get(q) for q in questions])
+
+
+@slotted
+class InboxContact(Record):
+    """One set of applicant details found in an inbox reply (see contact_extract), with the UID of the message.
+    """
+    columns: ClassVar[list] = ['Name', 'Phone Number', 'Email', 'Age', 'Agent']
+    labels: ClassVar[dict] = {'Name': 'name', 'Phone Number': 'phone', 'Email': 'email', 'Age': 'age',
+                              'Agent': 'agent'}  # extracted field -> attribute
+
+    uid: int
+    name: str = None
+    phone: str = None
+    email: str = None
+    age: str = None
+    agent: str = None
+
+    @classmethod
+    def from_details(cls, uid: int, details: dict):
+        """Builds a record from {field: value} as extracted. Raises ValueError for a field with no attribute here (e.g.
+        one registered with the extractor but not added to this class).
+        """
+        unknown = set(details) - set(cls.labels)
+        if unknown:
+            raise ValueError(f"No InboxContact attribute for extracted field(s): {', '.join(sorted(unknown))}")
+
+        return cls(uid, **{cls.labels[f]: value for f, value in details.items()})
+
+    def row(self) -> list:
+        return [self.name, self.phone, self.email, self.age, self.agent]
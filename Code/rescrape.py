@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""Incremental re-scraping of the same shortlist/applicant list: a page cache that lets pages unchanged since the last
+run skip parsing, and merging of a fresh scrape into the previous output that keeps hand-filled columns (CONTACT?,
+self tapes...) and logs what was added, changed and removed."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import datetime
+import threading
+import user_dirs
+from collections import Counter
+from dataclasses import asdict, fields
+from table_io import CSVSink, read_table
+
+## Variables ##
+cache_path = os.path.join(user_dirs.cache_dir, 'page_cache.sqlite')  # scraped pages, so not in the repository
+
+schema = """
+CREATE TABLE IF NOT EXISTS pages (
+    source TEXT NOT NULL,       -- 'spotlight' or 'starnow'
+    url TEXT NOT NULL,          -- page URL (or shortlist URL and page number)
+    hash TEXT NOT NULL,         -- hash of the page content (see page_hash)
+    records TEXT NOT NULL,      -- records parsed from it, as JSON
+    seen REAL NOT NULL,         -- seconds since epoch
+    PRIMARY KEY (source, url)
+);
+"""
+
+# Parts of a page that change on every load without its content changing: anti-forgery tokens, script nonces...
+volatile_re = re.compile(rb'<input\b[^>]*\btype=["\']?hidden\b[^>]*>|\bnonce=["\'][^"\']*["\']'
+                         rb'|<meta\b[^>]*\bname=["\']csrf[^>]*>', re.IGNORECASE)
+
+
+## Classes ##
+class PageCache:
+    """Records parsed from each page of one source at the last run, with a hash of the page they came from. parse()
+    only parses a page if its hash has changed, so re-scraping a list where little has changed costs little more than
+    fetching it. Keeps one entry per page URL (the latest). Safe to share between fetching threads.
+    The parser's 'version' and the record class's fields go into the hash, so bumping the version when the parser is
+    fixed (or changing the record class) means pages cached by the old one are parsed again.
+    """
+
+    def __init__(self, source: str, cls, path: str = cache_path, version: int = 1):
+        self.source = source
+        self.cls = cls  # record class (see records)
+        self.version = f"{version}:{','.join(f.name for f in fields(cls))}"
+        self.hits = self.misses = 0
+
+        self._conn = sqlite3.connect(user_dirs.private_path(path), check_same_thread=False)
+        self._conn.executescript(schema)
+        self._lock = threading.Lock()
+
+    def parse(self, url: str, page, parse) -> list:
+        """Records on a page ('page' is its content, str or bytes): those cached for this URL if the content is
+        unchanged, else parse(page), which are then cached.
+        """
+        digest = page_hash(page, self.version)
+
+        with self._lock:
+            row = self._conn.execute("SELECT hash, records FROM pages WHERE source = ? AND url = ?",
+                                     (self.source, url)).fetchone()
+            if row and row[0] == digest:
+                self.hits += 1
+                with self._conn:
+                    self._conn.execute("UPDATE pages SET seen = ? WHERE source = ? AND url = ?",
+                                       (time.time(), self.source, url))
+                return [self.cls(**r) for r in json.loads(row[1])]
+
+        records = parse(page)
+
+        with self._lock:
+            self.misses += 1
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                                   (self.source, url, digest, json.dumps([asdict(r) for r in records]), time.time()))
+
+        return records
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OutputMerge:
+    """Merges a fresh scrape of one list into its previous output (a DataFrame read with dtype=str, or None if there
+    wasn't one), one row at a time. Rows are matched on the 'key' columns; a matched row gets the scraped values with
+    its 'manual' columns (filled in by hand, which the scraper leaves empty) carried over from the previous output, as
+    are any columns added to the previous output by hand. Rows sharing a key (e.g. two performers with the same name
+    and agent) are paired up in order, the first scraped with the first previous one and so on. Keeps track of the rows
+    added, changed and (see removed()) no longer there, including any left over from a group sharing a key.
+    """
+
+    def __init__(self, previous, columns: list, key: list, manual: list):
+        self.scraped = list(columns)
+        self.key = key
+        extra = [c for c in previous.columns if c not in columns and not str(c).startswith('Unnamed')] \
+            if previous is not None else []
+        self.columns = self.scraped + extra
+        self.manual = [c for c in manual if c in columns] + extra
+
+        self._previous = {}  # key -> previous rows with it, in order
+        for r in previous.to_dict('records') if previous is not None else []:
+            self._previous.setdefault(self._key(r), []).append(r)
+        self._matched = Counter()  # key -> number of previous rows with it matched so far
+        self.added, self.changed = [], []
+
+    def _key(self, row: dict) -> tuple:
+        return tuple(str(row.get(c) or '').strip().lower() for c in self.key)
+
+    def row(self, values: list) -> list:
+        """Output row for one scraped row ('values' in the order of the scraped columns).
+        """
+        new = dict(zip(self.scraped, values))
+        key = self._key(new)
+        rows = self._previous.get(key, [])
+        old = rows[self._matched[key]] if self._matched[key] < len(rows) else None
+        self._matched[key] += 1
+
+        if old is None:
+            self.added.append(new)
+        else:
+            for column in self.manual:
+                new[column] = old.get(column) if old.get(column) != '' else None
+            changes = {c: (old.get(c), new[c]) for c in self.scraped if c not in self.manual
+                       and str(old.get(c) or '') != str('' if new[c] is None else new[c])}
+            if changes:
+                self.changed.append((new, changes))
+
+        return [new.get(c) for c in self.columns]
+
+    def removed(self) -> list:
+        """Previous rows (as dicts) not scraped this time.
+        """
+        return [row for key, rows in self._previous.items() for row in rows[self._matched[key]:]]
+
+    def report(self, path: str, list_name: str) -> int:
+        """Appends this run's changes to the CSV change log at 'path' (one line per row added, changed or removed, with
+        the key columns and what changed, or for a removed row, what had been filled in by hand). Returns the number
+        of changes.
+        """
+        run = datetime.datetime.now().isoformat(timespec='seconds')
+        lines = [('added', row, '') for row in self.added]
+        lines += [('changed', row, '; '.join(f'{c}: {a or ""} -> {"" if b is None else b}'
+                                             for c, (a, b) in changes.items())) for row, changes in self.changed]
+        lines += [('removed', row, '; '.join(f'{c}: {row[c]}' for c in self.manual if row.get(c)))
+                  for row in self.removed()]
+
+        with CSVSink(path, ['RUN', 'LIST', 'CHANGE'] + self.key + ['DETAILS'], append=True) as log:
+            for change, row, details in lines:
+                log.append([run, list_name, change] + [row.get(c) for c in self.key] + [details])
+
+        return len(lines)
+
+    def summary(self) -> str:
+        return f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed())} removed"
+
+
+## Functions ##
+def page_hash(page, version: str = '') -> str:
+    """Hash of a page's content (and the version of the parser it is for), ignoring parts that change on every load
+    (see volatile_re).
+    """
+    if isinstance(page, str):
+        page = page.encode('utf-8', errors='replace')
+
+    h = hashlib.blake2b(version.encode() + b'\0', digest_size=16)
+    h.update(volatile_re.sub(b'', page))
+
+    return h.hexdigest()
+
+
+def read_previous(outfile: str) -> dict:
+    """The previous version of an output file, as {sheet name: DataFrame of strings} (one sheet, named None, for a CSV
+    or Parquet file), or {} if there isn't one.
+    """
+    if not os.path.exists(outfile):
+        return {}
+    if outfile.endswith('.parquet'):
+        return {None: read_table(outfile).fillna('')}
+    if outfile.endswith('.csv'):
+        return {None: read_table(outfile, dtype=str, keep_default_na=False)}
+    return read_table(outfile, sheet_name=None, dtype=str, keep_default_na=False)
+
+
+def changes_path(outfile: str) -> str:
+    """Path of the change log kept next to an output file, e.g. 'Shortlist.xlsx' -> 'Shortlist.changes.csv'.
+    """
+    return os.path.splitext(outfile)[0] + '.changes.csv'
+
+
+def temp_path(outfile: str) -> str:
+    """Path to write a new version of an output file to before it replaces the old one (same extension, so the same
+    kind of sink is used).
+    """
+    root, ext = os.path.splitext(outfile)
+    return f'{root}.tmp{ext}'
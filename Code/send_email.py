@@ -7,12 +7,17 @@ __version__ = '0.0.1'
 
 ## Imports ##
 import os
-import pandas as pd
 import argparse
 import tkinter as tk
 from tkinter import filedialog
 import core  # import custom module
 from core import CustomizedSMPTSession
+from smtp_pool import SMTPSessionPool, send_campaign
+from rate_limit import ProviderRateLimiter
+from outbox import Outbox, spool_campaign
+from send_journal import SendJournal
+from contact_store import ContactStore, store_path
+from table_io import read_table
 import warnings
 
 # TODO:
@@ -37,18 +42,40 @@ def parse_args():
                              "omitted, then only the agents with any contents in this field will be contacted.")
     parser.add_argument('--ghost', dest='ghost', action='store_true',
                         help="If flag included will not log email")
+    parser.add_argument('--resend', dest='resend', action='store_true',
+                        help="If flag included, addresses already sent an email with this subject (according to the "
+                             "send journal) are emailed again rather than skipped.")
+    parser.add_argument('-w', dest='workers', type=int, default=4,
+                        help="Maximum number of SMTP connections to send over at once.")
+    parser.add_argument('-s', dest='spool', default=None,
+                        help="Outbox spool directory. If given, emails are rendered into it by a pool of processes "
+                             "while they are sent, and re-running with the same spool resumes an interrupted run "
+                             "without re-sending emails that already went out.")
+    parser.add_argument('--store', dest='store', action='store_true',
+                        help="Take the recipients from the contact store (filled by the scrapers) rather than a "
+                             "spreadsheet. Use -l, --source and --days to choose which.")
+    parser.add_argument('-l', dest='list_name', default=None,
+                        help="With --store, only contact those scraped from this list (shortlist, casting URL or "
+                             "email subject).")
+    parser.add_argument('--source', dest='source', default=None, choices=['spotlight', 'starnow', 'email'],
+                        help="With --store, only contact those found by this scraper.")
+    parser.add_argument('--days', dest='days', type=float, default=None,
+                        help="With --store, leave out addresses already contacted in the last DAYS days.")
 
     args = parser.parse_args()
 
     # Parse paths to input files
     print('\nPLEASE FILL THE FOLLOWING:\n')
 
-    excel_prompt = 'Press ENTER to find and select Excel spreadsheet: '
-    input(excel_prompt)
     root = tk.Tk()  # Initialise dialog box
     root.withdraw()
-    data = filedialog.askopenfilename()
-    print(' '*len(excel_prompt) + '\033[A' + os.path.basename(data))
+    if args.store:
+        data = None
+    else:
+        excel_prompt = 'Press ENTER to find and select Excel spreadsheet: '
+        input(excel_prompt)
+        data = filedialog.askopenfilename()
+        print(' '*len(excel_prompt) + '\033[A' + os.path.basename(data))
 
     text_prompt = 'Press ENTER to find and select email template .txt file: '
     input(text_prompt)
@@ -82,7 +109,8 @@ def parse_args():
     usn = input(f"Sender {args.provider.title()} Email Address: ")
     pwd = core.fetch_password(args.provider, usn)  # Obtain keyring from keychain. Set it if absent
 
-    return args.provider, data, usn, pwd, subject, text, docs_to_add, sign, args.all, preview, args.ghost
+    return (args.provider, data, usn, pwd, subject, text, docs_to_add, sign, args.all, preview, args.ghost,
+            args.workers, args.spool, args.resend, args.list_name, args.source, args.days)
 
 
 def create_name_string(names: list) -> str:
@@ -102,20 +130,33 @@ def create_name_string(names: list) -> str:
 
 def main(provider: str, data: str, from_address: str, password: str,
          subject: str, text_path: str, docs_to_add: list,
-         sign: bool, all: bool = False, preview: bool = True, ghost: bool = False):
+         sign: bool, all: bool = False, preview: bool = True, ghost: bool = False, workers: int = 4,
+         spool: str = None, resend: bool = False, list_name: str = None, source: str = None, days: float = None,
+         store: str = store_path):
     """
-    Function that sends email to a load of addresses, replacing '-' with their names
+    Function that sends email to a load of addresses, replacing '-' with their names. If 'data' is None, the addresses
+    are taken from the contact store instead of a spreadsheet: those from list 'list_name' and/or scraper 'source' (all
+    if neither is given), less any contacted in the last 'days' days. Addresses emailed are marked as contacted in the
+    store (unless 'store' is None or 'ghost' is True).
     """
+    contacts = ContactStore(store) if store else None
+
     # Read data
-    df = pd.read_excel(data, keep_default_na=False)
+    if data is None:
+        groups = contacts.recipients(list_name, source, days)
+        print(f"{len(groups)} addresses found in the contact store.")
+    else:
+        df = read_table(data, keep_default_na=False)  # cached after the first read of this version of the file
 
-    if not all:
-        # If --all flag omitted, then if CONTACT? col used then subset df accordingly, otherwise exit and notify user
-        if any(df['CONTACT?']):
-            df = df.loc[df['CONTACT?'].astype(bool)]  # subset only those you wish to contact
-        else:
-            raise Exception("Nothing found in the 'CONTACT?' column and --all flag not used. "
-                            "Please use one or the other.")
+        if not all:
+            # If --all flag omitted, then if CONTACT? col used then subset df accordingly, otherwise exit and notify
+            if any(df['CONTACT?']):
+                df = df.loc[df['CONTACT?'].astype(bool)]  # subset only those you wish to contact
+            else:
+                raise Exception("Nothing found in the 'CONTACT?' column and --all flag not used. "
+                                "Please use one or the other.")
+
+        groups = [(to_address, list(group.NAME)) for to_address, group in df.groupby('EMAIL')]
 
     # Login to email account
     host = core.providers[provider]
@@ -130,22 +171,49 @@ def main(provider: str, data: str, from_address: str, password: str,
     print('\nMAILING AGENCIES...')
 
     with open(text_path) as email:
-        msg_template = email.read()  # Open text file and extract email template
-
-    for to_address, group in df.groupby('EMAIL'):
-
-        names = list(group.NAME)
-
-        if len(names) == 0:
-            print(f"WARNING: No names provided for {to_address}. Skipping...")
-            continue  # move on to next address/group
-
-        n_string = create_name_string(names)
-
-        print(f'Mailing {to_address} regarding {n_string}...')
-        session.send_email(msg_template, subject, from_address, to_address, n_string, docs_to_add, sign, ghost)
+        msg_template = core.EmailTemplate(email.read(), sign)  # Open text file and compile email template once
+
+    # Each email is recorded in the journal as soon as it is sent, so a re-run after an interruption skips every
+    # address already emailed
+    with SendJournal() as journal:
+        recipients = []
+        for to_address, names in groups:
+
+            if len(names) == 0:
+                print(f"WARNING: No names provided for {to_address}. Skipping...")
+                continue  # move on to next address/group
+
+            if not resend and journal.already_sent(to_address, subject):
+                print(f"{to_address} has already been sent this email. Skipping...")
+                continue
+
+            recipients.append((to_address, create_name_string(names)))
+
+        # Send over a pool of connections, starting with the one already logged in, paced to the provider's limits
+        limiter = ProviderRateLimiter.for_provider(provider,
+                                                   sent_today=journal.count_since(from_address, 24 * 60 * 60))
+        pool = SMTPSessionPool(host, from_address, password, size=workers, sessions=[session], limiter=limiter)
+        try:
+            if spool:
+                failed = spool_campaign(pool, Outbox(spool), msg_template, subject, recipients, docs_to_add, ghost,
+                                        journal=journal)
+            else:
+                failed = send_campaign(pool, msg_template, subject, recipients, docs_to_add, sign, ghost,
+                                       journal=journal)
+        finally:
+            pool.close()
+
+    if contacts:
+        if not ghost:
+            unsent = {to_address for to_address, _, _ in failed}
+            contacts.mark_contacted([to_address for to_address, _ in recipients if to_address not in unsent])
+        contacts.close()
+
+    if failed:
+        print(f"\nWARNING: {len(failed)} email(s) could not be sent:")
+        for to_address, n_string, e in failed:
+            print(f" - {to_address} ({n_string})")
 
-    session.quit()
     print('\nDone!')
 
     return
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""Structured journal of sent emails, kept in an SQLite database."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import time
+import sqlite3
+import threading
+import user_dirs
+
+## Variables ##
+journal_path = os.path.join(user_dirs.data_dir, 'email_journal.sqlite')  # addresses, so not in the repository
+
+schema = """
+CREATE TABLE IF NOT EXISTS sends (
+    message_id TEXT PRIMARY KEY,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    names TEXT,
+    subject TEXT,
+    sent_at REAL NOT NULL,      -- seconds since epoch
+    latency REAL,               -- seconds taken to send
+    response TEXT               -- SMTP reply to the message data
+);
+CREATE INDEX IF NOT EXISTS sends_recipient_subject ON sends (recipient, subject);
+CREATE INDEX IF NOT EXISTS sends_sender_time ON sends (sender, sent_at);
+"""
+
+
+## Classes ##
+class SendJournal:
+    """Append-only journal of sent emails, looked up by recipient and subject to skip those already sent on a re-run.
+    Each record is committed as soon as it is added, not buffered: an email sent but not yet recorded would be sent
+    again by a re-run after a crash or kill (see send_email's --resend), and with WAL a commit per email costs far less
+    than sending it. Safe to share between sender threads.
+    """
+
+    def __init__(self, path: str = journal_path):
+        self.path = path
+
+        self._conn = sqlite3.connect(user_dirs.private_path(path), check_same_thread=False)
+        self._conn.executescript(schema)
+        self._conn.execute("PRAGMA journal_mode = WAL")  # a commit per record without a full sync each time
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._lock = threading.Lock()
+
+    def record(self, message_id: str, sender: str, recipient: str, names: str, subject: str,
+               latency: float = None, response: str = None):
+        """Adds a sent email to the journal, committing it at once.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sends VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (message_id, sender, recipient, names, subject, time.time(), latency, response))
+
+    def already_sent(self, recipient: str, subject: str) -> bool:
+        """Returns True if an email with this subject has already been sent to this recipient.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM sends WHERE recipient = ? AND subject = ? LIMIT 1",
+                                     (recipient, subject)).fetchone()
+
+        return row is not None
+
+    def count_since(self, sender: str, seconds: float) -> int:
+        """Number of emails sent from this address in the last 'seconds' seconds.
+        """
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM sends WHERE sender = ? AND sent_at >= ?",
+                                          (sender, time.time() - seconds)).fetchone()
+
+        return count
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""Pool of authenticated SMTP sessions for sending a campaign over several connections at once."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import queue
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core import CustomizedSMPTSession
+from rate_limit import DailyLimitReached
+
+
+## Classes ##
+class SMTPSessionPool:
+    """Keeps up to 'size' logged-in CustomizedSMPTSession connections to one server, opening them as they are needed
+    and replacing any that drop mid-campaign. If given a rate limiter (see rate_limit.ProviderRateLimiter), sends are
+    paced by it and the pool is kept within its connection limit.
+    """
+
+    def __init__(self, host: str, from_address: str, password: str, size: int = 4, port: int = 587,
+                 sessions: list = None, limiter=None):
+        self.host = host
+        self.port = port
+        self.from_address = from_address
+        self.password = password
+        self.limiter = limiter
+        self.size = max(1, min(size, limiter.connections) if limiter else size)
+
+        self._idle = queue.LifoQueue()  # most recently used first, so spare connections are left to time out
+        self._lock = threading.Lock()
+        self._opened = 0
+
+        for session in sessions or []:
+            self._idle.put(session)  # re-use sessions that are already logged in (e.g. the preview session)
+            self._opened += 1
+
+    def connect(self):
+        """Opens a new authenticated session. Credentials are assumed to have been checked already, so this does not
+        prompt for new ones.
+        """
+        session = CustomizedSMPTSession(self.host, self.port)
+        session.login(self.from_address, self.password)
+
+        return session
+
+    def acquire(self):
+        """Takes an idle session from the pool, opening a new one if under the size limit, else waiting for one.
+        Returns (session, True if it was opened just now).
+        """
+        try:
+            return self._idle.get_nowait(), False
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            grow = self._opened < self.size
+            if grow:
+                self._opened += 1
+
+        if not grow:
+            return self._idle.get(), False
+
+        try:
+            return self.connect(), True
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def release(self, session):
+        """Returns a session to the pool.
+        """
+        self._idle.put(session)
+
+    def reconnect(self, session):
+        """Replaces a dropped session with a fresh one.
+        """
+        try:
+            session.close()
+        except Exception:
+            pass  # already gone
+
+        return self.connect()
+
+    def send_email(self, *args, **kwargs):
+        """Sends an email (see CustomizedSMPTSession.send_email) over a pooled session.
+        """
+        return self.send('send_email', *args, **kwargs)
+
+    def send_raw(self, *args, **kwargs):
+        """Sends a serialized email (see CustomizedSMPTSession.send_raw) over a pooled session.
+        """
+        return self.send('send_raw', *args, **kwargs)
+
+    def send(self, method: str, *args, retries: int = 3, **kwargs):
+        """Calls a CustomizedSMPTSession send method on a pooled session, reconnecting and retrying if the session has
+        dropped or the server temporarily refuses the message. Only temporary refusals slow the rate limiter down: a
+        pooled session found to have dropped while it sat idle (closed, or refused with 421 on its first use in this
+        call) is just replaced.
+        """
+        session, fresh = self.acquire()
+
+        try:
+            for attempt in range(retries + 1):
+                if self.limiter:
+                    self.limiter.acquire()
+
+                try:
+                    result = getattr(session, method)(*args, **kwargs)
+                except smtplib.SMTPException as e:
+                    dropped = dropped_session(e)
+                    if not (dropped or temporary_failure(e)) or attempt == retries:
+                        raise
+
+                    expired = dropped and attempt == 0 and not fresh and getattr(e, 'smtp_code', 421) == 421
+                    if self.limiter and temporary_failure(e) and not expired:
+                        self.limiter.throttled()  # back off before retrying
+                    elif self.limiter:
+                        self.limiter.refund()  # closed while idle: nothing to back off from
+                    if dropped:
+                        try:
+                            session, fresh = self.reconnect(session), True  # If session times out then re-create it
+                        except Exception:
+                            session = None  # closed, so not returned to the pool: a later send can open another
+                            with self._lock:
+                                self._opened -= 1
+                            raise
+                    continue
+
+                if self.limiter:
+                    self.limiter.success()
+
+                return result
+        finally:
+            if session is not None:
+                self.release(session)
+
+    def close(self):
+        """Logs out of all idle sessions.
+        """
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                session.quit()
+            except smtplib.SMTPException:
+                session.close()
+
+            with self._lock:
+                self._opened -= 1
+
+        return
+
+
+## Functions ##
+def temporary_failure(error):
+    """Returns True if an SMTP error is a temporary (4xx) rejection, e.g. a provider throttling the sender.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+
+    return isinstance(error, smtplib.SMTPResponseException) and 400 <= error.smtp_code < 500
+
+
+def dropped_session(error):
+    """Returns True if an SMTP error means the session needs re-creating: it timed out or was closed by the server
+    (421), or the server temporarily refused the sender, as some do once a session has been open too long. Permanent
+    (5xx) rejections of the sender are not retried.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPSenderRefused):
+        return 400 <= error.smtp_code < 500
+
+    return getattr(error, 'smtp_code', None) == 421
+
+
+def send_campaign(pool: SMTPSessionPool, msg_template, subject: str, recipients: list,
+                  docs_to_add: list = None, sign: bool = False, ghost: bool = False, journal=None):
+    """Sends a templated email to each (to_address, names) pair in 'recipients' over the pooled sessions, using one
+    worker thread per pooled connection, recording them in the send journal if given one. Progress is reported in
+    recipient order. Returns a list of (to_address, names, error) tuples for any emails that could not be sent.
+    """
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = [executor.submit(pool.send_email, msg_template, subject, pool.from_address, to_address, names,
+                                   docs_to_add, sign, ghost, journal=journal)
+                   for to_address, names in recipients]
+
+        for i, ((to_address, names), future) in enumerate(zip(recipients, futures), 1):
+            try:
+                future.result()
+                print(f'[{i}/{len(recipients)}] Mailed {to_address} regarding {names}.')
+            except (smtplib.SMTPException, OSError, DailyLimitReached) as e:
+                print(f'[{i}/{len(recipients)}] FAILED to mail {to_address} regarding {names}: {e}')
+                failed.append((to_address, names, e))
+
+    return failed
@@ -9,22 +9,371 @@ __version__ = '0.0.1'
 ## Imports ##
 import re
 import os
-import pandas as pd
 import subprocess
 import argparse
 import sys
 import time
+import threading
+import itertools
 import tkinter as tk
 from tkinter import filedialog
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.service import Service
+from html.parser import HTMLParser
 from core import yes_no, fetch_password
+from contact_store import ContactStore, store_path
+from table_io import open_sink, ExcelSink, extensions
+from records import SpotlightContact
+from rescrape import PageCache, OutputMerge, cache_path, read_previous, changes_path, temp_path
+
+## Variables ##
+columns = SpotlightContact.columns
+parser_version = 1  # bump when parsing changes, so pages in the page cache are parsed again
+card_locator = (By.CLASS_NAME, "c-agency__card-agency-name")  # one per performer card
+pagination_locator = (By.CLASS_NAME, "c-pagination-control")
+next_page_locator = (By.CLASS_NAME, "c-pagination-control__arrow-icon.icon-chevronright")
+blocked_assets = ['*.css', '*.woff', '*.woff2', '*.ttf', '*.otf', '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp',
+                  '*.svg', '*.ico']  # not needed to read the shortlist
+
+
+## Classes ##
+class PagingFailed(Exception):
+    """Raised when pages fetched over HTTP can't be right: page 1 doesn't match what the browser shows, or a page
+    that should have performers on it is empty or repeats the one before.
+    """
+
+
+class ShortlistPageParser(HTMLParser):
+    """Parses one page of a shortlist into a list of cards, each a dict of NAME, AGENT, CONTACT NUMBER and EMAIL. A card
+    starts at each performer's headshot (an <img> with alt text, the performer's name) and takes the first agency name,
+    tel:// link and mailto: link that follow it, up to the next headshot. A field missing from a card is left empty
+    rather than taken from the next card. Images that aren't followed by any agency details (logos etc.) are dropped.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.cards = []
+        self._card = None
+        self._in_agency = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        self._in_agency = False  # the agency name is the text up to the next tag
+
+        if tag == 'img' and (attrs.get('alt') or '').strip():
+            self._close_card()
+            self._card = {'NAME': attrs['alt'].strip(), 'AGENT': '', 'CONTACT NUMBER': '', 'EMAIL': ''}
+            return
+
+        if self._card is None:
+            return
+
+        if 'c-agency__card-agency-name' in (attrs.get('class') or '').split():
+            self._in_agency = not self._card['AGENT']
+        elif tag == 'a':
+            href = (attrs.get('href') or '').strip()
+            if href.startswith('tel:') and not self._card['CONTACT NUMBER']:
+                self._card['CONTACT NUMBER'] = href[len('tel:'):].lstrip('/')
+            elif href.startswith('mailto:') and not self._card['EMAIL']:
+                self._card['EMAIL'] = href[len('mailto:'):].split('?')[0]
+
+    def handle_endtag(self, tag):
+        self._in_agency = False
+
+    def handle_data(self, data):
+        if self._in_agency:
+            self._card['AGENT'] += data
+
+    def _close_card(self):
+        if self._card and (self._card['AGENT'] or self._card['CONTACT NUMBER'] or self._card['EMAIL']):
+            self.cards.append(self._card)
+        self._card = None
+        self._in_agency = False
+
+    def close(self):
+        super().close()
+        self._close_card()
+
+
+class cards_settled:
+    """Expected condition (for WebDriverWait) that the page's performer cards have finished rendering: the number of
+    cards has stayed the same for 'settle' seconds. Must be polled (WebDriverWait's default poll is 0.5s).
+    """
+
+    def __init__(self, settle: float = 0.5):
+        self.settle = settle
+        self._count = None
+        self._since = None
+
+    def __call__(self, driver):
+        count = len(driver.find_elements(*card_locator))
+        now = time.monotonic()
+
+        if count != self._count:
+            self._count, self._since = count, now
+            return False
+
+        return now - self._since >= self.settle
+
+
+class pagination_changed:
+    """Expected condition that the pagination control no longer reads as it did on the previous page.
+    """
+
+    def __init__(self, old_text: str):
+        self.old_text = old_text
+
+    def __call__(self, driver):
+        controls = driver.find_elements(*pagination_locator)
+        return bool(controls) and controls[0].text != self.old_text
+
 
 ## Functions ##
+def pagination_text(driver):
+    """Current text of the pagination control ('' if there is none).
+    """
+    controls = driver.find_elements(*pagination_locator)
+    return controls[0].text if controls else ''
+
+
+def wait_for_page(driver, timeout: float, old_card=None, old_pagination: str = None, settle: float = 0.5):
+    """Waits up to 'timeout' seconds for a page of the shortlist to be ready: loaded ('Radio-Signal' present), the
+    previous page's cards gone stale and its pagination control changed (if given them), and the card count stable
+    for 'settle' seconds. Raises TimeoutException if it isn't.
+    """
+    conditions = [EC.presence_of_element_located((By.ID, "Radio-Signal"))]
+    if old_card is not None:
+        conditions.append(EC.staleness_of(old_card))
+    if old_pagination is not None:
+        conditions.append(pagination_changed(old_pagination))
+    conditions.append(cards_settled(settle))
+
+    deadline = time.monotonic() + timeout
+
+    for condition in conditions:
+        WebDriverWait(driver, max(0, deadline - time.monotonic()), poll_frequency=0.1).until(condition)
+
+    return
+
+
+def next_page(driver, timeout: float, retries: int, settle: float = 0.5):
+    """Clicks through to the next page of the shortlist and waits for it (see wait_for_page). If it isn't ready in
+    time the wait is retried, clicking again if the old page is still showing, up to 'retries' times. Returns False if
+    the page never changed.
+    """
+    cards = driver.find_elements(*card_locator)
+    old_card = cards[0] if cards else None
+    old_pagination = pagination_text(driver)
+
+    def changed():
+        stale = old_card is not None and EC.staleness_of(old_card)(driver)
+        return stale or pagination_changed(old_pagination)(driver)
+
+    for attempt in range(retries + 1):
+        if attempt == 0 or not changed():
+            # Clicked by script, as without stylesheets the arrow icon may have no size to click on
+            driver.execute_script("arguments[0].click();", driver.find_elements(*next_page_locator)[0])
+
+        try:
+            wait_for_page(driver, timeout, old_card, old_pagination, settle)
+            return True
+        except TimeoutException:
+            print(f"Next page not ready after {timeout}s (attempt {attempt + 1}/{retries + 1}).")
+
+    return changed()  # changed but not settled: take what's there
+
+
+def chrome_driver(headless: bool = False, block_assets: bool = False):
+    """Starts Chrome (with ./chromedriver), optionally headless and/or without loading images, fonts and stylesheets.
+    """
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless')
+        options.add_argument('--window-size=1920,1080')
+    if block_assets:
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+    driver = webdriver.Chrome(service=Service('./chromedriver'), options=options)
+
+    if block_assets:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_assets})
+
+    return driver
+
+
+def open_shortlist(driver, url: str, usn_field: str, usn: str, pwd_field: str, pwd: str, timeout: float = 30,
+                   settle: float = 0.5):
+    """Loads a shortlist, signing in first if the site asks (i.e. only on a driver's first shortlist), and waits for it
+    to be ready (see wait_for_page). Raises TimeoutException if it doesn't load.
+    """
+    driver.implicitly_wait(0)  # lookups in the page waits must not block while elements are absent
+    driver.get(url)  # load webpage
+
+    # Either the login form or the shortlist itself
+    WebDriverWait(driver, timeout).until(EC.any_of(EC.presence_of_element_located((By.ID, usn_field)),
+                                                   EC.presence_of_element_located((By.ID, "Radio-Signal"))))
+
+    if driver.find_elements(By.ID, usn_field):
+        # Login details
+        driver.find_element(By.ID, usn_field).send_keys(usn)
+        driver.find_element(By.ID, pwd_field).send_keys(pwd)
+        driver.find_element(By.ID, "sign-in-button").click()  # Sign in
+
+    wait_for_page(driver, timeout, settle=settle)
+
+    return
+
+
+def shortlist_pages(driver, url: str, login: tuple, timeout: float = 30, retries: int = 2, settle: float = 0.5,
+                    http: bool = False, workers: int = 4, cache: PageCache = None):
+    """Opens a shortlist on a driver ('login' is (usn_field, usn, pwd_field, pwd)) and yields (rows, seconds taken to
+    load) for each of its pages, either clicking through them in the browser or, if 'http' is True, fetching them over
+    HTTP with the browser's cookies, 'workers' at a time. Pages unchanged since they were put in 'cache' aren't parsed
+    again (see parse_cached).
+    """
+    open_shortlist(driver, url, *login, timeout, settle)
+
+    if http:
+        # The browser's own parse of page 1 is what the first page fetched over HTTP has to match
+        session = http_session(driver, workers, retries)
+        yield from fetch_pages(session, driver.current_url, page_count(pagination_text(driver)), workers, timeout,
+                               cache=cache, first=parse_page(driver.page_source))
+    else:
+        yield from browse_pages(driver, timeout, retries, settle, cache)
+
+
+def shortlist_name(url: str, i: int) -> str:
+    """Sheet name for the i-th shortlist: the last part of its URL path, e.g. '.../shortlist/12345' -> '12345'.
+    """
+    name = urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1] or f'Shortlist {i}'
+    return re.sub(r'[\[\]:*?/\\]', '', name)[:28]  # characters and length allowed in Excel sheet names
+
+
+def sheet_shortlist(sheet: str) -> str:
+    """Shortlist name of a sheet named by main, e.g. '3 12345' -> '12345' (whichever position it was scraped in).
+    """
+    return re.sub(r'^\d+ ', '', str(sheet))
+
+
+def browse_pages(driver, timeout: float = 30, retries: int = 2, settle: float = 0.5, cache: PageCache = None):
+    """Clicks through every page of the shortlist in the browser, parsing each one as it loads. Yields (rows, seconds
+    taken to load) for each page.
+    """
+    start = time.monotonic()
+    url = driver.current_url
+
+    for page in itertools.count(1):
+        yield parse_cached(cache, page_url(url, page), driver.page_source), time.monotonic() - start
+
+        if not driver.find_elements(*next_page_locator):
+            return
+
+        start = time.monotonic()
+        if not next_page(driver, timeout, retries, settle):
+            print(f"Next page failed to load after {retries + 1} attempts. Stopping here.")
+            return
+
+
+def http_session(driver, workers: int = 4, retries: int = 2):
+    """HTTP session carrying the logged-in browser's cookies and user agent, with a connection pool big enough for
+    'workers' concurrent requests. Failed requests (connection errors, 429 and 5xx) are retried with back-off.
+    """
+    session = requests.Session()
+    session.headers['User-Agent'] = driver.execute_script("return navigator.userAgent")
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def page_url(url: str, page: int, param: str = 'page') -> str:
+    """URL of one page of a shortlist, i.e. the shortlist URL with its page query parameter set.
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != param] + [(param, str(page))]
+
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def page_count(pagination: str):
+    """Number of pages, read from the text of the pagination control ('Page 1 of 12' -> 12), or None if it doesn't
+    say (in which case pages are fetched until one is empty, see fetch_pages).
+    """
+    m = re.search(r'\bof\s+(\d+)\b', pagination, re.IGNORECASE)
+    return int(m.group(1)) if m else None
+
+
+def fetch_pages(session, url: str, pages: int = None, workers: int = 4, timeout: float = 30, param: str = 'page',
+                cache: PageCache = None, first: list = None):
+    """Fetches pages of a shortlist over plain HTTP with 'workers' concurrent requests, parsing each one as it arrives
+    (see parse_page). If the number of pages isn't known, pages are fetched 'workers' at a time until one has no
+    cards. Yields (rows, seconds taken to fetch) for each page, in page order.
+    Raises PagingFailed if page 1 doesn't have the performers in 'first' (the browser's parse of it, if given: a site
+    that renders its cards with JavaScript or pages with something other than 'param' gives something else over HTTP),
+    or if a page within 'pages' is empty or the same as the page before.
+    """
+    def fetch(page):
+        start = time.monotonic()
+        response = session.get(page_url(url, page, param), timeout=timeout)
+        response.raise_for_status()
+        return parse_cached(cache, response.url, response.text), time.monotonic() - start
+
+    def check(page, rows, last):
+        if page == 1 and first is not None and [(r.name, r.agent) for r in rows] != [(r.name, r.agent) for r in first]:
+            raise PagingFailed(f"Page 1 fetched over HTTP ({len(rows)} performers) doesn't match the browser's "
+                               f"({len(first)}). The site may not work without the browser: run without --http.")
+        if pages and page > 1 and (not rows or rows == last):
+            raise PagingFailed(f"Page {page} of {pages} fetched over HTTP is {'empty' if not rows else 'a repeat'}. "
+                               f"The site may not page with '{param}=': run without --http.")
+
+    # All the pages at once if the number is known, else 'workers' at a time
+    batches = [range(1, pages + 1)] if pages else (range(n, n + workers) for n in itertools.count(1, workers))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        last = None
+        for numbers in batches:
+            for page, (rows, seconds) in zip(numbers, executor.map(fetch, numbers)):
+                check(page, rows, last)
+                if rows and rows == last:
+                    print(f"Page {page} is the same as page {page - 1}: taking page {page - 1} as the last.")
+                if not rows or rows == last:
+                    return  # past the end (some sites serve the last page again for any higher page number)
+                yield rows, seconds
+                last = rows
+
+
+def parse_page(source):
+    """Parses one page of a shortlist into SpotlightContact records (see ShortlistPageParser), with names title-cased
+    and contact numbers reduced to digits.
+    """
+    parser = ShortlistPageParser()
+    parser.feed(source)
+    parser.close()
+
+    return [SpotlightContact(card['NAME'].title(), card['AGENT'].strip(), re.sub(r'\D+', '', card['CONTACT NUMBER']),
+                             card['EMAIL']) for card in parser.cards]
+
+
+def parse_cached(cache: PageCache, url: str, source: str) -> list:
+    """Parses a page (see parse_page), or takes its records from the page cache if it is unchanged since last time.
+    """
+    return cache.parse(url, source, parse_page) if cache else parse_page(source)
+
 
 def parse_args():
     """
@@ -41,6 +390,46 @@ def parse_args():
                         dest='pwd_field',
                         help='The HTML field for password login. This is unlikely to change any time soon, so leaving '
                              'the default is fine.')
+    parser.add_argument('-t', default=30, type=float,
+                        dest='timeout',
+                        help='Seconds to wait for each page to load before retrying.')
+    parser.add_argument('-r', default=2, type=int,
+                        dest='retries',
+                        help='Number of times to retry loading a page that times out.')
+    parser.add_argument('--settle', default=0.5, type=float,
+                        dest='settle',
+                        help='Seconds the number of cards on a page must stay unchanged for it to count as loaded.')
+    parser.add_argument('--http', action='store_true',
+                        dest='http',
+                        help='Only use the browser to log in, then fetch the shortlist pages over plain HTTP '
+                             '(much faster).')
+    parser.add_argument('-w', default=4, type=int,
+                        dest='workers',
+                        help='Number of pages to fetch at once with --http.')
+    parser.add_argument('-f', default=None,
+                        dest='urls_file',
+                        help='Text file listing several shortlist URLs (one per line) to scrape in one run, with '
+                             'headless browsers. If not given, you will be asked for one shortlist URL.')
+    parser.add_argument('-d', default=3, type=int,
+                        dest='drivers',
+                        help='Number of browsers to scrape shortlists with at once, when given several.')
+    parser.add_argument('--headless', action='store_true',
+                        dest='headless',
+                        help='Run the browser headless (always the case with -f).')
+    parser.add_argument('--merge', action='store_true',
+                        dest='merge',
+                        help='Put all shortlists into one table, rather than one sheet per shortlist.')
+    parser.add_argument('--no-store', action='store_true',
+                        dest='no_store',
+                        help="Don't add the performers scraped to the contact store.")
+    parser.add_argument('--update', action='store_true',
+                        dest='update',
+                        help='Update the output file if it exists (keeping the CONTACT? column and any columns added '
+                             'by hand), logging what changed in a .changes.csv next to it.')
+    parser.add_argument('--no-cache', action='store_true',
+                        dest='no_cache',
+                        help="Parse every page, rather than taking pages unchanged since the last run from the page "
+                             "cache.")
 
     args = parser.parse_args()
 
@@ -48,7 +437,12 @@ def parse_args():
     print('\nPLEASE FILL THE FOLLOWING:\n')
     usn = input("Spotlight Username: ")
     pwd = fetch_password("Spotlight", usn)  # Obtain keyring from keychain. Set it if absent
-    webpage = input("Spotlight shortlist URL: ")
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            webpage = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        print(f"{len(webpage)} shortlists to scrape.")
+    else:
+        webpage = input("Spotlight shortlist URL: ")
 
     outdir_prompt = 'Hit ENTER to select desired output folder: '
     input(outdir_prompt)
@@ -58,85 +452,142 @@ def parse_args():
     print(' ' * len(outdir_prompt) + '\033[A' + outdir)  # print at end of previous line
     root.destroy()  # delete dialog window
 
-    outfile = input("Desired output file name: ")
+    outfile = input("Desired output file name (.xlsx by default, or .csv/.parquet): ")
     outpath = os.path.join(outdir, outfile)
 
     openfile = yes_no("Would you like to open the file on completion? ('y'/'n'): ")
 
-    return webpage, args.usn_field, usn, args.pwd_field, pwd, outpath, openfile
+    return (webpage, args.usn_field, usn, args.pwd_field, pwd, outpath, openfile, args.timeout, args.retries,
+            args.settle, args.http, args.workers, args.drivers, args.headless or bool(args.urls_file), args.merge,
+            None if args.no_store else store_path, args.update, None if args.no_cache else cache_path)
 
-def main(webpage, usn_field, usn, pwd_field, pwd, outfile, open=False):
+def main(webpage, usn_field, usn, pwd_field, pwd, outfile, open=False, timeout=30, retries=2, settle=0.5,
+         http=False, workers=4, drivers=1, headless=False, merge=False, store=store_path, update=False,
+         cache=cache_path):
     """
-    Function that scrapes starnow site for names etc
+    Function that scrapes starnow site for names etc. 'webpage' is a shortlist URL or a list of them. Shortlists are
+    scraped on a pool of up to 'drivers' browsers, each signing in once and then reused for the shortlists that follow;
+    headless browsers don't load images, fonts or stylesheets. Each shortlist gets its own sheet, or with 'merge' (and
+    always in a .csv or .parquet 'outfile'), all go into one table with a SHORTLIST column. Each page is waited for
+    until its cards have rendered (see wait_for_page), for up to 'timeout' seconds and 'retries' retries. If 'http' is
+    True, the browser is only used to log in, and the pages are then fetched over HTTP with the browser's cookies,
+    'workers' at a time (see fetch_pages).
+    Every performer is also added to the contact store at 'store' (unless it is None), under their shortlist's name.
+    Pages unchanged since the last run are taken from the page cache at 'cache' (unless it is None) rather than parsed.
+    With 'update', an existing 'outfile' is updated rather than overwritten: the CONTACT? column and any columns added
+    by hand are kept for performers still on the shortlist, and what was added, changed and removed is logged (see
+    rescrape.OutputMerge).
     """
     # Format inputs
-    if not outfile.endswith('.xlsx'):
+    if not outfile.endswith(extensions):
         outfile += '.xlsx'
     #if not outfile.startswith('../Data/'):
     #    outfile = '../Data/' + outfile
+    webpages = [webpage] if isinstance(webpage, str) else list(webpage)
+    login = (usn_field, usn, pwd_field, pwd)
+
+    # With 'update', the new version is written alongside the old one, which it replaces at the end
+    previous = read_previous(outfile) if update else {}
+    path = temp_path(outfile) if previous else outfile
+
+    # Rows are streamed to the output as each page is parsed, so nothing grows with the page count
+    merge = merge or not outfile.endswith('.xlsx')
+    lists = [shortlist_name(url, i) for i, url in enumerate(webpages, 1)]
+    if merge:
+        names = [os.path.basename(outfile)] * len(webpages)
+        mergers = [OutputMerge(next(iter(previous.values())), ['SHORTLIST'] + columns, ['SHORTLIST', 'NAME', 'AGENT'],
+                               ['CONTACT?'])] * len(webpages) if previous else None
+        out = open_sink(path, mergers[0].columns if mergers else ['SHORTLIST'] + columns)
+        sheets = [out] * len(webpages)
+    else:
+        # Previous sheets are matched to shortlists by name, whatever order the shortlists were given in
+        names = lists
+        old = {sheet_shortlist(sheet): df for sheet, df in previous.items()}
+        mergers = [OutputMerge(old.get(name), columns, ['NAME', 'AGENT'], ['CONTACT?']) for name in names] \
+            if previous else None
+        out = ExcelSink(path)
+        sheets = [out.sheet(f'{i} {name}', mergers[i - 1].columns if mergers else columns)
+                  for i, name in enumerate(names, 1)]
+    write_lock = threading.Lock()
+    contacts = ContactStore(store) if store else None
+    page_cache = PageCache('spotlight', SpotlightContact, cache, parser_version) if cache else None
+
+    local = threading.local()
+    pool = []  # every driver started, to quit at the end
+
+    def scrape(i, url):
+        # Runs on a pool thread, with that thread's own (signed in after its first shortlist) driver
+        if not hasattr(local, 'driver'):
+            local.driver = chrome_driver(headless, block_assets=headless)
+            pool.append(local.driver)
+
+        label = f'[{i}/{len(webpages)}]' if len(webpages) > 1 else ''
+        n = pages = 0
+
+        for rows, seconds in shortlist_pages(local.driver, url, login, timeout, retries, settle, http, workers,
+                                             page_cache):
+            with write_lock:
+                for row in rows:
+                    values = [lists[i - 1]] + row.row() if merge else row.row()
+                    sheets[i - 1].append(mergers[i - 1].row(values) if mergers else values)
+            if contacts:
+                for row in rows:
+                    contacts.add('spotlight', lists[i - 1], row.name, row.email, row.phone, row.agent)
+            n, pages = n + len(rows), pages + 1
+            print(f'{label} Page {pages}: {len(rows)} performers (loaded in {seconds:.1f}s).'.strip())
+
+        return n, pages
+
+    print('\nScraping data...')
+    failed = 0
 
-    s = Service('./chromedriver')
-    driver = webdriver.Chrome(service=s)
-
-    print('\nLoading webpage...')
-    driver.get(webpage)  # load webpage
-    driver.implicitly_wait(3)
-
-    # Login details
-    username = driver.find_element(By.ID, usn_field)
-    password = driver.find_element(By.ID, pwd_field)
-    username.send_keys(usn)
-    password.send_keys(pwd)
-
-    driver.find_element(By.ID, "sign-in-button").click()  # Sign in
-
-    delay = 30  # seconds till timeout error
     try:
-        myElem = WebDriverWait(driver, delay).until(EC.presence_of_element_located((By.ID, "Radio-Signal")))
-        time.sleep(5)
-    except TimeoutException:
-        driver.close()
+        with ThreadPoolExecutor(max_workers=max(1, min(drivers, len(webpages)))) as executor:
+            futures = {executor.submit(scrape, i, url): (i, url) for i, url in enumerate(webpages, 1)}
+
+            for future in as_completed(futures):
+                i, url = futures[future]
+                try:
+                    n, pages = future.result()
+                    print(f'Shortlist {i} ({url}): {n} performers from {pages} pages.')
+                except TimeoutException:
+                    failed += 1
+                    print(f"Shortlist {i} ({url}) FAILED to load. Please check username and password and/or "
+                          f"internet connection.")
+                except (WebDriverException, requests.RequestException, PagingFailed) as e:
+                    failed += 1
+                    print(f"Shortlist {i} ({url}) FAILED: {e}")
+    finally:
+        for driver in pool:
+            driver.quit()  # close drivers
+        if contacts:
+            contacts.close()
+        if page_cache:
+            page_cache.close()
+            print(f'{page_cache.hits} unchanged page(s) taken from the page cache.')
+
+    if previous and not merge:
+        for sheet, df in previous.items():
+            if sheet_shortlist(sheet) not in lists:  # shortlists not scraped this time are kept as they were
+                out.sheet(sheet, list(df.columns)).extend(df.itertuples(index=False))
+    out.close()
+
+    if failed == len(webpages):
+        os.remove(path)  # discard the empty output
         sys.exit("Login Failed. Please check username and password and/or internet connection.")
 
-    print('Scraping data...')
-    txt = driver.page_source
-
-    # RETRIEVE HTML FROM ALL PAGES
-    while driver.find_elements(By.CLASS_NAME, "c-pagination-control__arrow-icon.icon-chevronright"):
-
-        driver.find_element(By.CLASS_NAME, "c-pagination-control__arrow-icon.icon-chevronright").click()
-
-        try:
-            # wait to load
-            myElem = WebDriverWait(driver, delay).until(EC.presence_of_element_located((By.ID, "Radio-Signal")))
-            time.sleep(3)
-        except TimeoutException:
-            print("Loading next page took too much time. Page skipped.")
-
-        # append source to txt
-        txt += driver.page_source
-
-    driver.close()  # close driver
-
-    pattern = r'alt="(.+?)"[\S\n\t\v ]+?"c-agency__card-agency-name">(.+?)<' \
-              r'[\S\n\t\v ]+?tel\:\/\/(.+?)"[\S\n\t\v ]+?"mailto:(.+?)"'
-
-    regex = re.compile(pattern)
-
-    rows = [(match.group(1).strip(), match.group(2).strip(),
-             match.group(3).strip(), match.group(4).strip())
-            for match in regex.finditer(txt)]
-
-    out = pd.DataFrame(rows, columns=['NAME', 'AGENT', 'CONTACT NUMBER', 'EMAIL'])  # Building dataframe
+    if previous:
+        if failed:
+            os.remove(path)
+            sys.exit(f"{outfile} has been left as it was, as not every shortlist could be scraped.")
 
-    # Format cols
-    out['CONTACT NUMBER'] = out['CONTACT NUMBER'].astype("str")
-    out['CONTACT NUMBER'] = out['CONTACT NUMBER'].str.replace(r'\D+', '', regex=True)  # keep numericals only
-    out['NAME'] = out['NAME'].str.title()
-    out['CONTACT?'] = None
+        os.replace(path, outfile)
+        for name, merger in dict(zip(names, mergers)).items():
+            merger.report(changes_path(outfile), name)
+            print(f'{name}: {merger.summary()}.')
+        print(f'Changes logged in {changes_path(outfile)}.')
 
-    print(f'Saving data to {outfile}...')
-    out.to_excel(outfile, index=None, header=True)
+    print(f'Data saved to {outfile}.')
 
     print('Done!')
 
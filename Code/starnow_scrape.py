@@ -8,73 +8,401 @@ __version__ = '0.0.1'
 ## Imports ##
 import mechanize
 import http.cookiejar
+import os
 import re
-import pandas as pd
 import argparse
 import sys
 import subprocess
+import threading
+import json
+import itertools
+import user_dirs
+from concurrent.futures import ThreadPoolExecutor
+from contact_store import ContactStore, store_path
+from table_io import open_sink
+from records import StarnowApplicant
+from rescrape import PageCache, OutputMerge, cache_path, read_previous, changes_path, temp_path
 
-## Functions ##
-def main(webpage="https://www.starnow.co.uk/casting/1123833/applicants",
-         pages=4,
-         usn_field="ctl00$cphMain$signinForm$email",
-         usn='casting@treepetts.co.uk',
-         pwd_field="ctl00$cphMain$signinForm$password",
-         pwd='kitchen69',
-         outfile='GOAL NATIONAL TEAM FOOTBALL FANS.xlsx'):
+## Variables ##
+cookie_dir = user_dirs.cache_dir  # the cookies sign in as the user, so not in the repository
+
+script_re = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+assignment_re = re.compile(r'=\s*(?=[{\[])')  # e.g. window.__INITIAL_STATE__ = {...}
+json_parse_re = re.compile(r'JSON\.parse\(\s*("(?:\\.|[^"\\])*")\s*\)')  # e.g. JSON.parse("{\"a\":1}")
+json_decoder = json.JSONDecoder()
+question_keys = ['question', 'questionText', 'text', 'title', 'label']
+id_keys = ['applicantId', 'memberId', 'profileId', 'id']
+parser_version = 2  # bump when parsing changes, so pages in the page cache are parsed again
+
+
+## Classes ##
+class LoginFailed(Exception):
+    """Raised when Starnow still shows the login form after signing in.
     """
-    Function that scrapes starnow site for names etc
+
+
+class StarnowSession:
+    """One signed-in Starnow session, reused for every page. Its cookies are saved (one file per username, in
+    'cookie_dir') so later runs skip the login entirely; the login form is only submitted again when a page comes back
+    as the login page, i.e. the session has expired. Safe to share between threads: each thread gets its own mechanize
+    browser, all on the one cookie jar, and only one of them signs in if the session expires.
     """
 
-    rows = []
-    for x in range(1, (pages+1)):
-        print(f'Scraping p{x}...')
+    def __init__(self, usn_field: str, usn: str, pwd_field: str, pwd: str, cookie_dir: str = cookie_dir):
+        self.usn_field, self.usn, self.pwd_field, self.pwd = usn_field, usn, pwd_field, pwd
+        self.logins = 0
 
-        cj = http.cookiejar.CookieJar()
-        br = mechanize.Browser()
-        br.set_handle_robots(False)
-        br.set_cookiejar(cj)
+        self.cookie_path = user_dirs.private_path(
+            os.path.join(cookie_dir, f"starnow_cookies_{re.sub(r'[^A-Za-z0-9]+', '_', usn)}.lwp"))
+        self.cj = http.cookiejar.LWPCookieJar(self.cookie_path)
+        if os.path.exists(self.cookie_path):
+            try:
+                self.cj.load(ignore_discard=True)
+            except (http.cookiejar.LoadError, OSError):
+                pass  # unreadable: just log in again
 
-        br.open(f"{webpage}?p={x}")
+        self._local = threading.local()
+        self._lock = threading.Lock()
 
-        br.select_form(nr=0)
+    @property
+    def br(self):
+        """This thread's browser.
+        """
+        if not hasattr(self._local, 'br'):
+            br = mechanize.Browser()
+            br.set_handle_robots(False)
+            br.set_cookiejar(self.cj)
+            self._local.br = br
+
+        return self._local.br
+
+    def logged_out(self) -> bool:
+        """Returns True if the current page is the login page.
+        """
+        try:
+            return any(control.name == self.usn_field for form in self.br.forms() for control in form.controls)
+        except mechanize.BrowserStateError:
+            return False  # not HTML
+
+    def login(self):
+        """Fills in and submits the login form on the current page, and saves the session cookies.
+        """
+        print('Logging in...')
+        self.br.select_form(predicate=lambda form: any(c.name == self.usn_field for c in form.controls))
 
         # Set username and password.
         # Note that the key names of this dict will differ depending on the
         # site. to find them, go to the login page and right click the fields
         # that need flling, and see corresponding the value of 'name' in
         # the html.
-        br.form[usn_field] = usn
-        br.form[pwd_field] = pwd
+        self.br.form[self.usn_field] = self.usn
+        self.br.form[self.pwd_field] = self.pwd
 
         # Login
-        br.submit()
+        self.br.submit()
+        self.logins += 1
+
+        if self.logged_out():
+            raise LoginFailed("Login failed. Please check username and password.")
+        self.save()
+
+    def open(self, url: str, attempts: int = 3) -> bytes:
+        """Fetches a page, signing in first if the session has expired (or there isn't one yet).
+        """
+        for _ in range(attempts):
+            logins = self.logins
+            self.br.open(url)
+            if not self.logged_out():
+                return self.br.response().read()
+
+            with self._lock:
+                if self.logins == logins:  # else another thread has signed in since, so just try again
+                    self.login()
+                    if self.br.geturl() == url:
+                        return self.br.response().read()
+
+        raise LoginFailed("Still signed out after logging in.")
+
+    def save(self):
+        """Saves the session cookies (readable only by this user, as they sign in to the account).
+        """
+        self.cj.save(ignore_discard=True)
+        os.chmod(self.cookie_path, 0o600)
+
+
+## Functions ##
+def embedded_json(page: str):
+    """Yields each JSON value embedded in a page's scripts: JSON script blocks, objects/arrays assigned to a variable
+    and JSON.parse("...") string literals. Each is decoded by the json module in one linear pass from where it starts.
+    """
+    for attrs, body in script_re.findall(page):
+        if 'json' in attrs.lower():
+            try:
+                yield json.loads(body)
+            except ValueError:
+                pass
+            continue
+
+        for m in json_parse_re.finditer(body):
+            try:
+                yield json.loads(json.loads(m.group(1)))
+            except ValueError:
+                pass
+
+        pos = 0
+        for m in assignment_re.finditer(body):
+            if m.end() < pos:
+                continue  # inside a value already decoded
+            try:
+                value, pos = json_decoder.raw_decode(body, m.end())
+            except ValueError:
+                continue
+            yield value
+
+
+def find_key(obj, key: str):
+    """First value of 'key' found in a decoded JSON value (depth first), or None.
+    """
+    if isinstance(obj, dict):
+        if key in obj:
+            return obj[key]
+        obj = obj.values()
+    elif not isinstance(obj, list):
+        return None
+
+    for child in obj:
+        value = find_key(child, key)
+        if value is not None:
+            return value
+
+    return None
+
+
+def find_answers(obj):
+    """Yields (question, answer) for each object with an 'answer' in a decoded JSON value, the question being its
+    'question' (or 'text', 'title' etc.) field.
+    """
+    if isinstance(obj, dict):
+        if 'answer' in obj:
+            question = next((obj[k] for k in question_keys if obj.get(k)), None)
+            if isinstance(question, dict):
+                question = find_key(question, 'text')  # e.g. {"question": {"id": 1, "text": "..."}, "answer": ...}
+            if question is not None:
+                answer = obj['answer']
+                yield str(question).strip(), ', '.join(map(str, answer)) if isinstance(answer, list) else str(answer)
+                return
+        obj = obj.values()
+    elif not isinstance(obj, list):
+        return
+
+    for child in obj:
+        yield from find_answers(child)
+
+
+def applicant_objects(obj):
+    """Returns (number of objects with a 'fullName' in a decoded JSON value, the applicants' objects in it). Each
+    applicant's object is the largest one containing their 'fullName' and no other, so that answers held alongside
+    their profile are included.
+    """
+    if isinstance(obj, dict):
+        children, count = obj.values(), int('fullName' in obj)
+    elif isinstance(obj, list):
+        children, count = obj, 0
+    else:
+        return 0, []
+
+    found = []
+    for child in children:
+        n, objects = applicant_objects(child)
+        count += n
+        found += objects
+
+    if count == 1 and isinstance(obj, dict):
+        return 1, [obj]
+
+    return count, found
+
+
+def find_object(obj, key: str):
+    """First object with 'key' in a decoded JSON value (depth first), or None.
+    """
+    if isinstance(obj, dict):
+        if key in obj:
+            return obj
+        obj = obj.values()
+    elif not isinstance(obj, list):
+        return None
+
+    for child in obj:
+        found = find_object(child, key)
+        if found is not None:
+            return found
+
+    return None
+
+
+def applicant_id(obj: dict):
+    """Id of the applicant whose object this is (see applicant_objects), as a string: that of the object holding their
+    'fullName', else that of the applicant's object itself. None if neither has one.
+    """
+    for candidate in (find_object(obj, 'fullName'), obj):
+        value = next((candidate[k] for k in id_keys if candidate.get(k) not in (None, '')), None)
+        if value is not None:
+            return str(value)
+
+    return None
+
+
+def applicant_from_json(obj: dict) -> StarnowApplicant:
+    """Builds an applicant from their object in the page's state, wherever in it the fields are nested.
+    """
+    age = find_key(obj, 'age')
+    return StarnowApplicant(name=str(find_key(obj, 'fullName') or '').strip(),
+                            phone=str(find_key(obj, 'phoneNumber') or '').strip(),
+                            age=int(age) if isinstance(age, (int, float)) or str(age or '').isdigit() else None,
+                            answers=dict(find_answers(obj)))
+
+
+def parse_applicants(page: bytes) -> list:
+    """Applicants on one page, from the state JSON embedded in it (see embedded_json). Pages can embed the same state
+    more than once (e.g. in a JSON script block and again in a variable), so each applicant is only taken once: by
+    their id, or by their name and phone number if they have none.
+    """
+    text = page.decode('utf-8', errors='replace') if isinstance(page, bytes) else page
+
+    applicants, seen = [], set()
+    for value in embedded_json(text):
+        for obj in applicant_objects(value)[1]:
+            applicant = applicant_from_json(obj)
+            uid = applicant_id(obj)
+            key = ('id', uid) if uid is not None else ('name', applicant.name, applicant.phone)
+            if key not in seen:
+                seen.add(key)
+                applicants.append(applicant)
+
+    return applicants
+
+
+def page_count(page: bytes):
+    """Total number of pages of applicants, read from the first page: its 'totalPages' value if it has one, else the
+    highest page number its pagination links go to. None if neither is there.
+    """
+    m = re.search(rb'"totalPages"\s*:\s*(\d+)', page)
+    if m:
+        return int(m.group(1))
+
+    links = [int(n) for n in re.findall(rb'[?&;]p=(\d+)', page)]
+    return max(links) if links else None
+
+
+def fetch_pages(session: StarnowSession, webpage: str, pages: int = None, workers: int = 8, parse=None):
+    """Fetches the first page of applicants, works out how many pages there are from it (unless 'pages' is given),
+    then fetches the rest concurrently on 'workers' threads sharing the session, parsing each with parse(URL, content)
+    (parse_applicants by default). Yields (URL, applicants) for each page in page order, as soon as it and all the
+    pages before it have arrived. If the number of pages can't be found, says so and fetches pages 'workers' at a time
+    until one has no applicants, or is the same as the page before (as some sites serve the last page for any higher
+    page number).
+    """
+    parse = parse or (lambda url, page: parse_applicants(page))
+
+    def fetch(x):
+        url = f"{webpage}?p={x}"
+        return url, parse(url, session.open(url))
+
+    print('Scraping p1...')
+    first = session.open(f"{webpage}?p=1")
+    last = parse(f"{webpage}?p=1", first)
+    yield f"{webpage}?p=1", last
+
+    pages = pages or page_count(first)
+    if pages:
+        print(f'{pages} pages of applicants.')
+        batches = [range(2, pages + 1)]
+    elif last:
+        print("WARNING: Couldn't find the number of pages on p1. Fetching pages until one has no applicants...")
+        batches = (range(n, n + workers) for n in itertools.count(2, workers))
+    else:
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for numbers in batches:
+            for url, applicants in executor.map(fetch, numbers):
+                if not pages and (not applicants or applicants == last):
+                    return  # past the last page
+                yield url, applicants
+                last = applicants
+
+
+def main(webpage="https://www.starnow.co.uk/casting/1123833/applicants",
+         pages=None,
+         usn_field="ctl00$cphMain$signinForm$email",
+         usn='casting@treepetts.co.uk',
+         pwd_field="ctl00$cphMain$signinForm$password",
+         pwd='kitchen69',
+         outfile='GOAL NATIONAL TEAM FOOTBALL FANS.xlsx',
+         workers=8,
+         team_question='What Country Do You Represent?',
+         store=store_path,
+         update=False,
+         cache=cache_path):
+    """
+    Function that scrapes starnow site for names etc. The number of pages is found from the first page unless given,
+    and pages are fetched 'workers' at a time (see fetch_pages). Answers to 'team_question' go in the NATIONAL TEAM
+    column and answers to any other questions in columns of their own. Applicants are also added to the contact store
+    at 'store' (unless it is None), under the casting's URL. Pages unchanged since the last run are taken from the page
+    cache at 'cache' (unless it is None) rather than parsed. With 'update', an existing 'outfile' is updated rather
+    than overwritten: the self tape columns and any columns added by hand are kept for applicants still there, and
+    what was added, changed and removed is logged (see rescrape.OutputMerge).
+    """
+
+    session = StarnowSession(usn_field, usn, pwd_field, pwd)
+    page_cache = PageCache('starnow', StarnowApplicant, cache, parser_version) if cache else None
+
+    def parse(url, page):
+        return page_cache.parse(url, page, parse_applicants) if page_cache else parse_applicants(page)
+
+    applicants = []
+    try:
+        for x, (url, page_applicants) in enumerate(fetch_pages(session, webpage, pages, workers, parse), 1):
+            if x > 1:
+                print(f'Scraped p{x}.')
+
+            applicants += page_applicants
+    except LoginFailed as e:
+        sys.exit(str(e))
+    finally:
+        if page_cache:
+            page_cache.close()
 
-        # Grab all text from page
-        txt = str(br.response().read())
+    session.save()  # keep any cookies the site refreshed, for next time
+    print(f'Signed in {session.logins} time(s) for {x} pages.')
+    if page_cache:
+        print(f'{page_cache.hits} unchanged page(s) taken from the page cache.')
 
-        # Specify regex pattern
-        pattern = r"\"What Country Do You Represent\?\",\"answer\"\:\"(.*?)\"" \
-                  r".*?\"fullName\":\"(.*?)\".*?\"phoneNumber\"\:\"(.*?)\""
-        regex = re.compile(pattern)
+    print(f'Saving {len(applicants)} applicants...')
 
-        # Compile into list
-        deets = [(match.group(2).strip(), match.group(1),
-                  match.group(3).strip()) for match in regex.finditer(txt)]
+    # Writing rows out (the team question goes in NATIONAL TEAM, other questions in columns of their own)
+    questions = list(dict.fromkeys(q for a in applicants for q in a.answers if q != team_question))
 
-        # Merge with list of rows
-        rows += deets
+    # With 'update', the new version is written alongside the old one, which it replaces at the end
+    previous = next(iter(read_previous(outfile).values()), None) if update else None
+    merger = OutputMerge(previous, StarnowApplicant.columns + questions, ['NAME', 'CONTACT NUMBER'],
+                         ['Asked to self tape?', 'Received self tape?']) if previous is not None else None
 
+    path = temp_path(outfile) if merger else outfile
+    with open_sink(path, merger.columns if merger else StarnowApplicant.columns + questions) as out:
+        for a in applicants:
+            out.append(merger.row(a.row(team_question, questions)) if merger else a.row(team_question, questions))
 
-    print('Saving dataframe...')
+    if merger:
+        os.replace(path, outfile)
+        merger.report(changes_path(outfile), webpage)
+        print(f'{merger.summary()} (logged in {changes_path(outfile)}).')
 
-    # Building and saving dataframe
-    out = pd.DataFrame(rows, columns=['NAME', 'NATIONAL TEAM', 'CONTACT NUMBER'])
-    out['CONTACT NUMBER'] = out['CONTACT NUMBER'].astype("str")
-    out['EMAIL'] = 'STARNOW'
-    out['Asked to self tape?'] = out['Received self tape?'] = out['AGE'] = None
-    out = out[['NAME', 'EMAIL', 'CONTACT NUMBER', 'AGE', 'NATIONAL TEAM', 'Asked to self tape?', 'Received self tape?']]
-    out.to_excel(outfile, index=None, header=True)
+    if store:
+        with ContactStore(store) as contacts:
+            for a in applicants:
+                contacts.add('starnow', webpage, a.name, phone=a.phone, age=a.age, answers=a.answers)
 
     # Opening file
     subprocess.call(['open', outfile])  # Mac
@@ -91,8 +419,11 @@ if __name__ == '__main__':
     parser.add_argument('-w', default="https://www.starnow.co.uk/casting/1123833/applicants",
                         dest='webpage',
                         help='The URL of the webpage you wish to scrape')
-    parser.add_argument('-p', type=int, required=True, dest='pages',
-                        help='The number of pages you wish to scrape')
+    parser.add_argument('-p', type=int, default=None, dest='pages',
+                        help='The number of pages you wish to scrape (default: all of them, as found on the first '
+                             'page)')
+    parser.add_argument('-t', type=int, default=8, dest='workers',
+                        help='The number of pages to fetch at once')
     parser.add_argument('-uf', default="ctl00$cphMain$signinForm$email",
                         dest='usn_field',
                         help='The HTML field for username login.')
@@ -104,7 +435,17 @@ if __name__ == '__main__':
     parser.add_argument('-pw', default='kitchen69', dest='pwd',
                         help='Password')
     parser.add_argument('-o', default='GOAL NATIONAL TEAM FOOTBALL FANS.xlsx',
-                        dest='outfile', help='Out file path')
+                        dest='outfile', help='Out file path (.xlsx, .csv or .parquet)')
+    parser.add_argument('-q', default='What Country Do You Represent?', dest='team_question',
+                        help='The casting question whose answers go in the NATIONAL TEAM column')
+    parser.add_argument('--no-store', action='store_true', dest='no_store',
+                        help="Don't add the applicants scraped to the contact store")
+    parser.add_argument('--update', action='store_true', dest='update',
+                        help='Update the out file if it exists (keeping the self tape columns and any columns added by '
+                             'hand), logging what changed in a .changes.csv next to it')
+    parser.add_argument('--no-cache', action='store_true', dest='no_cache',
+                        help="Parse every page, rather than taking pages unchanged since the last run from the page "
+                             "cache")
 
     args = parser.parse_args()
 
@@ -115,6 +456,11 @@ if __name__ == '__main__':
                   usn=args.usn,
                   pwd_field=args.pwd_field,
                   pwd=args.pwd,
-                  outfile=args.outfile)
+                  outfile=args.outfile,
+                  workers=args.workers,
+                  team_question=args.team_question,
+                  store=None if args.no_store else store_path,
+                  update=args.update,
+                  cache=None if args.no_cache else cache_path)
 
     sys.exit(status)
\ No newline at end of file
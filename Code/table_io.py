@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""Shared table output and input for the scrapers and send_email: sinks that stream rows to CSV, Parquet or Excel as
+they are produced (in constant memory), and a spreadsheet reader that caches what it parsed in a private cache
+directory.
+
+Parquet (output, and the reader's cache) needs pyarrow, which is in requirements.txt. Without it, writing .parquet
+files raises ImportError, and spreadsheets are read without a cache (saying so once).
+"""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import csv
+import json
+import hashlib
+import tempfile
+import pandas as pd
+import user_dirs
+from records import Record
+
+try:
+    import pyarrow as pa  # optional dependency (Parquet)
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+## Variables ##
+extensions = ('.xlsx', '.csv', '.parquet')
+
+# Where read_table keeps what it has parsed (one subfolder per spreadsheet, readable only by this user)
+cache_dir = os.path.join(user_dirs.cache_dir, 'tables')
+cache_warned = False  # whether read_table has said it can't cache without pyarrow
+
+# What an unusable cache entry (damaged, stale or half written) or a table Parquet can't hold raises
+cache_errors = (OSError, ValueError, TypeError, KeyError) + ((pa.ArrowException,) if pa else ())
+
+
+## Classes ##
+class Sink:
+    """A table being written out row by row. Rows are records (see records.Record) with these 'columns', lists in the
+    order of 'columns', or dicts keyed by column (missing columns are left empty, extra keys ignored). Use as a context
+    manager, or call close() to finish the file.
+    """
+
+    def __init__(self, path: str, columns: list):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+
+    def _values(self, row) -> list:
+        if isinstance(row, Record):
+            if row.columns != self.columns:
+                raise ValueError(f"{type(row).__name__} has columns {row.columns}, but {self.path} has {self.columns}")
+            return row.row()
+        if isinstance(row, dict):
+            return [row.get(column) for column in self.columns]
+        return list(row)
+
+    def append(self, row):
+        self._write(self._values(row))
+        self.rows += 1
+
+    def extend(self, rows) -> int:
+        """Appends every row from an iterable, returning how many there were.
+        """
+        n = self.rows
+        for row in rows:
+            self.append(row)
+        return self.rows - n
+
+    def _write(self, values: list):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVSink(Sink):
+    """Rows go to disk as they are appended (line buffered, so the file can be watched while it grows). With 'append',
+    rows are added to the end of an existing file, and the header is only written if the file is new.
+    """
+
+    def __init__(self, path: str, columns: list, append: bool = False):
+        super().__init__(path, columns)
+        new = not (append and os.path.exists(path) and os.path.getsize(path))
+
+        self._file = open(path, 'a' if append else 'w', newline='', buffering=1)
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if new:
+            self._writer.writerow(self.columns)
+
+    def _write(self, values: list):
+        self._writer.writerow(values)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink(Sink):
+    """Rows are written in row groups of 'row_group' rows, all columns as strings. Requires pyarrow.
+    """
+
+    def __init__(self, path: str, columns: list, row_group: int = 10000):
+        super().__init__(path, columns)
+        if pa is None:
+            raise ImportError(f"Writing {path} needs pyarrow (pip install -r requirements.txt)")
+
+        self._schema = pa.schema([(column, pa.string()) for column in self.columns])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._buffer = []
+        self.row_group = row_group
+
+    def _write(self, values: list):
+        self._buffer.append(values)
+        if len(self._buffer) >= self.row_group:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            columns = [[None if v is None else str(v) for v in column] for column in zip(*self._buffer)]
+            self._writer.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+            self._buffer = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+class ExcelSink(Sink):
+    """An .xlsx workbook written in constant memory: each row is flushed to a temporary file once the next one starts,
+    so memory doesn't grow with the number of rows (xlsxwriter's constant_memory mode, or openpyxl's write-only mode if
+    xlsxwriter isn't installed). Rows appended to the sink go to its first sheet ('sheet_name'); more sheets can be
+    added with sheet(). Values are written as they are (so phone numbers given as strings keep their leading 0).
+    """
+
+    def __init__(self, path: str, columns: list = None, sheet_name: str = None):
+        super().__init__(path, columns or [])
+        try:
+            import xlsxwriter  # optional dependency (faster)
+            self._book = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_numbers': False,
+                                                    'strings_to_formulas': False, 'strings_to_urls': False})
+        except ImportError:
+            from openpyxl import Workbook
+            self._book = Workbook(write_only=True)
+
+        self._first = self.sheet(sheet_name, columns) if columns is not None else None
+
+    def sheet(self, name: str = None, columns: list = None) -> 'ExcelSheet':
+        """Adds a sheet (named 'name', or Sheet1, Sheet2...), with 'columns' as its header row.
+        """
+        return ExcelSheet(self, name, columns or [])
+
+    def _write(self, values: list):
+        self._first.append(values)
+
+    def close(self):
+        if hasattr(self._book, 'add_worksheet'):
+            self._book.close()
+        else:
+            self._book.save(self.path)
+
+
+class ExcelSheet(Sink):
+    """One sheet of an ExcelSink.
+    """
+
+    def __init__(self, book: ExcelSink, name: str, columns: list):
+        super().__init__(book.path, columns)
+        if hasattr(book._book, 'add_worksheet'):
+            self._sheet = book._book.add_worksheet(name)
+            self._write_row = lambda r, values: self._sheet.write_row(r, 0, values)
+        else:
+            self._sheet = book._book.create_sheet(name)
+            self._write_row = lambda r, values: self._sheet.append(values)
+
+        self._next = 0
+        if columns:
+            self._write(self.columns)
+
+    def _write(self, values: list):
+        self._write_row(self._next, [None if pd.isna(v) else v.item() if hasattr(v, 'item') else v for v in values])
+        self._next += 1
+
+
+## Functions ##
+def open_sink(path: str, columns: list, append: bool = False, sheet_name: str = None) -> Sink:
+    """Sink for 'path', by its extension: .csv, .parquet or (anything else) .xlsx. Only CSV files can be appended to.
+    """
+    if path.endswith('.csv'):
+        return CSVSink(path, columns, append)
+    if append:
+        raise ValueError(f"Can only append to CSV files, not {path}")
+    if path.endswith('.parquet'):
+        return ParquetSink(path, columns)
+    return ExcelSink(path, columns, sheet_name)
+
+
+def read_table(path: str, **kwargs):
+    """Reads a spreadsheet (.xlsx/.xls, .csv or .parquet) into a DataFrame (or {sheet: DataFrame}, as pandas returns
+    for some 'sheet_name's); keyword arguments go to the pandas reader. Parsing Excel is slow, so what was read is also
+    cached as Parquet in 'cache_dir' (if pyarrow is installed), and used instead while the file's modification time and
+    size, the arguments and the pandas version are unchanged. A cache that can't be used for any reason is just a miss.
+    """
+    global cache_warned
+    if pa is None:
+        if not cache_warned:
+            print("pyarrow isn't installed, so spreadsheets read won't be cached (pip install -r requirements.txt).")
+            cache_warned = True
+        return read_file(path, **kwargs)
+
+    stat = os.stat(path)
+    arguments = repr(sorted(kwargs.items()))
+    entry = os.path.join(cache_dir, hashlib.blake2b(f'{os.path.abspath(path)}\0{arguments}'.encode(),
+                                                    digest_size=16).hexdigest())
+    key = [stat.st_mtime_ns, stat.st_size, arguments, pd.__version__]
+
+    try:
+        return load_cached(entry, key)
+    except cache_errors:
+        pass  # no (usable) cache
+
+    table = read_file(path, **kwargs)
+    try:
+        save_cached(entry, key, table)
+    except cache_errors:
+        pass  # e.g. columns Parquet can't hold: just don't cache
+
+    return table
+
+
+def read_file(path: str, **kwargs):
+    """Reads a spreadsheet with pandas' reader for its extension (no cache).
+    """
+    if path.endswith('.csv'):
+        return pd.read_csv(path, **kwargs)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, **kwargs)
+    return pd.read_excel(path, **kwargs)
+
+
+def load_cached(entry: str, key: list):
+    """Table cached in the folder 'entry' by save_cached, if it was cached under 'key' (raises an exception if not).
+    """
+    with open(os.path.join(entry, 'table.json')) as f:
+        manifest = json.load(f)
+    if manifest['key'] != key:
+        raise KeyError('stale')
+
+    frames = []
+    for i, json_columns in enumerate(manifest['json_columns']):
+        df = pd.read_parquet(os.path.join(entry, f'{i}.parquet'))
+        for column in json_columns:
+            df[column] = [None if v is None else json.loads(v) for v in df[column]]
+        frames.append(df)
+
+    return frames[0] if manifest['sheets'] is None else dict(zip(manifest['sheets'], frames))
+
+
+def save_cached(entry: str, key: list, table):
+    """Caches a table (a DataFrame or {sheet name: DataFrame}) in the folder 'entry', as one Parquet file per
+    DataFrame and a JSON manifest. Object columns holding more than one type of value (e.g. numbers and text, which
+    Parquet can't store as they are) are stored as a JSON string per cell.
+    """
+    frames = list(table.values()) if isinstance(table, dict) else [table]
+    if isinstance(table, dict) and not all(isinstance(sheet, str) for sheet in table):
+        return
+
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)  # (mode only applies to the last folder made)
+    os.makedirs(entry, mode=0o700, exist_ok=True)
+    json_columns = []
+    for i, df in enumerate(frames):
+        mixed = [c for c in df.columns if df[c].dtype == object and len({type(v) for v in df[c] if v is not None}) > 1]
+        if mixed:
+            df = df.copy()
+            for column in mixed:
+                df[column] = [None if v is None else json.dumps(v.item() if hasattr(v, 'item') else v)
+                              for v in df[column]]
+        df.to_parquet(os.path.join(entry, f'{i}.parquet'))
+        json_columns.append(mixed)
+
+    # The manifest goes in last, replacing any older one in one step
+    fd, tmp = tempfile.mkstemp(dir=entry, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'key': key, 'sheets': list(table) if isinstance(table, dict) else None,
+                   'json_columns': json_columns}, f)
+    os.replace(tmp, os.path.join(entry, 'table.json'))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""Per-user folders for what the scripts keep between runs, outside the repository so that none of it (contacts,
+recipients, session cookies) can be committed by mistake: data in ~/.local/share/casting-webscrape and caches in
+~/.cache/casting-webscrape (or under $XDG_DATA_HOME/$XDG_CACHE_HOME), both readable only by this user."""
+
+__author__ = 'Luke Swaby (lds20@ic.ac.uk)'
+__version__ = '0.0.1'
+
+## Imports ##
+import os
+import shutil
+
+## Variables ##
+app_name = 'casting-webscrape'
+repo_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+data_dir = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'),
+                        app_name)
+cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         app_name)
+
+
+## Functions ##
+def private_path(path: str) -> str:
+    """Makes the folder 'path' goes in, readable only by this user, if it doesn't exist yet. If 'path' is in data_dir
+    or cache_dir and isn't there yet, but a file of the same name was left in the repository by an earlier version,
+    that file (with any SQLite -wal and -shm files) is moved there. Returns 'path'.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, mode=0o700, exist_ok=True)  # (mode only applies to the last folder made)
+
+    old = os.path.join(repo_dir, os.path.basename(path))
+    if folder in (data_dir, cache_dir) and os.path.exists(old) and not os.path.exists(path):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(old + suffix):
+                shutil.move(old + suffix, path + suffix)
+        print(f"Moved {old} to {path}.")
+
+    return path
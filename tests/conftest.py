@@ -0,0 +1,17 @@
+"""Shared pytest setup: the scripts in Code/ import each other by module name, so Code/ goes on the path, and the
+per-user data and cache folders (see user_dirs) are pointed at a temporary folder so no test touches the real ones."""
+
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Code'))
+
+user_root = tempfile.mkdtemp(prefix='casting-webscrape-tests-')
+os.environ['XDG_DATA_HOME'] = os.path.join(user_root, 'data')
+os.environ['XDG_CACHE_HOME'] = os.path.join(user_root, 'cache')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(user_root, ignore_errors=True)
@@ -0,0 +1 @@
+"""Local stand-ins for the sites and mail servers the scripts talk to, for the tests."""
@@ -0,0 +1,247 @@
+"""Stand-in IMAP server (plain text, no TLS) holding one mailbox, with just the commands email_scrape uses: LOGIN,
+SELECT/EXAMINE, UID SEARCH (ALL, UID n:*, HEADER Subject), UID FETCH (UID, BODYSTRUCTURE, BODY.PEEK[...] sections and
+header fields), IDLE and LOGOUT. Messages can be added while clients are connected (those in IDLE are told at once),
+connections dropped, and the UIDs reset under a new UIDVALIDITY, to test watch mode.
+"""
+
+import re
+import email
+import select
+import threading
+import socketserver
+
+search_after_re = re.compile(r'UID (\d+):\*')
+search_subject_re = re.compile(r'HEADER Subject "(.*)"', re.IGNORECASE)
+section_re = re.compile(r'BODY(?:\.PEEK)?\[([^\]]*)\]', re.IGNORECASE)
+
+
+def body_structure(part) -> str:
+    """BODYSTRUCTURE of a message (RFC 3501 7.4.2), without extension data.
+    """
+    if part.is_multipart():
+        return '(' + ''.join(body_structure(p) for p in part.get_payload()) + f' "{part.get_content_subtype()}")'
+
+    params = part.get_params()[1:] if part.get_params() else []
+    params = '(' + ' '.join(f'"{k}" "{v}"' for k, v in params) + ')' if params else 'NIL'
+    raw = part.get_payload(decode=False)
+    encoding = part.get('Content-Transfer-Encoding', '7BIT')
+    lines = f' {raw.count(chr(10))}' if part.get_content_maintype() == 'text' else ''
+
+    return (f'("{part.get_content_maintype()}" "{part.get_content_subtype()}" {params} NIL NIL "{encoding}" '
+            f'{len(raw)}{lines})')
+
+
+def body_section(msg, section: str):
+    """Raw (still transfer-encoded) content of a numbered body section, e.g. '1.2', or None if there is no such part.
+    """
+    part = msg
+    for n in map(int, section.split('.')):
+        if part.is_multipart():
+            parts = part.get_payload()
+            if n > len(parts):
+                return None
+            part = parts[n - 1]
+        elif n != 1:
+            return None
+
+    raw = part.get_payload(decode=False)
+    return raw.encode() if isinstance(raw, str) else None
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def send(self, *lines):
+        """Sends lines (str or bytes) in a single write, as a server might when several responses are ready at once.
+        """
+        self.wfile.write(b''.join(line if isinstance(line, bytes) else line.encode() + b'\r\n' for line in lines))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.handlers.append(self)
+        self.told = 0  # number of messages the client has been told about
+        self.send('* OK stand-in IMAP server ready')
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip('\r\n').partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            if command == 'UID':
+                sub, _, args = args.partition(' ')
+                command = f'UID {sub.upper()}'
+            server.commands.append(command)
+
+            if command == 'CAPABILITY':
+                self.send('* CAPABILITY IMAP4rev1 IDLE', f'{tag} OK done')
+            elif command in ('SELECT', 'EXAMINE'):
+                with server.lock:
+                    self.told = len(server.messages)
+                    self.send(f'* {self.told} EXISTS', f'* OK [UIDVALIDITY {server.uidvalidity}] ok',
+                              f'* OK [UIDNEXT {server.next_uid}] ok', f'{tag} OK [READ-ONLY] done')
+            elif command == 'UID SEARCH':
+                self.send('* SEARCH ' + ' '.join(map(str, self.search(args))), f'{tag} OK done')
+            elif command == 'UID FETCH':
+                self.fetch(tag, args)
+            elif command == 'IDLE':
+                if self.idle(tag) is False:
+                    return
+            elif command == 'LOGOUT':
+                self.send('* BYE', f'{tag} OK done')
+                return
+            else:  # LOGIN, LIST, NOOP, CLOSE...
+                self.send(f'{tag} OK done')
+
+    def search(self, args: str) -> list:
+        with self.server.lock:
+            messages = dict(self.server.messages)
+
+        uids = sorted(messages)
+        m = search_after_re.search(args)
+        if m:
+            # 'n:*' always includes the newest message, even if its UID is below n
+            uids = [uid for uid in uids if uid >= int(m.group(1))] or uids[-1:]
+        m = search_subject_re.search(args)
+        if m:
+            uids = [uid for uid in uids if m.group(1).lower() in (messages[uid]['Subject'] or '').lower()]
+
+        return uids
+
+    def fetch(self, tag: str, args: str):
+        uid_set, _, items = args.partition(' ')
+        with self.server.lock:
+            messages = dict(self.server.messages)
+
+        uids = set()
+        for r in uid_set.split(','):
+            low, _, high = r.partition(':')
+            high = max(messages, default=0) if high == '*' else int(high or low)
+            uids |= {uid for uid in messages if int(low) <= uid <= high}
+
+        for seq, uid in enumerate(sorted(uids), 1):
+            msg = messages[uid]
+            out = [f'* {seq} FETCH (UID {uid}'.encode()]
+            if 'BODYSTRUCTURE' in items.upper():
+                out.append(f' BODYSTRUCTURE {body_structure(msg)}'.encode())
+            for m in section_re.finditer(items):
+                section = m.group(1)
+                if section.upper().startswith('HEADER.FIELDS'):
+                    names = re.search(r'\((.*)\)', section).group(1).split()
+                    data = (''.join(f'{n.title()}: {msg[n]}\r\n' for n in names if msg[n]) + '\r\n').encode()
+                elif section == '':
+                    data = msg.as_bytes()
+                else:
+                    data = body_section(msg, section)
+                out.append(f' BODY[{section}] NIL'.encode() if data is None
+                           else f' BODY[{section}] {{{len(data)}}}\r\n'.encode() + data)
+            self.send(b''.join(out) + b')\r\n')
+
+        self.send(f'{tag} OK done')
+
+    def idle(self, tag: str):
+        """Waits for DONE, announcing new messages as they are added. Messages added since the client last heard are
+        announced in the same write as the continuation. Returns False if the connection is to be dropped.
+        """
+        with self.server.lock:
+            count = len(self.server.messages)
+            self.server.idling.add(self)
+        if count != self.told:
+            self.told = count
+            self.send('+ idling', f'* {count} EXISTS')
+        else:
+            self.send('+ idling')
+
+        try:
+            while True:
+                if select.select([self.connection], [], [], 0.02)[0]:
+                    if not self.rfile.readline():
+                        return False
+                    self.send(f'{tag} OK IDLE terminated')
+                    return True
+                with self.server.lock:
+                    count = len(self.server.messages)
+                if count != self.told:
+                    self.told = count
+                    self.send(f'* {count} EXISTS')
+        finally:
+            with self.server.lock:
+                self.server.idling.discard(self)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.handlers.remove(self)
+        super().finish()
+
+
+class IMAPServer(socketserver.ThreadingTCPServer):
+    """Use start() to run one. Messages are kept as {UID: email.message.Message}.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, messages=(), uidvalidity: int = 1):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.port = self.server_address[1]
+        self.uidvalidity = uidvalidity
+        self.messages = {}
+        self.next_uid = 1
+        self.commands = []
+        self.handlers = []
+        self.idling = set()  # handlers of the clients in IDLE
+        self.lock = threading.Lock()
+        for raw in messages:
+            self.add(raw)
+
+    def add(self, raw: bytes):
+        with self.lock:
+            self.messages[self.next_uid] = email.message_from_bytes(raw)
+            self.next_uid += 1
+
+    def reset_uids(self, uidvalidity: int, first_uid: int = 100):
+        """Renumbers every message from 'first_uid' under a new UIDVALIDITY (as after a server migration).
+        """
+        with self.lock:
+            self.uidvalidity = uidvalidity
+            self.messages = {first_uid + i: msg for i, (_, msg) in enumerate(sorted(self.messages.items()))}
+            self.next_uid = first_uid + len(self.messages)
+
+    def drop(self):
+        """Drops every client connection.
+        """
+        with self.lock:
+            handlers = list(self.handlers)
+        for handler in handlers:
+            try:
+                handler.connection.shutdown(2)
+            except OSError:
+                pass
+
+
+def start(messages=(), uidvalidity: int = 1) -> IMAPServer:
+    """Starts a server on a free local port (server.port), in a daemon thread. Call server.shutdown() to stop it.
+    """
+    server = IMAPServer(messages, uidvalidity)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def reply(name: str, phone: str, subject: str = 'Audition', html: bool = False, **fields) -> bytes:
+    """A reply giving applicant details under the labels the casting email asks for.
+    """
+    from email.message import EmailMessage
+
+    lines = [f'NAME: {name}', f'PHONE: {phone}'] + [f'{k.upper()}: {v}' for k, v in fields.items()]
+    msg = EmailMessage()
+    msg['Subject'] = f'Re: {subject}'
+    msg['From'] = 'applicant@example.com'
+    msg['Date'] = 'Mon, 03 Jan 2022 10:00:00 +0000'
+    if html:
+        msg.set_content('<html><body>' + ''.join(f'<p>{line}</p>' for line in lines) + '</body></html>',
+                        subtype='html')
+    else:
+        msg.set_content('Hi,\n\n' + '\n'.join(lines) + '\n\nThanks\n')
+
+    return msg.as_bytes()
@@ -0,0 +1,154 @@
+"""Stand-in SMTP server (plain text, no TLS) with just what the senders use: EHLO/HELO, AUTH PLAIN and LOGIN, MAIL,
+RCPT, DATA, RSET, NOOP and QUIT. Messages accepted are kept in order, and replies to MAIL can be scripted to test
+retries: a 4xx or 5xx reply refuses the sender, a 421 reply then closes the connection (as servers do on timing out
+an idle session), and 'drop' closes it without replying. Connections can also be dropped, as if they had timed out.
+"""
+
+import time
+import base64
+import threading
+import socketserver
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def send(self, *lines):
+        self.wfile.write(''.join(line + '\r\n' for line in lines).encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.handlers.append(self)
+            server.connections += 1
+        self.send('220 stand-in SMTP server ready')
+
+        mail_from, rcpts, user = None, [], None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, args = line.decode().rstrip('\r\n').partition(' ')
+            command = command.upper()
+
+            if command in ('EHLO', 'HELO'):
+                self.send('250-stand-in', '250-AUTH PLAIN LOGIN', '250 8BITMIME')
+            elif command == 'AUTH':
+                user = self.auth(args)
+                if user is None:
+                    self.send('535 5.7.8 Authentication failed')
+                else:
+                    self.send('235 2.7.0 Accepted')
+            elif command == 'MAIL':
+                with server.lock:
+                    reply = server.scripted.pop(0) if server.scripted else None
+                if reply == 'drop':
+                    return
+                if user is None:
+                    self.send('530 5.7.0 Authentication required')
+                elif reply:
+                    self.send(reply)
+                    if reply.startswith('421'):
+                        return
+                else:
+                    mail_from, rcpts = args.partition(':')[2].strip('<> '), []
+                    self.send('250 2.1.0 OK')
+            elif command == 'RCPT':
+                rcpts.append(args.partition(':')[2].strip('<> '))
+                self.send('250 2.1.5 OK')
+            elif command == 'DATA':
+                self.data(mail_from, rcpts)
+                mail_from, rcpts = None, []
+            elif command == 'QUIT':
+                self.send('221 2.0.0 Bye')
+                return
+            else:  # RSET, NOOP
+                mail_from, rcpts = None, []
+                self.send('250 2.0.0 OK')
+
+    def auth(self, args: str):
+        """The user name if the credentials are right, else None.
+        """
+        mechanism, _, initial = args.partition(' ')
+        if mechanism.upper() == 'PLAIN':
+            if not initial:
+                self.send('334 ')
+                initial = self.rfile.readline().decode().strip()
+            _, user, password = base64.b64decode(initial).decode().split('\0')
+        else:
+            self.send('334 ' + base64.b64encode(b'Username:').decode())
+            user = base64.b64decode(self.rfile.readline().strip()).decode()
+            self.send('334 ' + base64.b64encode(b'Password:').decode())
+            password = base64.b64decode(self.rfile.readline().strip()).decode()
+
+        return user if password == self.server.password else None
+
+    def data(self, mail_from: str, rcpts: list):
+        self.send('354 End data with <CR><LF>.<CR><LF>')
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if line in (b'.\r\n', b''):
+                break
+            lines.append(line[1:] if line.startswith(b'..') else line)
+
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.latency)
+        with server.lock:
+            server.active -= 1
+            server.messages.append((mail_from, rcpts, b''.join(lines)))
+            n = len(server.messages)
+        self.send(f'250 2.0.0 OK queued as {n}')
+
+    def finish(self):
+        with self.server.lock:
+            self.server.handlers.remove(self)
+        super().finish()
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    """Use start() to run one. Accepted messages are server.messages, as (sender, recipients, data) tuples.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, password: str = 'pw', latency: float = 0):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.port = self.server_address[1]
+        self.password = password
+        self.latency = latency  # seconds taken to accept each message
+        self.messages = []
+        self.scripted = []  # replies to the next MAIL commands
+        self.connections = 0
+        self.active = self.max_active = 0  # messages being accepted at once (now, at most)
+        self.handlers = []
+        self.lock = threading.Lock()
+
+    def script(self, *replies):
+        """Replies to give to the next MAIL commands (from any connection) instead of accepting them, e.g. '451 4.7.1
+        Try again later', '421 4.4.2 Timeout' or 'drop'.
+        """
+        with self.lock:
+            self.scripted += replies
+
+    def drop(self):
+        """Drops every client connection.
+        """
+        with self.lock:
+            handlers = list(self.handlers)
+        for handler in handlers:
+            try:
+                handler.connection.shutdown(2)
+            except OSError:
+                pass
+
+
+def start(password: str = 'pw', latency: float = 0) -> SMTPServer:
+    """Starts a server on a free local port (server.port), in a daemon thread. Call server.shutdown() to stop it.
+    """
+    server = SMTPServer(password, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
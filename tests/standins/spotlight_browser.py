@@ -0,0 +1,125 @@
+"""Stand-in for the Chrome WebDriver spotlight_scrape drives, with just what it uses: shortlists (given as {URL: number
+of pages}) behind a sign-in form, whose performer cards render one by one once a page has loaded, paged by clicking
+the next-page arrow. Clicks can be made to go missing, to test the page waits. Pages are those of spotlight_site, with
+the cards of the k-th shortlist numbered from k * 1000.
+"""
+
+import time
+import threading
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from standins.spotlight_site import page
+
+usn_field, pwd_field = 'Username', 'Password'
+
+
+class Element:
+
+    def __init__(self, driver, text: str = '', field: str = None):
+        self.driver, self.text, self.field = driver, text, field
+        self.shown = driver.shown  # the page load it belongs to
+
+    def is_enabled(self):
+        if self.driver.shown != self.shown:
+            raise StaleElementReferenceException()
+        return True
+
+    def send_keys(self, value: str):
+        self.driver.form[self.field] = value
+
+    def click(self):
+        self.driver.click(self.field)
+
+
+class ShortlistDriver:
+    """One browser. Every driver made is in ShortlistDriver.instances.
+    """
+    instances = []
+    lock = threading.Lock()
+
+    def __init__(self, shortlists: dict, password: str = 'pw', per_page: int = 10, load: float = 0.05,
+                 render: float = 0.005, drop_clicks=()):
+        self.shortlists, self.password, self.per_page = shortlists, password, per_page
+        self.load, self.render = load, render  # seconds before the first card shows, and between cards
+        self.drop_clicks = set(drop_clicks)  # next-page clicks (counting from 1) that do nothing
+        self.url, self.page, self.pages = None, 1, 0
+        self.signed_in, self.logins, self.clicks, self.quit_called = False, 0, 0, False
+        self.form = {}
+        self.shown = 0  # page loads so far
+        self.loaded_at = time.monotonic()
+        with self.lock:
+            self.instances.append(self)
+
+    def show(self, number: int):
+        self.page, self.shown, self.loaded_at = number, self.shown + 1, time.monotonic()
+
+    def cards(self) -> int:
+        """Number of cards rendered so far.
+        """
+        elapsed = time.monotonic() - self.loaded_at - self.load
+        rendered = 0 if elapsed < 0 else min(self.per_page, int(elapsed / self.render) + 1)
+        return rendered if self.page <= self.pages else 0
+
+    # WebDriver API
+    def implicitly_wait(self, seconds):
+        pass
+
+    def get(self, url: str):
+        self.url, self.pages = url, self.shortlists[url]
+        self.show(1)
+
+    @property
+    def current_url(self):
+        return self.url
+
+    def find_elements(self, by, value: str) -> list:
+        try:
+            return [self.find_element(by, value)]
+        except NoSuchElementException:
+            pass
+
+        if not self.signed_in:
+            return []
+        if 'agency-name' in value:
+            return [Element(self) for _ in range(self.cards())]
+        if 'chevronright' in value and self.cards() and self.page < self.pages:
+            return [Element(self, field='next')]
+        if value == 'c-pagination-control' and self.cards():
+            return [Element(self, f'Page {self.page} of {self.pages}')]
+        return []
+
+    def find_element(self, by, value: str):
+        if not self.signed_in and value in (usn_field, pwd_field, 'sign-in-button'):
+            return Element(self, field=value)
+        if self.signed_in and value == 'Radio-Signal' and time.monotonic() - self.loaded_at >= self.load:
+            return Element(self)
+        raise NoSuchElementException(value)
+
+    def click(self, field: str):
+        if field == 'sign-in-button':
+            if self.form.get(pwd_field) == self.password:
+                self.signed_in = True
+                self.logins += 1
+                self.show(1)
+        elif field == 'next':
+            self.clicks += 1
+            if self.clicks not in self.drop_clicks:
+                self.show(self.page + 1)
+
+    def execute_script(self, script: str, *args):
+        if 'click' in script:
+            args[0].click()
+        elif 'userAgent' in script:
+            return 'stand-in'
+
+    @property
+    def page_source(self) -> str:
+        if not self.signed_in:
+            return '<html><body><form><input id="Username"><input id="Password"></form></body></html>'
+        offset = list(self.shortlists).index(self.url) * 1000
+        return page(offset + (self.page - 1) * self.per_page, self.cards())
+
+    def get_cookies(self) -> list:
+        return []
+
+    def quit(self):
+        self.quit_called = True
@@ -0,0 +1,61 @@
+"""Stand-in for a Spotlight shortlist served over HTTP (see spotlight_scrape.fetch_pages): 'pages' pages of 'per_page'
+performer cards, paged with ?page=N. 'mode' makes it misbehave as a real site might:
+
+- 'js': the cards are rendered by a script, so the HTML has none
+- 'ignore_param': every page number gives page 1
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+def card(i: int) -> str:
+    return (f'<div class="c-card"><img src="h{i}.jpg" alt=" performer {i} name "><div class="c-agency">'
+            f'<p class="c-agency__card-agency-name">Agency &amp; Co {i}</p>'
+            f'<a href="tel://+44 (0)20 7{i:06d}">call</a><a href="mailto:agent{i}@agency.com">mail</a></div></div>')
+
+
+def page(start: int, n: int) -> str:
+    """A shortlist page with cards start...start + n - 1.
+    """
+    return ('<html><body><img src="logo.png" alt="Spotlight logo"><div id="Radio-Signal"></div>'
+            + ''.join(card(i) for i in range(start, start + n)) + '</body></html>')
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        site = self.server
+        number = int(parse_qs(urlsplit(self.path).query).get('page', ['1'])[0])
+        if site.mode == 'ignore_param':
+            number = 1
+
+        site.requests.append(number)
+        if site.mode == 'js':
+            body = '<html><body><div id="app"></div><script src="app.js"></script></body></html>'
+        elif number <= site.pages:
+            body = page((number - 1) * site.per_page, site.per_page)
+        else:
+            body = page(0, 0)
+
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start(pages: int = 3, per_page: int = 10, mode: str = None):
+    """Starts the site on a free local port, in a daemon thread. Its URL is server.url; call server.shutdown() to stop.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.pages, server.per_page, server.mode, server.requests = pages, per_page, mode, []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/shortlist/12345'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
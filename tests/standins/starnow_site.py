@@ -0,0 +1,127 @@
+"""Stand-in for Starnow's applicants pages (see starnow_scrape): 'pages' pages of 'per_page' applicants at
+/casting/1/applicants?p=N, embedded in the page as state JSON, behind an ASP.NET-style login form and session cookie.
+A session lasts 'session_requests' requests, after which pages come back as the login form again. 'mode' makes it
+misbehave as the real site might:
+
+- 'no_count': the pages have neither 'totalPages' nor pagination links
+- 'repeat_last': as 'no_count', and any page past the last is the last page again
+"""
+
+import json
+import time
+import random
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+usn_field = 'ctl00$cphMain$signinForm$email'
+pwd_field = 'ctl00$cphMain$signinForm$password'
+
+
+def applicant(i: int) -> dict:
+    rng = random.Random(i)
+    return {'id': i, 'fullName': f'Applicant {i} Name', 'phoneNumber': f'07{rng.randrange(10 ** 9):09d}',
+            'age': rng.randint(18, 60),
+            'answers': [{'question': 'What Country Do You Represent?',
+                         'answer': rng.choice(['England', 'Wales', 'Brazil', 'Japan'])}]}
+
+
+def applicants_page(number: int, pages: int, per_page: int, mode: str = None) -> str:
+    """Page 'number' of the applicants, with no applicants past the last page (unless the mode says otherwise).
+    """
+    if mode == 'repeat_last':
+        number = min(number, pages)
+    applicants = [applicant((number - 1) * per_page + k) for k in range(per_page)] if number <= pages else []
+
+    state = {'applicants': applicants, 'page': number}
+    pagination = ''
+    if mode not in ('no_count', 'repeat_last'):
+        state['totalPages'] = pages
+        pagination = ''.join(f'<a href="?p={n}">{n}</a>' for n in range(1, pages + 1))
+
+    return (f'<html><body><div class="pagination">{pagination}</div>'
+            f'<script>window.__INITIAL_STATE__ = {json.dumps(state)};</script></body></html>')
+
+
+def login_page(return_url: str) -> str:
+    return (f'<html><body><form method="post" action="/signin?ReturnUrl={return_url}">'
+            f'<input name="__VIEWSTATE" type="hidden" value="x"><input name="{usn_field}">'
+            f'<input name="{pwd_field}" type="password"><input type="submit" value="Sign in"></form></body></html>')
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def send(self, body: str, code: int = 200, headers=()):
+        data = body.encode()
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def session(self):
+        """The request's session id, if it is one the site knows and it hasn't expired (counting this request).
+        """
+        site = self.server
+        for part in (self.headers.get('Cookie') or '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'ASP.NET_SessionId':
+                with site.lock:
+                    if site.sessions.get(value, 0) > 0:
+                        site.sessions[value] -= 1
+                        return value
+
+        return None
+
+    def do_GET(self):
+        site = self.server
+        if self.session() is None:
+            return self.send(login_page(self.path))
+
+        number = int(parse_qs(urlsplit(self.path).query).get('p', ['1'])[0])
+        with site.lock:
+            site.requests.append(number)
+            site.active += 1
+            site.max_active = max(site.max_active, site.active)
+        time.sleep(site.latency)
+        with site.lock:
+            site.active -= 1
+        self.send(applicants_page(number, site.pages, site.per_page, site.mode))
+
+    def do_POST(self):
+        site = self.server
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        if form.get(pwd_field, [''])[0] != site.password:
+            return self.send(login_page(self.path))
+
+        session = secrets.token_hex(8)
+        with site.lock:
+            site.logins += 1
+            site.sessions[session] = site.session_requests
+        return_url = parse_qs(urlsplit(self.path).query).get('ReturnUrl', ['/'])[0]
+        self.send('', 302, [('Location', return_url), ('Set-Cookie', f'ASP.NET_SessionId={session}; path=/; HttpOnly')])
+
+    def log_message(self, *args):
+        pass
+
+
+def start(pages: int = 3, per_page: int = 10, mode: str = None, password: str = 'pw', session_requests: int = 1000,
+          latency: float = 0):
+    """Starts the site on a free local port, in a daemon thread, taking 'latency' seconds to serve each page. The
+    applicants URL is server.url, the page numbers served (to signed-in requests) are server.requests, the most served
+    at once is server.max_active and the number of logins is server.logins; call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.pages, server.per_page, server.mode = pages, per_page, mode
+    server.password, server.session_requests, server.latency = password, session_requests, latency
+    server.sessions, server.requests, server.logins = {}, [], 0
+    server.active = server.max_active = 0
+    server.lock = threading.Lock()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/casting/1/applicants'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
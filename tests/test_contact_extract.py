@@ -0,0 +1,62 @@
+"""Tests for contact_extract, on the reply layouts the original NAME/PHONE regex in email_scrape handled."""
+
+import pytest
+from contact_extract import ContactExtractor, html_to_text
+
+
+@pytest.fixture
+def extractor():
+    return ContactExtractor()
+
+
+@pytest.mark.parametrize('body', [
+    'NAME: Tiana Milanovich\r\nPHONE: 07985 768 657\r\n',
+    'NAME:Tiana Milanovich PHONE:07985 768 657',
+    'NAME Tiana Milanovich\nPHONE 07985 768 657',
+    'NAME:\nTiana Milanovich\nPHONE:\n07985 768 657\n',
+    'NAME:\r\n\r\nTiana Milanovich\r\n\r\nPHONE:\r\n\r\n07985 768 657\r\n',
+    'dkjagdkasjdgsahfjdjghadhkgDALJDKGJF\r\n\r\nMDAUDJAGHFDFH\r\n\r\nNAME: Tiana Milanovich\r\nPHONE: 07985 768 657\r\n',
+])
+def test_baseline_layouts(extractor, body):
+    assert list(extractor.records(body)) == [{'Name': 'Tiana Milanovich', 'Phone Number': '07985 768 657'}]
+
+
+def test_several_people(extractor):
+    body = ('NAME: Tiana Milanovich\r\nPHONE: 07985 768 657\r\n\r\ntn  NAME: Luke Swabo\nPHONE:07595946214 xx\r\n'
+            '\r\ntdot\r\n')
+    assert list(extractor.records(body)) == [{'Name': 'Tiana Milanovich', 'Phone Number': '07985 768 657'},
+                                             {'Name': 'Luke Swabo', 'Phone Number': '07595946214'}]
+
+
+def test_all_fields(extractor):
+    body = 'NAME: Jo Bloggs PHONE: 07123 456789 EMAIL: jo@example.com AGE: 30\nAGENCY: Bright & Co\n'
+    assert list(extractor.records(body)) == [{'Name': 'Jo Bloggs', 'Phone Number': '07123 456789',
+                                              'Email': 'jo@example.com', 'Age': '30', 'Agent': 'Bright & Co'}]
+
+
+def test_empty_value_is_not_the_next_label(extractor):
+    assert list(extractor.records('NAME:\nPHONE: 07985 768 657\n')) == []
+
+
+@pytest.mark.parametrize('body', [
+    'Thanks,\n--\nThe Casting Room\nTEL: 020 7946 0000\n',
+    'AGE: 23\n',
+    'NAME: Jo Bloggs\nAGE: 23\n',
+])
+def test_incomplete_records_are_dropped(extractor, body):
+    assert list(extractor.records(body)) == []
+
+
+def test_signature_after_details(extractor):
+    body = 'NAME: Jo Bloggs\nPHONE: 07123 456789\n\nBest,\n--\nTEL: 020 7946 0000\n'
+    assert list(extractor.records(body)) == [{'Name': 'Jo Bloggs', 'Phone Number': '07123 456789'}]
+
+
+def test_html_reply(extractor):
+    body = '<html><body><p>NAME:</p><p>Jo Bloggs</p><p>EMAIL:<br>jo@example.com</p></body></html>'
+    assert list(extractor.records(html_to_text(body))) == [{'Name': 'Jo Bloggs', 'Email': 'jo@example.com'}]
+
+
+def test_label_inside_a_word(extractor):
+    assert list(extractor.records('FILENAME: x.txt\nNAME: Jo Bloggs\nPHONE: 07123 456789')) == \
+        [{'Name': 'Jo Bloggs', 'Phone Number': '07123 456789'}]
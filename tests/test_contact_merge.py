@@ -0,0 +1,40 @@
+"""Tests for contact_merge's normalisation and source detection."""
+
+import pandas as pd
+import pytest
+from contact_merge import normalise, source_of
+
+
+def keys(names, column='sound_key'):
+    df = pd.DataFrame({'name': names, 'phone': None, 'email': None})
+    return list(normalise(df)[column])
+
+
+@pytest.mark.parametrize('surname, code', [
+    ('Robert', 'R163'), ('Rupert', 'R163'), ('Rubin', 'R150'), ('Ashcraft', 'A261'), ('Ashcroft', 'A261'),
+    ('Tymczak', 'T522'), ('Pfister', 'P236'), ('Honeyman', 'H555'), ('Wright', 'W623'), ('Whalen', 'W450'),
+    ('Lee', 'L000'), ('Hwang', 'H520'),
+])
+def test_soundex(surname, code):
+    assert keys([f'Amy {surname}']) == [f'a {code}']
+
+
+def test_keys():
+    df = normalise(pd.DataFrame({'name': ["Chloë O'Neil-Smith", 'Jon Smyth', None],
+                                 'phone': ['+44 7700 900001', '7700900002.0', None],
+                                 'email': ['Mailto:Chloe@Example.com', 'STARNOW', None]}))
+    assert list(df.name_key) == ['chloe oneil smith', 'jon smyth', '']
+    assert list(df.phone_key) == ['07700900001', '07700900002', '']
+    assert list(df.email_key) == ['chloe@example.com', '', '']
+    assert list(df.sound_key) == ['c S530', 'j S530', '']
+
+
+@pytest.mark.parametrize('columns, rows, source', [
+    (['Name', 'Phone Number', 'Email'], [['Amy', '07700900001', '']], 'email'),
+    (['NAME', 'EMAIL', 'CONTACT NUMBER', 'NATIONAL TEAM'], [['Amy', 'STARNOW', '07700900001', 'Wales']], 'starnow'),
+    (['NAME', 'EMAIL', 'CONTACT NUMBER'], [['Amy', 'STARNOW', '07700900001']], 'starnow'),
+    (['NAME', 'AGENT', 'CONTACT NUMBER', 'EMAIL'], [['Amy', 'Bright', '07700900001', 'a@bright.com']], 'spotlight'),
+    (['NAME', 'AGENT', 'CONTACT NUMBER'], [['Amy', 'Bright', '07700900001']], 'spotlight'),  # no EMAIL column
+])
+def test_source_of(columns, rows, source):
+    assert source_of(pd.DataFrame(rows, columns=columns)) == source
@@ -0,0 +1,61 @@
+"""Tests for core's attachment cache."""
+
+import os
+import base64
+import pytest
+import core
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(core, 'attachment_cache', core.collections.OrderedDict())
+    monkeypatch.setattr(core, 'attachment_cache_size', 4000)  # room for two of the documents below
+    return core.attachment_cache
+
+
+def document(tmp_path, name, size=1400):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def test_parts_are_reused(tmp_path, cache):
+    path = document(tmp_path, 'cv.pdf')
+    part = core.attachment_part(path)
+    assert core.attachment_part(path) is part
+    assert part.get_content_type() == 'application/pdf' and part.get_filename() == 'cv.pdf'
+    assert base64.b64decode(part.get_payload()) == open(path, 'rb').read()
+
+
+def test_cache_is_bounded_by_encoded_size(tmp_path, cache):
+    a, b, c = (document(tmp_path, f'{n}.pdf') for n in 'abc')
+    part_a = core.attachment_part(a)
+    core.attachment_part(b)
+    core.attachment_part(a)  # now more recently used than b
+    core.attachment_part(c)
+
+    assert [key[0] for key in cache] == [a, c]
+    assert sum(len(p.get_payload()) for p in cache.values()) <= core.attachment_cache_size
+    assert core.attachment_part(a) is part_a
+
+
+def test_oversized_parts_are_not_kept(tmp_path, cache):
+    small, big = document(tmp_path, 'small.pdf'), document(tmp_path, 'big.pdf', size=5000)
+    core.attachment_part(small)
+    assert core.attachment_part(big) is not core.attachment_part(big)
+    assert [key[0] for key in cache] == [small]
+
+
+def test_changed_documents_are_encoded_again(tmp_path, cache):
+    path = document(tmp_path, 'cv.pdf')
+    part = core.attachment_part(path)
+    with open(path, 'wb') as f:
+        f.write(b'new version')
+
+    assert base64.b64decode(core.attachment_part(path).get_payload()) == b'new version'
+    assert core.attachment_part(path) is not part
+
+
+def test_empty_document(tmp_path, cache):
+    assert core.attachment_part(document(tmp_path, 'empty.txt', size=0)).get_payload() == ''
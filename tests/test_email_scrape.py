@@ -0,0 +1,155 @@
+"""Tests for email_scrape against a local stand-in IMAP server: batched fetching, incremental sync, sharded fetching and
+IDLE watch mode."""
+
+import time
+import imaplib
+import threading
+import pandas as pd
+import pytest
+import email_scrape as es
+from mailbox_sync import MailboxCheckpoint
+from records import InboxContact
+from standins import imap_server
+from standins.imap_server import reply
+
+applicants = [('Amy Smith', '07700 900001'), ('Ben Jones', '07700 900002'), ('Chloe Patel', '07700 900003')]
+
+
+@pytest.fixture
+def server():
+    server = imap_server.start([reply(*a) for a in applicants])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def connect(server):
+    M = imaplib.IMAP4('127.0.0.1', server.port)
+    M.login('me@example.com', 'pw')
+    return M
+
+
+def selected(server):
+    M = connect(server)
+    M.select(es.mailbox, readonly=True)
+    return M
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def test_iter_contacts(server):
+    server.add(reply('Dev Evans', '07700 900004', html=True, email='dev@example.com'))
+    server.add(reply('Nobody', '07700 900005', subject='Something else'))
+    M = selected(server)
+
+    records = list(es.iter_contacts(M, 'Audition', batch_size=2))
+    assert [(r.name, r.phone) for r in records] == [(n, p.replace(' ', '')) for n, p in applicants] + \
+        [('Dev Evans', '07700900004')]
+    assert records[-1].email == 'dev@example.com'
+    assert [r.uid for r in records] == [1, 2, 3, 4]
+
+
+def test_incremental_sync(server, tmp_path):
+    path = str(tmp_path / 'sync.sqlite')
+    M = selected(server)
+    with MailboxCheckpoint('me', es.mailbox, 'Audition', 1, path) as checkpoint:
+        assert len(list(es.iter_contacts(M, 'Audition', checkpoint=checkpoint))) == 3
+        assert checkpoint.last_uid == 3
+
+    server.add(reply('Dev Evans', '07700 900004'))
+    fetches = server.commands.count('UID FETCH')
+    with MailboxCheckpoint('me', es.mailbox, 'Audition', 1, path) as checkpoint:
+        assert [r.name for r in es.iter_contacts(M, 'Audition', checkpoint=checkpoint)] == ['Dev Evans']
+        assert [r.name for r in checkpoint.iter_records()] == [a[0] for a in applicants] + ['Dev Evans']
+    assert server.commands.count('UID FETCH') - fetches == 2  # headers and structure, then the one text section
+
+    with MailboxCheckpoint('me', es.mailbox, 'Audition', 2, path) as checkpoint:
+        assert checkpoint.last_uid == 0 and not list(checkpoint.iter_records())  # UIDVALIDITY changed
+
+
+def test_sharded_matches_sequential(server):
+    for i in range(20):
+        server.add(reply(f'Applicant {chr(65 + i)}', f'07700 9001{i:02d}'))
+    M = selected(server)
+
+    sequential = [(r.uid, r.name, r.phone) for r in es.iter_contacts(M, 'Audition', batch_size=4)]
+    sharded = [(r.uid, r.name, r.phone)
+               for r in es.iter_contacts_sharded(M, lambda: selected(server), 'Audition', connections=3, processes=2,
+                                                 batch_size=4)]
+    assert sharded == sequential and len(sequential) == 23
+
+
+def test_idle_sees_exists_sent_with_the_continuation(server):
+    M = selected(server)
+    server.add(reply('Dev Evans', '07700 900004'))  # announced along with the server's '+ idling'
+
+    start = time.monotonic()
+    assert es.idle(M, 5)
+    assert time.monotonic() - start < 1
+    assert M.noop()[0] == 'OK'  # IDLE ended cleanly
+
+
+def test_idle_new_message_and_timeout(server):
+    M = selected(server)
+    assert not es.idle(M, 0.2)
+
+    threading.Timer(0.2, server.add, [reply('Dev Evans', '07700 900004')]).start()
+    start = time.monotonic()
+    assert es.idle(M, 5)
+    assert time.monotonic() - start < 2
+
+
+def test_skip_written():
+    written = {1}
+    records = [InboxContact(1, 'Amy'), InboxContact(2, 'Ben'), InboxContact(2, 'Bea'), InboxContact(3, 'Cal')]
+    assert [r.name for r in es.skip_written(records, written)] == ['Ben', 'Bea', 'Cal']
+    assert written == {1, 2, 3}
+
+
+def test_watch_mailbox(server, tmp_path):
+    output = str(tmp_path / 'inbox.csv')
+    connections = []
+
+    def connect_or_stop():
+        if len(connections) == 3:
+            raise KeyboardInterrupt  # the test is over
+        connections.append(connect(server))
+        return connections[-1]
+
+    def rows():
+        try:
+            return pd.read_csv(output, dtype=str)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return pd.DataFrame(columns=es.columns)
+
+    watcher = threading.Thread(target=es.watch_mailbox,
+                               args=(connect_or_stop, 'me', 'Audition', output, 60, 0.1, str(tmp_path / 's.sqlite')), daemon=True)
+    watcher.start()
+    try:
+        wait_for(lambda: len(rows()) == 3 and server.idling)
+        server.add(reply('Dev Evans', '07700 900004'))
+        wait_for(lambda: len(rows()) == 4)
+
+        # Connection dropped: nothing is added twice on reconnecting
+        wait_for(lambda: server.idling)
+        server.drop()
+        wait_for(lambda: len(connections) == 2 and server.idling)
+        server.add(reply('Ella Brown', '07700 900005'))
+        wait_for(lambda: len(rows()) == 5)
+
+        # UIDs reset: the output is written again from scratch, rather than everything being appended again
+        wait_for(lambda: server.idling)
+        server.reset_uids(uidvalidity=2)
+        server.drop()
+        wait_for(lambda: len(connections) == 3 and server.idling)
+        assert list(rows().Name) == [a[0] for a in applicants] + ['Dev Evans', 'Ella Brown']
+    finally:
+        server.drop()
+        watcher.join(10)
+
+    assert not watcher.is_alive()
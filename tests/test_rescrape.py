@@ -0,0 +1,89 @@
+"""Tests for rescrape: the page cache and merging a fresh scrape into the previous output."""
+
+import pandas as pd
+import pytest
+from records import SpotlightContact
+from rescrape import PageCache, OutputMerge, page_hash
+
+columns = ['NAME', 'AGENT', 'CONTACT?']
+
+
+def merger(rows, columns=columns):
+    previous = pd.DataFrame(rows, columns=columns + ['NOTES'], dtype=str).fillna('')
+    return OutputMerge(previous, columns, ['NAME', 'AGENT'], ['CONTACT?'])
+
+
+def test_manual_and_added_columns_are_kept():
+    m = merger([['Amy', 'Bright', 'y', 'called']])
+    assert m.columns == columns + ['NOTES']
+    assert m.row(['Amy', 'Bright', None]) == ['Amy', 'Bright', 'y', 'called']
+    assert m.row(['Ben', 'Bright', None]) == ['Ben', 'Bright', None, None]
+    assert m.summary() == '1 added, 0 changed, 0 removed'
+
+
+def test_rows_sharing_a_key_are_paired_in_order(tmp_path):
+    m = merger([['Amy', 'Bright', 'y', 'hi'], ['Amy', 'Bright', 'n', 'x'], ['Amy', 'Bright', '', 'third']])
+    assert m.row(['Amy', 'Bright', None]) == ['Amy', 'Bright', 'y', 'hi']
+    assert m.row(['Amy', 'Bright', None]) == ['Amy', 'Bright', 'n', 'x']
+
+    assert m.removed() == [{'NAME': 'Amy', 'AGENT': 'Bright', 'CONTACT?': '', 'NOTES': 'third'}]
+    assert m.report(str(tmp_path / 'log.csv'), 'list') == 1
+    log = pd.read_csv(tmp_path / 'log.csv', dtype=str)
+    assert list(log[['CHANGE', 'NAME', 'DETAILS']].iloc[0]) == ['removed', 'Amy', 'NOTES: third']
+
+
+def test_changes_are_logged(tmp_path):
+    m = OutputMerge(pd.DataFrame([['Amy', 'Bright', '07700', 'y']], columns=['NAME', 'AGENT', 'PHONE', 'CONTACT?']),
+                    ['NAME', 'AGENT', 'PHONE', 'CONTACT?'], ['NAME', 'AGENT'], ['CONTACT?'])
+    m.row(['Amy', 'Bright', '07800', None])
+    m.report(str(tmp_path / 'log.csv'), 'list')
+    log = pd.read_csv(tmp_path / 'log.csv', dtype=str)
+    assert list(log[['CHANGE', 'DETAILS']].iloc[0]) == ['changed', 'PHONE: 07700 -> 07800']
+
+
+def test_no_previous_output():
+    m = OutputMerge(None, columns, ['NAME', 'AGENT'], ['CONTACT?'])
+    assert m.row(['Amy', 'Bright', None]) == ['Amy', 'Bright', None]
+    assert m.summary() == '1 added, 0 changed, 0 removed'
+
+
+def test_page_hash_ignores_volatile_parts():
+    assert page_hash('<input type="hidden" value="a">x') == page_hash('<input type="hidden" value="b">x')
+    assert page_hash('x') != page_hash('y')
+    assert page_hash('x', '1') != page_hash('x', '2')
+
+
+@pytest.fixture
+def parse():
+    calls = []
+
+    def parse(page):
+        calls.append(page)
+        return [SpotlightContact(page.upper(), 'Agent')]
+
+    parse.calls = calls
+    return parse
+
+
+def test_page_cache(tmp_path, parse):
+    path = str(tmp_path / 'cache.sqlite')
+    with PageCache('spotlight', SpotlightContact, path) as cache:
+        assert cache.parse('u1', 'amy', parse) == [SpotlightContact('AMY', 'Agent')]
+        assert cache.parse('u1', 'amy', parse) == [SpotlightContact('AMY', 'Agent')]
+        assert cache.parse('u1', 'ben', parse) == [SpotlightContact('BEN', 'Agent')]
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    with PageCache('spotlight', SpotlightContact, path) as cache:
+        cache.parse('u1', 'ben', parse)
+        assert cache.hits == 1
+    assert parse.calls == ['amy', 'ben']
+
+
+def test_page_cache_version(tmp_path, parse):
+    path = str(tmp_path / 'cache.sqlite')
+    with PageCache('spotlight', SpotlightContact, path, version=1) as cache:
+        cache.parse('u1', 'amy', parse)
+    with PageCache('spotlight', SpotlightContact, path, version=2) as cache:
+        cache.parse('u1', 'amy', parse)
+        assert cache.misses == 1
+    assert parse.calls == ['amy', 'amy']
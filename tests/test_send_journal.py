@@ -0,0 +1,51 @@
+"""Tests for send_journal.SendJournal and the Message-IDs of the emails it records."""
+
+import sqlite3
+import socket
+import pytest
+import core
+from send_journal import SendJournal
+
+
+def sent(path):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT recipient FROM sends ORDER BY sent_at")]
+
+
+def test_each_record_is_written_as_it_is_sent(tmp_path):
+    path = str(tmp_path / 'journal.sqlite')
+    journal = SendJournal(path)
+    journal.record('<1@example.com>', 'me@example.com', 'a@agency.com', 'Amy', 'Audition')
+    journal.record('<2@example.com>', 'me@example.com', 'b@agency.com', 'Ben', 'Audition')
+
+    assert sent(path) == ['a@agency.com', 'b@agency.com']  # without closing the journal (e.g. the run was killed)
+    journal.close()
+
+
+def test_records_are_kept_on_an_error(tmp_path):
+    path = str(tmp_path / 'journal.sqlite')
+    with pytest.raises(RuntimeError):
+        with SendJournal(path) as journal:
+            journal.record('<1@example.com>', 'me@example.com', 'a@agency.com', 'Amy', 'Audition')
+            raise RuntimeError('connection lost')
+
+    with SendJournal(path) as journal:
+        assert journal.already_sent('a@agency.com', 'Audition')
+        assert not journal.already_sent('a@agency.com', 'Recall')
+        assert journal.count_since('me@example.com', 60) == 1
+
+
+def test_message_id_domain_is_looked_up_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(socket, 'getfqdn', lambda *a: calls.append(a) or 'host.local')
+    core.message_id_domain.cache_clear()
+
+    ids = [core.build_email('Hi $N', 'Audition', 'me@treepetts.co.uk', f'{n}@agency.com', n)['Message-ID']
+           for n in 'abc']
+    assert all(i.endswith('@treepetts.co.uk>') for i in ids) and len(set(ids)) == 3
+    assert not calls
+
+    core.build_email('Hi $N', 'Audition', 'me', 'a@agency.com', 'a')
+    core.build_email('Hi $N', 'Audition', 'me', 'b@agency.com', 'b')
+    assert len(calls) == 1
+    core.message_id_domain.cache_clear()
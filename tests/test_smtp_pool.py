@@ -0,0 +1,107 @@
+"""Tests for smtp_pool's retries and how they drive the rate limiter."""
+
+import smtplib
+import pytest
+from smtp_pool import SMTPSessionPool, dropped_session, temporary_failure
+from rate_limit import ProviderRateLimiter
+
+
+class Session:
+    """Session that fails with each of 'errors' in turn before sending."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = 0
+        self.closed = False
+
+    def send_raw(self, *args):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent += 1
+
+    def close(self):
+        self.closed = True
+
+
+def pool(sessions, replacements=()):
+    """Pool holding 'sessions' (already open), which opens 'replacements' in turn when it reconnects."""
+    replacements = list(replacements)
+    limiter = ProviderRateLimiter(per_minute=600, per_day=100, connections=1, backoff=0)
+    p = SMTPSessionPool('localhost', 'me@example.com', 'pw', size=len(sessions) or 1, sessions=sessions,
+                        limiter=limiter)
+    p.connect = lambda: replacements.pop(0)
+    return p
+
+
+timeout = smtplib.SMTPSenderRefused(421, b'4.4.2 Timeout - closing connection', 'me@example.com')
+busy = smtplib.SMTPSenderRefused(451, b'4.7.1 Try again later', 'me@example.com')
+banned = smtplib.SMTPSenderRefused(550, b'5.7.1 Sender rejected', 'me@example.com')
+
+
+@pytest.mark.parametrize('error, dropped, temporary', [
+    (smtplib.SMTPServerDisconnected('Connection unexpectedly closed'), True, False),
+    (timeout, True, True),
+    (busy, True, True),
+    (banned, False, False),
+    (smtplib.SMTPDataError(421, b'closing'), True, True),
+    (smtplib.SMTPDataError(452, b'too many'), False, True),
+    (smtplib.SMTPDataError(554, b'spam'), False, False),
+])
+def test_error_kinds(error, dropped, temporary):
+    assert dropped_session(error) == dropped
+    assert temporary_failure(error) == temporary
+
+
+@pytest.mark.parametrize('error', [smtplib.SMTPServerDisconnected('Connection unexpectedly closed'), timeout])
+def test_idle_session_dropping_does_not_slow_sending(error):
+    stale, replacement = Session([error]), Session()
+    p = pool([stale], [replacement])
+
+    p.send_raw('msg')
+    assert stale.closed and replacement.sent == 1
+    assert p.limiter.rate == p.limiter.max_rate
+    assert p.limiter.sent_today == 1
+
+
+def test_refusals_slow_sending():
+    session = Session([busy])
+    p = pool([session], [Session()])
+
+    p.send_raw('msg')
+    assert p.limiter.rate == p.limiter.max_rate / 2 + p.limiter.max_rate / 20
+    assert p.limiter.sent_today == 1
+
+
+def test_new_session_refused_with_421_slows_sending():
+    p = pool([Session([timeout])], [Session([timeout]), Session()])
+
+    p.send_raw('msg')
+    assert p.limiter.rate < p.limiter.max_rate  # the second 421 came from a session opened just now
+
+
+def test_permanent_sender_refusal_is_not_retried():
+    session = Session([banned])
+    p = pool([session], [])
+
+    with pytest.raises(smtplib.SMTPSenderRefused):
+        p.send_raw('msg')
+    assert not session.closed
+    assert p.limiter.rate == p.limiter.max_rate
+
+
+def test_failed_reconnect_gives_up_the_dead_session():
+    stale = Session([timeout])
+    p = pool([stale])
+
+    def connect():
+        raise ConnectionRefusedError('server down')
+    p.connect = connect
+
+    with pytest.raises(ConnectionRefusedError):
+        p.send_raw('msg')
+    assert stale.closed and p._idle.empty() and p._opened == 0
+
+    replacement = Session()
+    p.connect = lambda: replacement
+    p.send_raw('msg')  # opens a new session in its place
+    assert replacement.sent == 1 and p._opened == 1
@@ -0,0 +1,129 @@
+"""Tests for sending a campaign (smtp_pool, outbox, send_journal) against a local stand-in SMTP server."""
+
+import email
+import time
+import pytest
+import core
+from core import EmailTemplate
+from outbox import Outbox, spool_campaign
+from rate_limit import ProviderRateLimiter
+from send_journal import SendJournal
+from smtp_pool import SMTPSessionPool, send_campaign
+from standins import smtp_server
+
+sender = 'me@treepetts.co.uk'
+recipients = [(f'agent{i}@agency{i}.com', f'Performer {i}') for i in range(12)]
+template = 'Dear $N,\n\nWe would like to see **your client** for the role.'
+
+
+@pytest.fixture
+def server():
+    server = smtp_server.start(latency=0.05)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def pool(server, size=4, **limits):
+    limiter = ProviderRateLimiter(**{'per_minute': 6000, 'per_day': 1000, 'connections': size, 'backoff': 0, **limits})
+    return SMTPSessionPool('127.0.0.1', sender, 'pw', size=size, port=server.port, limiter=limiter)
+
+
+def delivered(server):
+    return sorted((rcpts[0], email.message_from_bytes(data)['To']) for _, rcpts, data in server.messages)
+
+
+def test_campaign_over_pool(server, tmp_path):
+    p = pool(server)
+    with SendJournal(str(tmp_path / 'journal.sqlite')) as journal:
+        start = time.monotonic()
+        assert send_campaign(p, template, 'Audition', recipients, journal=journal) == []
+        elapsed = time.monotonic() - start
+
+        assert all(journal.already_sent(to, 'Audition') for to, _ in recipients)
+        assert journal.count_since(sender, 60) == len(recipients)
+    p.close()
+
+    assert delivered(server) == sorted((to, to) for to, _ in recipients)
+    assert server.connections == 4 and 1 < server.max_active <= 4
+    assert elapsed < len(recipients) * server.latency  # the messages went over the connections at once
+
+    data = [d for _, rcpts, d in server.messages if rcpts == [recipients[3][0]]][0].decode()
+    assert 'Dear Performer 3' in data and '<strong>your client</strong>' in data
+
+
+def test_journal_has_message_ids_and_replies(server, tmp_path):
+    path = str(tmp_path / 'journal.sqlite')
+    p = pool(server, size=2)
+    with SendJournal(path) as journal:
+        send_campaign(p, template, 'Audition', recipients[:2], journal=journal)
+        rows = journal._conn.execute("SELECT message_id, recipient, response FROM sends ORDER BY recipient").fetchall()
+    p.close()
+
+    ids = {email.message_from_bytes(data)['Message-ID'] for _, _, data in server.messages}
+    assert {r[0] for r in rows} == ids and all(i.endswith('@treepetts.co.uk>') for i in ids)
+    assert [r[1] for r in rows] == [to for to, _ in recipients[:2]]
+    assert all(r[2].startswith('250 2.0.0 OK queued') for r in rows)
+
+
+@pytest.mark.parametrize('failure', ['drop', '421 4.4.2 Timeout - closing connection'])
+def test_sessions_dropped_while_idle_are_replaced_without_slowing_down(server, failure):
+    p = pool(server, size=1)
+    p.send_email(template, 'Audition', sender, *recipients[0])
+    if failure == 'drop':
+        server.drop()
+    else:
+        server.script(failure)
+    p.send_email(template, 'Audition', sender, *recipients[1])
+    p.close()
+
+    assert delivered(server) == sorted((to, to) for to, _ in recipients[:2])
+    assert server.connections == 2
+    assert p.limiter.rate == p.limiter.max_rate and p.limiter.sent_today == 2
+
+
+def test_throttling_is_retried_and_slows_down(server):
+    p = pool(server, size=1)
+    server.script('451 4.7.1 Try again later')
+    p.send_email(template, 'Audition', sender, *recipients[0])
+    p.close()
+
+    assert len(server.messages) == 1
+    assert p.limiter.rate < p.limiter.max_rate and p.limiter.sent_today == 1
+
+
+def test_permanent_refusal_fails_that_email_only(server, capsys):
+    p = pool(server, size=1)
+    server.script('550 5.7.1 Sender rejected')
+    failed = send_campaign(p, template, 'Audition', recipients[:3])
+    p.close()
+
+    assert [to for to, _, _ in failed] == [recipients[0][0]]
+    assert delivered(server) == sorted((to, to) for to, _ in recipients[1:3])
+    assert 'FAILED to mail agent0@agency0.com' in capsys.readouterr().out
+
+
+def test_outbox_resumes_without_resending(server, tmp_path, capsys):
+    outbox = Outbox(str(tmp_path / 'outbox'))
+    msg_template = EmailTemplate(template, False)
+
+    p = pool(server, size=3)
+    server.script('550 5.7.1 Sender rejected')  # one email fails on the first run
+    failed = spool_campaign(p, outbox, msg_template, 'Audition', recipients, processes=2)
+    assert len(failed) == 1 and len(server.messages) == len(recipients) - 1
+
+    capsys.readouterr()
+    assert spool_campaign(p, outbox, msg_template, 'Audition', recipients, processes=2) == []
+    p.close()
+
+    assert delivered(server) == sorted((to, to) for to, _ in recipients)
+    assert capsys.readouterr().out.count('Already mailed') == len(recipients) - 1
+    assert len(list((tmp_path / 'outbox' / 'sent').iterdir())) == len(recipients)
+    assert not list((tmp_path / 'outbox' / 'pending').iterdir())
+
+
+def test_wrong_password(server):
+    p = SMTPSessionPool('127.0.0.1', sender, 'wrong', size=1, port=server.port)
+    with pytest.raises(core.smtplib.SMTPAuthenticationError):
+        p.send_email(template, 'Audition', sender, *recipients[0])
+    assert not server.messages
@@ -0,0 +1,120 @@
+"""Tests for spotlight_scrape in the browser, against a stand-in WebDriver: page waits, scraping several shortlists on a
+pool of drivers, and updating an earlier scrape."""
+
+import os
+import time
+import pandas as pd
+import pytest
+import spotlight_scrape as sp
+import table_io
+from standins.spotlight_browser import ShortlistDriver, usn_field, pwd_field
+
+urls = [f'https://www.spotlight.com/shortlist/{n}' for n in (111, 222, 333)]
+login = (usn_field, 'me', pwd_field, 'pw')
+
+
+@pytest.fixture(autouse=True)
+def drivers(monkeypatch, tmp_path):
+    monkeypatch.setattr(table_io, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(ShortlistDriver, 'instances', [])
+    return ShortlistDriver.instances
+
+
+def use_drivers(monkeypatch, shortlists, **kwargs):
+    monkeypatch.setattr(sp, 'chrome_driver', lambda headless=False, block_assets=False: ShortlistDriver(shortlists,
+                                                                                                        **kwargs))
+
+
+def performers(k, pages, per_page=10):
+    return [f'Performer {k * 1000 + i} Name' for i in range(pages * per_page)]
+
+
+def scrape(outfile, webpages=urls, **kwargs):
+    sp.main(webpages, *login, outfile, timeout=2, settle=0.05, store=None, cache=None, **kwargs)
+
+
+def test_page_waits_get_every_card():
+    driver = ShortlistDriver({urls[0]: 3}, load=0.1, render=0.01)
+    start = time.monotonic()
+    pages = [rows for rows, _ in sp.shortlist_pages(driver, urls[0], login, timeout=2, settle=0.05)]
+
+    assert [len(rows) for rows in pages] == [10, 10, 10]
+    assert [r.name for rows in pages for r in rows] == performers(0, 3)
+    assert pages[0][0].agent == 'Agency & Co 0' and pages[0][1].phone == '440207000001'
+    assert driver.logins == 1
+    assert time.monotonic() - start < 2  # no fixed sleeps
+
+
+def test_lost_clicks_are_retried(capsys):
+    driver = ShortlistDriver({urls[0]: 3}, drop_clicks={1})
+    pages = [rows for rows, _ in sp.shortlist_pages(driver, urls[0], login, timeout=0.3, settle=0.05)]
+
+    assert [r.name for rows in pages for r in rows] == performers(0, 3)
+    assert driver.clicks == 3
+    assert 'Next page not ready after 0.3s (attempt 1/3)' in capsys.readouterr().out
+
+
+def test_page_not_loading_times_out():
+    driver = ShortlistDriver({urls[0]: 1}, load=5)
+    with pytest.raises(sp.TimeoutException):
+        sp.open_shortlist(driver, urls[0], *login, timeout=0.3)
+
+
+def test_shortlists_on_a_pool_of_drivers(monkeypatch, tmp_path, drivers):
+    use_drivers(monkeypatch, dict(zip(urls, [3, 1, 2])))
+    outfile = str(tmp_path / 'shortlists.xlsx')
+    scrape(outfile, drivers=2, headless=True)
+
+    sheets = pd.read_excel(outfile, sheet_name=None, dtype=str)
+    assert list(sheets) == ['1 111', '2 222', '3 333']
+    for k, (df, pages) in enumerate(zip(sheets.values(), [3, 1, 2])):
+        assert list(df.columns) == sp.columns and list(df.NAME) == performers(k, pages)
+
+    assert len(drivers) == 2
+    assert sum(d.logins for d in drivers) == 2  # each signed in once, for its first shortlist
+    assert all(d.quit_called for d in drivers)
+
+
+def test_merged_output(monkeypatch, tmp_path):
+    use_drivers(monkeypatch, dict(zip(urls, [2, 1, 1])))
+    outfile = str(tmp_path / 'shortlists.csv')
+    scrape(outfile, drivers=3)
+
+    df = pd.read_csv(outfile, dtype=str)
+    assert list(df.columns) == ['SHORTLIST'] + sp.columns
+    assert sorted(df.NAME) == sorted(performers(0, 2) + performers(1, 1) + performers(2, 1))
+    assert set(df.SHORTLIST) == {'111', '222', '333'}
+
+
+def hand_edit(sheets):
+    for df in sheets.values():
+        df.loc[0, 'CONTACT?'] = 'yes'
+        df['NOTES'] = None
+        df.loc[1, 'NOTES'] = 'called'
+    return sheets
+
+
+def test_update_keeps_hand_edits(monkeypatch, tmp_path):
+    outfile = str(tmp_path / 'shortlists.xlsx')
+    use_drivers(monkeypatch, dict(zip(urls, [2, 2, 2])))
+    scrape(outfile, drivers=2)
+
+    sheets = hand_edit(pd.read_excel(outfile, sheet_name=None, dtype=str))
+    with pd.ExcelWriter(outfile) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+
+    # The last shortlist loses a page, and the shortlists are given in another order
+    use_drivers(monkeypatch, dict(zip(urls, [2, 2, 1])))
+    scrape(outfile, [urls[2], urls[0], urls[1]], drivers=2, update=True)
+
+    sheets = pd.read_excel(outfile, sheet_name=None, dtype=str)
+    assert list(sheets) == ['1 333', '2 111', '3 222']
+    for name, df in sheets.items():
+        k = urls.index(f'https://www.spotlight.com/shortlist/{name[2:]}')
+        assert list(df.columns) == sp.columns + ['NOTES']
+        assert list(df.NAME) == performers(k, 1 if k == 2 else 2)
+        assert df['CONTACT?'][0] == 'yes' and df.NOTES[1] == 'called'
+
+    changes = pd.read_csv(os.path.join(tmp_path, 'shortlists.changes.csv'), dtype=str)
+    assert changes.groupby(['LIST', 'CHANGE']).size().to_dict() == {('333', 'removed'): 10}
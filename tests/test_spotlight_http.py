@@ -0,0 +1,62 @@
+"""Tests for spotlight_scrape's --http mode (fetch_pages), against a local stand-in site."""
+
+import pytest
+import requests
+import spotlight_scrape as sp
+from standins import spotlight_site
+
+
+@pytest.fixture
+def site(request):
+    server = spotlight_site.start(**getattr(request, 'param', {}))
+    yield server
+    server.shutdown()
+
+
+def browser_page_1(site):
+    """What the browser would parse from page 1 of a site that renders normally."""
+    return sp.parse_page(spotlight_site.page(0, site.per_page))
+
+
+def scrape(site, pages, first=None):
+    rows = [row for rows, _ in sp.fetch_pages(requests.Session(), site.url, pages, workers=2, first=first)
+            for row in rows]
+    return [r.name for r in rows]
+
+
+@pytest.mark.parametrize('pages', [3, None])
+def test_all_pages(site, pages):
+    names = scrape(site, pages, browser_page_1(site))
+    assert names == [f'Performer {i} Name' for i in range(30)]
+    assert sorted(set(site.requests))[:3] == [1, 2, 3]
+
+
+def test_page_count():
+    assert sp.page_count('Page 1 of 12') == 12
+    assert sp.page_count('Showing 25 per page, page 3 of 4') == 4
+    assert sp.page_count('1 2 3 Next') is None
+
+
+@pytest.mark.parametrize('site', [{'mode': 'js'}], indirect=True)
+@pytest.mark.parametrize('pages', [3, None])
+def test_page_rendered_by_script(site, pages):
+    with pytest.raises(sp.PagingFailed, match='Page 1'):
+        scrape(site, pages, browser_page_1(site))
+
+
+@pytest.mark.parametrize('site', [{'mode': 'ignore_param'}], indirect=True)
+def test_page_parameter_ignored(site):
+    with pytest.raises(sp.PagingFailed, match='Page 2 of 3 .* a repeat'):
+        scrape(site, 3, browser_page_1(site))
+
+
+@pytest.mark.parametrize('site', [{'mode': 'ignore_param'}], indirect=True)
+def test_page_parameter_ignored_count_unknown(site, capsys):
+    assert len(scrape(site, None, browser_page_1(site))) == 10
+    assert 'Page 2 is the same as page 1' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('site', [{'pages': 2}], indirect=True)
+def test_empty_page_within_count(site):
+    with pytest.raises(sp.PagingFailed, match='Page 3 of 3 .* empty'):
+        scrape(site, 3, browser_page_1(site))
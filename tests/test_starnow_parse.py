@@ -0,0 +1,54 @@
+"""Tests for starnow_scrape's parsing of the applicant state embedded in a page."""
+
+import json
+from starnow_scrape import parse_applicants, page_count
+
+state = {'applicants': {'items': [
+    {'id': 11, 'fullName': 'Amy Smith', 'phoneNumber': '07700900001', 'age': 24,
+     'answers': [{'question': {'id': 1, 'text': 'What Country Do You Represent?'}, 'answer': 'Wales'}]},
+    {'id': 12, 'fullName': 'Ben Jones', 'phoneNumber': '07700900002', 'age': '31', 'answers': []},
+]}, 'totalPages': 3}
+
+
+def page(*scripts) -> bytes:
+    return ('<html><body>' + ''.join(scripts) + '</body></html>').encode()
+
+
+def json_block(value):
+    return f'<script type="application/json">{json.dumps(value)}</script>'
+
+
+def assignment(value):
+    return f'<script>window.__INITIAL_STATE__ = {json.dumps(value)};</script>'
+
+
+def json_parse(value):
+    return f'<script>window.state = JSON.parse({json.dumps(json.dumps(value))});</script>'
+
+
+def test_applicants():
+    applicants = parse_applicants(page(assignment(state)))
+    assert [(a.name, a.phone, a.age) for a in applicants] == [('Amy Smith', '07700900001', 24),
+                                                              ('Ben Jones', '07700900002', 31)]
+    assert applicants[0].answers == {'What Country Do You Represent?': 'Wales'}
+    assert page_count(page(assignment(state))) == 3
+
+
+def test_state_embedded_twice_gives_each_applicant_once():
+    for scripts in [(json_block(state), assignment(state)), (assignment(state), json_parse(state)),
+                    (json_block(state), assignment(state), json_parse(state))]:
+        assert [a.name for a in parse_applicants(page(*scripts))] == ['Amy Smith', 'Ben Jones']
+
+
+def test_applicants_without_ids_are_matched_by_name_and_phone():
+    items = [{'fullName': 'Amy Smith', 'phoneNumber': '07700900001'},
+             {'fullName': 'Amy Smith', 'phoneNumber': '07700900009'}]  # two people of the same name
+    value = {'applicants': items}
+    assert [a.phone for a in parse_applicants(page(json_block(value), assignment(value)))] == ['07700900001',
+                                                                                             '07700900009']
+
+
+def test_id_next_to_the_profile():
+    value = {'applicants': [{'applicantId': 5, 'profile': {'fullName': 'Amy Smith'}, 'answers': []},
+                            {'applicantId': 6, 'profile': {'fullName': 'Amy Smith'}, 'answers': []}]}
+    assert len(parse_applicants(page(json_block(value), assignment(value)))) == 2
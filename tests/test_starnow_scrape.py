@@ -0,0 +1,131 @@
+"""Tests for starnow_scrape's paging and session against a local stand-in site."""
+
+import os
+import time
+import functools
+import pandas as pd
+import pytest
+import table_io
+import starnow_scrape as sn
+from standins import starnow_site
+
+
+@pytest.fixture
+def site(request):
+    server = starnow_site.start(**getattr(request, 'param', {}))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def session(site, tmp_path, pwd='pw'):
+    return sn.StarnowSession(starnow_site.usn_field, 'me@example.com', starnow_site.pwd_field, pwd,
+                             cookie_dir=str(tmp_path))
+
+
+def names(pages):
+    return [a.name for _, applicants in pages for a in applicants]
+
+
+def expected(pages, per_page):
+    return [f'Applicant {i} Name' for i in range(pages * per_page)]
+
+
+@pytest.mark.parametrize('site', [{'pages': 5, 'per_page': 4}], indirect=True)
+def test_counted_pages(site, tmp_path):
+    pages = list(sn.fetch_pages(session(site, tmp_path), site.url, workers=3))
+    assert [url for url, _ in pages] == [f'{site.url}?p={n}' for n in range(1, 6)]
+    assert names(pages) == expected(5, 4)
+    assert sorted(site.requests) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize('site', [{'pages': 5, 'per_page': 4, 'mode': 'no_count'},
+                                  {'pages': 5, 'per_page': 4, 'mode': 'repeat_last'}], indirect=True)
+def test_uncounted_pages_are_fetched_until_one_is_empty(site, tmp_path, capsys):
+    pages = list(sn.fetch_pages(session(site, tmp_path), site.url, workers=3))
+    assert names(pages) == expected(5, 4)
+    assert "Couldn't find the number of pages" in capsys.readouterr().out
+    assert max(site.requests) <= 7  # in batches of 'workers', stopping at the batch with the end in it
+
+
+@pytest.mark.parametrize('site', [{'pages': 0, 'mode': 'no_count'}], indirect=True)
+def test_no_applicants(site, tmp_path):
+    assert names(sn.fetch_pages(session(site, tmp_path), site.url)) == []
+    assert site.requests == [1]
+
+
+@pytest.mark.parametrize('site', [{'pages': 5, 'per_page': 4}], indirect=True)
+def test_given_page_count(site, tmp_path):
+    assert names(sn.fetch_pages(session(site, tmp_path), site.url, pages=2)) == expected(2, 4)
+
+
+@pytest.mark.parametrize('site', [{'pages': 12, 'per_page': 2, 'latency': 0.1}], indirect=True)
+def test_pages_are_fetched_at_once_and_yielded_in_order(site, tmp_path):
+    start = time.monotonic()
+    pages = list(sn.fetch_pages(session(site, tmp_path), site.url, workers=6))
+
+    assert names(pages) == expected(12, 2)
+    assert 1 < site.max_active <= 6
+    assert time.monotonic() - start < 12 * site.latency
+
+
+@pytest.mark.parametrize('site', [{'pages': 4}], indirect=True)
+def test_one_login_is_kept_for_every_page_and_the_next_run(site, tmp_path):
+    first = session(site, tmp_path)
+    assert len(names(sn.fetch_pages(first, site.url, workers=4))) == 40
+    first.save()
+    assert first.logins == 1 and site.logins == 1
+    assert os.stat(first.cookie_path).st_mode & 0o777 == 0o600
+
+    second = session(site, tmp_path)  # signed in already, with the saved cookies
+    assert len(names(sn.fetch_pages(second, site.url, workers=4))) == 40
+    assert second.logins == 0 and site.logins == 1
+
+
+@pytest.mark.parametrize('site', [{'pages': 6, 'session_requests': 3}], indirect=True)
+def test_expired_session_signs_in_again(site, tmp_path):
+    s = session(site, tmp_path)
+    assert names(sn.fetch_pages(s, site.url, workers=1)) == expected(6, 10)
+    assert s.logins == site.logins == 2
+
+
+def test_wrong_password(site, tmp_path):
+    with pytest.raises(sn.LoginFailed):
+        list(sn.fetch_pages(session(site, tmp_path, pwd='wrong'), site.url))
+
+
+@pytest.mark.parametrize('site', [{'pages': 3, 'per_page': 4}], indirect=True)
+def test_update_keeps_self_tape_columns(site, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(table_io, 'cache_dir', str(tmp_path / 'table cache'))
+    monkeypatch.setattr(sn.subprocess, 'call', lambda *args: 0)  # don't open the output
+    outfile, cache = str(tmp_path / 'applicants.xlsx'), str(tmp_path / 'pages.sqlite')
+
+    def scrape(update):
+        sn.main(site.url, None, starnow_site.usn_field, 'me@example.com', starnow_site.pwd_field, 'pw', outfile,
+                workers=3, store=None, update=update, cache=cache)
+
+    monkeypatch.setattr(sn, 'StarnowSession', functools.partial(sn.StarnowSession, cookie_dir=str(tmp_path)))
+    scrape(False)
+    df = pd.read_excel(outfile, dtype=str)
+    assert list(df.NAME) == expected(3, 4)
+    assert set(df['NATIONAL TEAM']) <= {'England', 'Wales', 'Brazil', 'Japan'}
+
+    df.loc[0, 'Asked to self tape?'] = 'yes'
+    df['NOTES'] = None
+    df.loc[1, 'NOTES'] = 'called'
+    df.to_excel(outfile, index=False)
+
+    capsys.readouterr()
+    scrape(True)
+    out = capsys.readouterr().out
+    assert 'Signed in 0 time(s)' in out and '3 unchanged page(s) taken from the page cache' in out
+    assert '0 added, 0 changed, 0 removed' in out
+
+    site.pages = 2  # the last page's applicants have withdrawn
+    scrape(True)
+    assert '0 added, 0 changed, 4 removed' in capsys.readouterr().out
+
+    df = pd.read_excel(outfile, dtype=str)
+    assert list(df.NAME) == expected(2, 4)
+    assert df['Asked to self tape?'][0] == 'yes' and df.NOTES[1] == 'called'
+    assert os.path.exists(str(tmp_path / 'applicants.changes.csv'))
@@ -0,0 +1,140 @@
+"""Tests for table_io: the output sinks and read_table's cache."""
+
+import os
+import json
+import pandas as pd
+import pytest
+import table_io
+from table_io import open_sink, read_table
+from records import SpotlightContact
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache')
+    monkeypatch.setattr(table_io, 'cache_dir', path)
+    return path
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    """A spreadsheet like a shortlist, with numbers, text and blanks in the same columns."""
+    path = str(tmp_path / 'shortlist.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({'NAME': ['Amy', 'Ben', 'Cal'], 'CONTACT NUMBER': [7700900001, '07700 900002', None],
+                      'CONTACT?': ['y', None, 1]}).to_excel(writer, sheet_name='1 111', index=False)
+        pd.DataFrame({'NAME': ['Dev'], 'AGE': [30]}).to_excel(writer, sheet_name='2 222', index=False)
+    return path
+
+
+def entries(cache_dir):
+    return os.listdir(cache_dir) if os.path.exists(cache_dir) else []
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'keep_default_na': False}, {'dtype': str, 'keep_default_na': False},
+                                    {'sheet_name': None}, {'sheet_name': None, 'dtype': str}])
+def test_cached_read_is_the_same(sheet, cache_dir, kwargs):
+    first = read_table(sheet, **kwargs)
+    assert len(entries(cache_dir)) == 1
+    second = read_table(sheet, **kwargs)
+
+    if isinstance(first, dict):
+        assert list(first) == list(second) == ['1 111', '2 222']
+        for name in first:
+            pd.testing.assert_frame_equal(first[name], second[name])
+    else:
+        pd.testing.assert_frame_equal(first, second)
+        assert [type(v) for v in first['CONTACT?']] == [type(v) for v in second['CONTACT?']]
+
+
+def test_cache_is_used_until_the_file_changes(sheet, monkeypatch):
+    calls = []
+    read_excel = pd.read_excel
+    monkeypatch.setattr(pd, 'read_excel', lambda *a, **k: calls.append(a) or read_excel(*a, **k))
+
+    read_table(sheet, keep_default_na=False)
+    read_table(sheet, keep_default_na=False)
+    assert len(calls) == 1
+
+    read_table(sheet)  # other arguments: read again
+    assert len(calls) == 2
+
+    with pd.ExcelWriter(sheet) as writer:
+        pd.DataFrame({'NAME': ['Eve']}).to_excel(writer, index=False)
+    os.utime(sheet, ns=(1, 1))
+    assert list(read_table(sheet, keep_default_na=False).NAME) == ['Eve']
+    assert len(calls) == 3
+
+
+def test_nothing_is_left_next_to_the_file(sheet, tmp_path):
+    read_table(sheet)
+    assert sorted(os.listdir(tmp_path)) == ['cache', 'shortlist.xlsx']
+    assert os.stat(tmp_path / 'cache').st_mode & 0o077 == 0
+
+
+@pytest.mark.parametrize('damage', ['garbage', 'other pandas', 'missing parquet'])
+def test_unusable_cache_is_a_miss(sheet, cache_dir, damage):
+    expected = read_table(sheet, keep_default_na=False)
+    entry = os.path.join(cache_dir, entries(cache_dir)[0])
+
+    if damage == 'garbage':
+        with open(os.path.join(entry, '0.parquet'), 'wb') as f:
+            f.write(b'\x80\x04not a parquet file')
+    elif damage == 'other pandas':
+        with open(os.path.join(entry, 'table.json')) as f:
+            manifest = json.load(f)
+        manifest['key'][-1] = '0.1'
+        with open(os.path.join(entry, 'table.json'), 'w') as f:
+            json.dump(manifest, f)
+    else:
+        os.remove(os.path.join(entry, '0.parquet'))
+
+    pd.testing.assert_frame_equal(read_table(sheet, keep_default_na=False), expected)
+
+
+
+def test_no_pyarrow_reads_without_a_cache(sheet, cache_dir, monkeypatch, capsys):
+    monkeypatch.setattr(table_io, 'pa', None)
+    monkeypatch.setattr(table_io, 'cache_warned', False)
+    expected = pd.read_excel(sheet, keep_default_na=False)
+    for _ in range(2):
+        pd.testing.assert_frame_equal(read_table(sheet, keep_default_na=False), expected)
+
+    assert not entries(cache_dir)
+    assert capsys.readouterr().out.count("pyarrow isn't installed") == 1
+    with pytest.raises(ImportError):
+        open_sink(cache_dir + '.parquet', ['NAME'])
+
+
+def test_other_errors_are_not_hidden(sheet, monkeypatch):
+    monkeypatch.setattr(table_io, 'save_cached', lambda *args: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        read_table(sheet)
+
+
+@pytest.mark.parametrize('ext', ['.csv', '.parquet', '.xlsx'])
+def test_sinks(tmp_path, ext):
+    path = str(tmp_path / f'out{ext}')
+    with open_sink(path, SpotlightContact.columns) as out:
+        out.append(SpotlightContact('Amy', 'Bright', '07700900001', 'a@bright.com'))
+        out.append({'NAME': 'Ben', 'EMAIL': 'b@bright.com'})
+        out.append(['Cal', 'Bright', None, None, 'y'])
+
+    df = read_table(path, dtype=str) if ext != '.parquet' else read_table(path)
+    assert list(df.columns) == SpotlightContact.columns
+    assert list(df.NAME) == ['Amy', 'Ben', 'Cal']
+    assert df['CONTACT NUMBER'][0] == '07700900001'
+
+
+def test_sink_checks_record_columns(tmp_path):
+    with open_sink(str(tmp_path / 'out.csv'), ['NAME']) as out:
+        with pytest.raises(ValueError):
+            out.append(SpotlightContact('Amy'))
+
+
+def test_csv_append(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    for name in ['Amy', 'Ben']:
+        with open_sink(path, ['NAME'], append=True) as out:
+            out.append([name])
+    assert open(path).read() == 'NAME\nAmy\nBen\n'
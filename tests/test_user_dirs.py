@@ -0,0 +1,45 @@
+"""Tests for user_dirs' private folders and moving files left in the repository by earlier versions."""
+
+import os
+import pytest
+import user_dirs
+
+
+@pytest.fixture
+def dirs(monkeypatch, tmp_path):
+    monkeypatch.setattr(user_dirs, 'repo_dir', str(tmp_path / 'repo'))
+    monkeypatch.setattr(user_dirs, 'data_dir', str(tmp_path / 'data'))
+    monkeypatch.setattr(user_dirs, 'cache_dir', str(tmp_path / 'cache'))
+    os.mkdir(user_dirs.repo_dir)
+    return tmp_path
+
+
+def test_folder_is_private(dirs):
+    path = user_dirs.private_path(os.path.join(user_dirs.cache_dir, 'cookies.lwp'))
+    assert path == str(dirs / 'cache' / 'cookies.lwp') and not os.path.exists(path)
+    assert os.stat(user_dirs.cache_dir).st_mode & 0o777 == 0o700
+
+
+def test_file_left_in_the_repository_is_moved(dirs, capsys):
+    for suffix in ('', '-wal'):
+        (dirs / 'repo' / f'contacts.sqlite{suffix}').write_text(f'old{suffix}')
+
+    path = user_dirs.private_path(os.path.join(user_dirs.data_dir, 'contacts.sqlite'))
+    assert open(path).read() == 'old' and open(path + '-wal').read() == 'old-wal'
+    assert not os.listdir(user_dirs.repo_dir)
+    assert 'Moved' in capsys.readouterr().out
+
+
+def test_existing_file_is_kept(dirs):
+    (dirs / 'repo' / 'contacts.sqlite').write_text('old')
+    os.makedirs(user_dirs.data_dir)
+    (dirs / 'data' / 'contacts.sqlite').write_text('new')
+
+    path = user_dirs.private_path(os.path.join(user_dirs.data_dir, 'contacts.sqlite'))
+    assert open(path).read() == 'new' and os.path.exists(dirs / 'repo' / 'contacts.sqlite')
+
+
+def test_other_folders_are_left_alone(dirs):
+    (dirs / 'repo' / 'contacts.sqlite').write_text('old')
+    user_dirs.private_path(str(dirs / 'elsewhere' / 'contacts.sqlite'))
+    assert os.path.exists(dirs / 'repo' / 'contacts.sqlite') and not os.listdir(dirs / 'elsewhere')